@@ -24,6 +24,7 @@ from bhmm.hmm.discrete_hmm import SampledDiscreteHMM
 # estimators
 from bhmm.estimators.bayesian_sampling import BayesianHMMSampler as BHMM
 from bhmm.estimators.maximum_likelihood import MaximumLikelihoodEstimator as MLHMM
+from bhmm.estimators.online_maximum_likelihood import OnlineMaximumLikelihoodEstimator as OnlineMLHMM
 
 # output models
 from bhmm.output_models import OutputModel, GaussianOutputModel, DiscreteOutputModel
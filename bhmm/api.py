@@ -166,7 +166,8 @@ def discrete_hmm(P, pout, pi=None, stationary=True, reversible=True):
     return dhmm
 
 def estimate_hmm(observations, nstates, lag=1, initial_model=None, type=None,
-                 reversible=True, stationary=True, p=None, accuracy=1e-3, maxit=1000):
+                 reversible=True, stationary=True, p=None, accuracy=1e-3, maxit=1000, checkpointed=False,
+                 nthreads=1, nprocesses=1, streaming=False, accelerated=False, checkpoint=None, checkpoint_interval=10):
     r""" Estimate maximum-likelihood HMM
 
     Generic maximum-likelihood estimation of HMMs
@@ -201,6 +202,29 @@ def estimate_hmm(observations, nstates, lag=1, initial_model=None, type=None,
     maxit : int
         stopping criterion for EM iteration. When so many iterations are performed without reaching the requested
         accuracy, the iteration is stopped without convergence (a warning is given)
+    checkpointed : bool, optional, default=False
+        If True, memory of the forward-backward algorithm grows with sqrt(T) instead of T at the cost of an
+        additional forward pass per iteration. Use this for very long trajectories.
+    nthreads : int, optional, default=1
+        Number of threads. If larger than 1, the trajectories are distributed over a pool of threads. If a single
+        trajectory dominates the data, the forward-backward algorithm is parallelized over time instead, so that
+        also a single long trajectory can use all cores.
+    nprocesses : int, optional, default=1
+        Number of worker processes. If larger than 1, the trajectories are distributed over a pool of processes
+        that read the observations from shared memory (see
+        :meth:`MaximumLikelihoodEstimator.fit_parallel <bhmm.estimators.maximum_likelihood.MaximumLikelihoodEstimator.fit_parallel>`).
+    streaming : bool, optional, default=False
+        If True, the state probabilities of the trajectories are not stored, but reduced to the sufficient
+        statistics of the M-step straight away, so that memory does not grow with the number of trajectories.
+    accelerated : bool, optional, default=False
+        If True, the EM iteration is accelerated by extrapolating the parameter updates (SQUAREM). Extrapolations
+        that decrease the likelihood are discarded.
+    checkpoint : str, optional, default=None
+        Name of a checkpoint file to which the state of the estimation is written every checkpoint_interval
+        iterations. If the file exists, e.g. because the job has been interrupted, the estimation is continued from
+        it, so that at most checkpoint_interval iterations are lost.
+    checkpoint_interval : int, optional, default=10
+        Number of iterations between two checkpoints.
 
     Return
     ------
@@ -217,15 +241,257 @@ def estimate_hmm(observations, nstates, lag=1, initial_model=None, type=None,
     # construct estimator
     from bhmm.estimators.maximum_likelihood import MaximumLikelihoodEstimator as _MaximumLikelihoodEstimator
     est = _MaximumLikelihoodEstimator(observations, nstates, initial_model=initial_model, type=type,
-                                      reversible=reversible, stationary=stationary, p=p, accuracy=accuracy, maxit=maxit)
+                                      reversible=reversible, stationary=stationary, p=p, accuracy=accuracy, maxit=maxit,
+                                      checkpointed=checkpointed, nthreads=nthreads, streaming=streaming,
+                                      accelerated=accelerated)
     # run
-    est.fit()
+    if nprocesses > 1:
+        est.fit_parallel(nprocesses=nprocesses, checkpoint=checkpoint, checkpoint_interval=checkpoint_interval,
+                         resume=True)
+    else:
+        est.fit(checkpoint=checkpoint, checkpoint_interval=checkpoint_interval, resume=True)
     # set lag time
     est.hmm._lag = lag
     # return model
     return est.hmm
 
-def bayesian_hmm(observations, estimated_hmm, nsample=100, transition_matrix_prior=None, store_hidden=False):
+def estimate_hmm_multistart(observations, nstates, nstarts=10, initial_models=None, lag=1, type=None,
+                            reversible=True, accuracy=1e-3, maxit=1000, prune_after=5, prune_margin=0.01, nthreads=1,
+                            seed=None):
+    r""" Estimate maximum-likelihood HMM from several initial models
+
+    The Baum-Welch algorithm only finds a local optimum of the likelihood. This function runs it from several
+    initial models concurrently, stops starts that trail the best one, and returns the best model.
+
+    Parameters
+    ----------
+    observations : list of numpy arrays representing temporal data
+        `observations[i]` is a 1d numpy array corresponding to the observed trajectory index `i`
+    nstates : int
+        The number of states in the model.
+    nstarts : int, optional, default=10
+        Number of initial models. Only used if initial_models is None.
+    initial_models : list of HMM, optional, default=None
+        Initial models. If None, the first initial model is generated by the heuristic scheme of
+        :func:`init_hmm`, and the others are random models.
+    lag : int
+        the lag time at which observations should be read
+    type : str, optional, default=None
+        Output model type from [None, 'gaussian', 'discrete']. If None, will automatically select an output
+        model type based on the format of observations.
+    reversible : bool, optional, default=True
+        If True, a prior that enforces reversible transition matrices (detailed balance) is used;
+        otherwise, a standard  non-reversible prior is used.
+    accuracy : float
+        convergence threshold for EM iteration. When two the likelihood does not increase by more than accuracy, the
+        iteration is stopped successfully.
+    maxit : int
+        stopping criterion for EM iteration.
+    prune_after : int, optional, default=5
+        Number of iterations after which starts that trail the best start are stopped
+    prune_margin : float or None, optional, default=0.01
+        Log-likelihood margin per observation by which a start may trail the best start. If None, all starts are
+        iterated until convergence.
+    nthreads : int, optional, default=1
+        Number of threads that iterate the starts in parallel
+    seed : int, optional, default=None
+        seed for generating the random initial models
+
+    Return
+    ------
+    hmm : :class:`HMM <bhmm.hmm.generic_hmm.HMM>`
+        the model with the highest likelihood
+    records : list of dict
+        convergence record of each start, see
+        :attr:`MaximumLikelihoodEstimator.start_records <bhmm.estimators.maximum_likelihood.MaximumLikelihoodEstimator.start_records>`
+
+    """
+    # select output model type
+    if (type is None):
+        type = _guess_model_type(observations)
+
+    if lag > 1:
+        observations = _lag_observations(observations, lag)
+
+    # initial models
+    if initial_models is None:
+        if type == 'discrete':
+            from bhmm.init.discrete import random_model_discrete as random_model
+        elif type == 'gaussian':
+            from bhmm.init.gaussian import random_model_gaussian1d as random_model
+        else:
+            raise NotImplementedError('output model type '+str(type)+' not yet implemented.')
+        random_state = _np.random.RandomState(seed)
+        initial_models = [init_hmm(observations, nstates, type=type)]
+        for i in range(1, nstarts):
+            initial_models.append(random_model(observations, nstates, reversible=reversible,
+                                               seed=random_state.randint(2**31)))
+
+    # construct estimator
+    from bhmm.estimators.maximum_likelihood import MaximumLikelihoodEstimator as _MaximumLikelihoodEstimator
+    est = _MaximumLikelihoodEstimator(observations, nstates, initial_model=initial_models[0], type=type,
+                                      reversible=reversible, accuracy=accuracy, maxit=maxit, nthreads=nthreads)
+    # run
+    hmm = est.fit_multistart(initial_models, prune_after=prune_after, prune_margin=prune_margin)
+    # set lag time
+    hmm._lag = lag
+    return hmm, est.start_records
+
+def estimate_hmm_lags(observations, nstates, lags, initial_model=None, type=None, reversible=True, accuracy=1e-3,
+                     maxit=1000, nthreads=1):
+    r""" Estimate maximum-likelihood HMMs at several lag times, e.g. for implied timescale plots
+
+    The lagged trajectories are strided views into the given observation arrays, and the estimators neither copy
+    nor concatenate them, nor store state probabilities (streaming mode). The first lag time is initialized by
+    initial_model or the heuristic scheme, every further lag time is warm-started from the model of the previous
+    lag time with its transition matrix propagated to the new lag time, i.e. raised to the power
+    round(lag / previous lag).
+
+    Parameters
+    ----------
+    observations : list of numpy arrays representing temporal data
+        `observations[i]` is a 1d numpy array corresponding to the observed trajectory index `i`
+    nstates : int
+        The number of states in the model.
+    lags : list of int
+        The lag times, processed in the given order. Increasing lag times give the best warm starts.
+    initial_model : HMM, optional, default=None
+        If specified, the given initial model will be used to initialize the estimation at the first lag time.
+    type : str, optional, default=None
+        Output model type from [None, 'gaussian', 'discrete']. If None, will automatically select an output
+        model type based on the format of observations.
+    reversible : bool, optional, default=True
+        If True, a prior that enforces reversible transition matrices (detailed balance) is used;
+        otherwise, a standard  non-reversible prior is used.
+    accuracy : float
+        convergence threshold for EM iteration.
+    maxit : int
+        stopping criterion for EM iteration.
+    nthreads : int, optional, default=1
+        Number of threads of the forward-backward algorithm
+
+    Return
+    ------
+    hmms : list of :class:`HMM <bhmm.hmm.generic_hmm.HMM>`
+        the estimated model at each lag time
+
+    """
+    from bhmm.hmm.generic_hmm import HMM as _HMM
+    from bhmm.estimators.maximum_likelihood import MaximumLikelihoodEstimator as _MaximumLikelihoodEstimator
+    import copy as _copy
+    observations = [_np.asarray(obs) for obs in observations]
+    if (type is None):
+        type = _guess_model_type(observations)
+
+    hmms = []
+    previous_lag = None
+    for lag in lags:
+        if previous_lag is not None:
+            # warm start from the previous model with propagated transition matrix
+            previous = hmms[-1]
+            power = max(1, int(round(float(lag) / previous_lag)))
+            T = _np.linalg.matrix_power(previous.transition_matrix, power)
+            initial_model = _HMM(T, _copy.deepcopy(previous.output_model), reversible=previous.is_reversible)
+        est = _MaximumLikelihoodEstimator(_lag_observations(observations, lag), nstates, initial_model=initial_model,
+                                          type=type, reversible=reversible, accuracy=accuracy, maxit=maxit,
+                                          nthreads=nthreads, streaming=True, copy_observations=False)
+        hmm = est.fit()
+        hmm._lag = lag
+        hmms.append(hmm)
+        previous_lag = lag
+    return hmms
+
+def _number_of_parameters(hmm):
+    """ Number of free parameters of a stationary HMM, as used for information criteria """
+    n = hmm.nstates
+    if hmm.is_reversible:
+        # symmetric flux matrix with unit sum
+        nparameters = n * (n + 1) // 2 - 1
+    else:
+        nparameters = n * (n - 1)
+    if not hmm.is_stationary:
+        nparameters += n - 1
+    if hmm.output_model.model_type == 'gaussian':
+        nparameters += 2 * n
+    elif hmm.output_model.model_type == 'discrete':
+        nparameters += n * (hmm.output_model.nsymbols - 1)
+    return nparameters
+
+def estimate_hmm_sweep(observations, nstates_list, lag=1, type=None, reversible=True, accuracy=1e-3, maxit=1000,
+                       nthreads=1):
+    r""" Estimate maximum-likelihood HMMs for a range of numbers of hidden states
+
+    The observations are parsed and lagged only once. All estimators run in streaming mode on these arrays, so
+    they neither copy nor concatenate the whole data set, nor store state probabilities, and the memory of each
+    model in flight is bounded by its streaming chunks. The models are estimated in parallel threads. For each
+    model, the log-likelihood and the information criteria AIC = 2 k - 2 log L and BIC = k log(n) - 2 log L are
+    computed, where k is the number of free parameters and n is the number of observations. Smaller values
+    indicate a better trade-off between fit and complexity.
+
+    Parameters
+    ----------
+    observations : list of numpy arrays representing temporal data
+        `observations[i]` is a 1d numpy array corresponding to the observed trajectory index `i`
+    nstates_list : list of int
+        The numbers of hidden states to be estimated
+    lag : int
+        the lag time at which observations should be read
+    type : str, optional, default=None
+        Output model type from [None, 'gaussian', 'discrete']. If None, will automatically select an output
+        model type based on the format of observations.
+    reversible : bool, optional, default=True
+        If True, a prior that enforces reversible transition matrices (detailed balance) is used;
+        otherwise, a standard  non-reversible prior is used.
+    accuracy : float
+        convergence threshold for EM iteration.
+    maxit : int
+        stopping criterion for EM iteration.
+    nthreads : int, optional, default=1
+        Number of models that are estimated in parallel
+
+    Return
+    ------
+    results : list of dict
+        one dict for each element of nstates_list with the entries 'nstates', 'hmm', 'loglikelihood',
+        'nparameters', 'aic', 'bic' and 'time' (wall time of the estimation in seconds)
+
+    """
+    import time as _time
+    # parse observations once
+    observations = [_np.asarray(obs) for obs in observations]
+    if (type is None):
+        type = _guess_model_type(observations)
+    if lag > 1:
+        observations = _lag_observations(observations, lag)
+    nobs = sum([len(obs) for obs in observations])
+
+    from bhmm.estimators.maximum_likelihood import MaximumLikelihoodEstimator as _MaximumLikelihoodEstimator
+
+    def estimate(nstates):
+        initial_time = _time.time()
+        est = _MaximumLikelihoodEstimator(observations, nstates, type=type, reversible=reversible,
+                                          accuracy=accuracy, maxit=maxit, streaming=True, copy_observations=False)
+        hmm = est.fit()
+        hmm._lag = lag
+        nparameters = _number_of_parameters(hmm)
+        return {'nstates': nstates, 'hmm': hmm, 'loglikelihood': hmm.likelihood, 'nparameters': nparameters,
+                'aic': 2.0 * nparameters - 2.0 * hmm.likelihood,
+                'bic': nparameters * _np.log(nobs) - 2.0 * hmm.likelihood,
+                'time': _time.time() - initial_time}
+
+    if nthreads > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(nthreads)
+        try:
+            return pool.map(estimate, nstates_list)
+        finally:
+            pool.close()
+            pool.join()
+    return [estimate(nstates) for nstates in nstates_list]
+
+def bayesian_hmm(observations, estimated_hmm, nsample=100, transition_matrix_prior=None, store_hidden=False,
+                 seed=None, nthreads=1, checkpoint=None, checkpoint_interval=10, reversible=None, nchains=1,
+                 nburn=0, nprocesses=None, sample_file=None):
     r""" Bayesian HMM based on sampling the posterior
 
     Generic maximum-likelihood estimation of HMMs
@@ -248,20 +514,70 @@ def bayesian_hmm(observations, estimated_hmm, nsample=100, transition_matrix_pri
             the row of the initial transition matrix.
     store_hidden : bool, optional, default=False
         store hidden trajectories in sampled HMMs
+    seed : int, optional, default=None
+        seed of the random number streams for sampling hidden state trajectories. If None, it is drawn from
+        numpy.random.
+    nthreads : int, optional, default=1
+        number of threads that sample hidden state trajectories in parallel
+    checkpoint : str, optional, default=None
+        Name of a checkpoint file to which the state of the sampler, including the samples collected so far, is
+        written every checkpoint_interval Gibbs sampling steps. If the file exists, e.g. because the job has been
+        interrupted, sampling is continued from it, so that at most checkpoint_interval steps are lost.
+    checkpoint_interval : int, optional, default=10
+        Number of Gibbs sampling steps between two checkpoints.
+    reversible : bool, optional, default=None
+        If True, reversible transition matrices are sampled. If False, non-reversible transition matrices are
+        sampled with row-wise Dirichlet draws, which is much cheaper, also if estimated_hmm is reversible. If None,
+        the transition matrices are sampled reversibly if estimated_hmm is reversible.
+    nchains : int, optional, default=1
+        Number of independent chains. If larger than 1, the chains are run in parallel worker processes from
+        dispersed starting points (see :meth:`BayesianHMMSampler.sample_chains
+        <bhmm.estimators.bayesian_sampling.BayesianHMMSampler.sample_chains>`), each generating nsample samples.
+        Check the potential_scale_reduction (R-hat) and effective_sample_size of the result to see whether the
+        chains have converged and enough samples have been generated. Cannot be combined with checkpoint.
+    nburn : int, optional, default=0
+        number of Gibbs sampling steps of each chain that are discarded before samples are collected
+    nprocesses : int, optional, default=None
+        Number of worker processes for nchains > 1. If None, one process per CPU is used.
+    sample_file : str, optional, default=None
+        Name of a file to which the samples, including the hidden trajectories if store_hidden is True, are written
+        as they are generated instead of keeping them in memory. The returned SampledHMM memory-maps the file, and
+        can be recreated later with `SampledHMM(estimated_hmm, sample_file)`. Cannot be combined with nchains > 1.
 
     Return
     ------
     hmm : :class:`SampledHMM <bhmm.hmm.generic_sampled_hmm.SampledHMM>`
 
     """
-    # construct estimator
     from bhmm.estimators.bayesian_sampling import BayesianHMMSampler as _BHMM
-    sampler = _BHMM(observations, estimated_hmm.nstates, initial_model=estimated_hmm,
-                    reversible=estimated_hmm.is_reversible, transition_matrix_sampling_steps=1000,
-                    transition_matrix_prior=transition_matrix_prior, type=estimated_hmm.output_model.model_type)
-
-    # Sample models.
-    sampled_hmms = sampler.sample(nsamples=nsample, save_hidden_state_trajectory=store_hidden)
+    import os
+    if reversible is None:
+        reversible = estimated_hmm.is_reversible
+    if nchains > 1 and checkpoint is not None:
+        raise ValueError('Checkpoints are not supported for several chains.')
+    if nchains > 1 and sample_file is not None:
+        raise ValueError('Sample files are not supported for several chains.')
+    if checkpoint is not None and os.path.exists(checkpoint):
+        # continue interrupted sampling
+        sampled_hmms = _BHMM.resume(observations, checkpoint, nthreads=nthreads,
+                                    checkpoint_interval=checkpoint_interval)
+    else:
+        # construct estimator
+        sampler = _BHMM(observations, estimated_hmm.nstates, initial_model=estimated_hmm,
+                        reversible=reversible, transition_matrix_sampling_steps=10,
+                        transition_matrix_prior=transition_matrix_prior, type=estimated_hmm.output_model.model_type,
+                        seed=seed, nthreads=nthreads)
+
+        # Sample models.
+        if nchains > 1:
+            chains = sampler.sample_chains(nchains, nsample, nburn=nburn, save_hidden_state_trajectory=store_hidden,
+                                           nprocesses=nprocesses)
+            from bhmm.hmm.sample_store import HMMSampleStore
+            sampled_hmms = HMMSampleStore.concatenate(chains)
+        else:
+            sampled_hmms = sampler.sample(nsamples=nsample, nburn=nburn, save_hidden_state_trajectory=store_hidden,
+                                          checkpoint=checkpoint, checkpoint_interval=checkpoint_interval,
+                                          sample_file=sample_file)
     # return model
     from bhmm.hmm.generic_sampled_hmm import SampledHMM
-    return SampledHMM(estimated_hmm, sampled_hmms)
+    return SampledHMM(estimated_hmm, sampled_hmms, nchains=nchains)
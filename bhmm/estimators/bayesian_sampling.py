@@ -11,6 +11,8 @@ import bhmm.hidden as hidden
 from bhmm.msm.tmatrix_disconnected import sample_P
 from bhmm.util.logger import logger
 from bhmm.util import config
+from bhmm.util.checkpoint import save_checkpoint, load_checkpoint
+from bhmm.hmm.sample_store import HMMSampleStore, HMMSampleFile
 
 #from bhmm.msm.transition_matrix_sampling_rev import TransitionMatrixSamplerRev
 
@@ -46,8 +48,8 @@ class BayesianHMMSampler(object):
 
     """
     def __init__(self, observations, nstates, initial_model=None,
-                 reversible=True, transition_matrix_sampling_steps=1000, transition_matrix_prior=None,
-                 type='gaussian'):
+                 reversible=True, transition_matrix_sampling_steps=10, transition_matrix_prior=None,
+                 type='gaussian', seed=None, nthreads=1):
         """Initialize a Bayesian hidden Markov model sampler.
 
         Parameters
@@ -61,9 +63,12 @@ class BayesianHMMSampler(object):
             Otherwise, a heuristic scheme is used to generate an initial guess.
         reversible : bool, optional, default=True
             If True, a prior that enforces reversible transition matrices (detailed balance) is used;
-            otherwise, a standard  non-reversible prior is used.
-        transition_matrix_sampling_steps : int, optional, default=1000
-            number of transition matrix sampling steps per BHMM cycle
+            otherwise, a standard  non-reversible prior is used, and the rows of the transition matrix are drawn
+            from Dirichlet distributions. A reversible initial model can be used for non-reversible sampling.
+        transition_matrix_sampling_steps : int, optional, default=10
+            number of reversible transition matrix sampling steps per BHMM cycle. The transition matrix sampler
+            continues from its state in the previous cycle, so that a few steps suffice to follow the change of the
+            counts. Not used for non-reversible sampling, which is exact.
         transition_matrix_prior : str or ndarray(n,n)
             prior count matrix to be used for transition matrix sampling, or a keyword specifying the prior mode
             |  None (default),  -1 prior is used that ensures consistency between mean and MLE. Can lead to sampling
@@ -74,6 +79,12 @@ class BayesianHMMSampler(object):
                 the row of the initial transition matrix.
         output_model_type : str, optional, default='gaussian'
             Output model type.  ['gaussian', 'discrete']
+        seed : int, optional, default=None
+            seed of the random number streams used to sample hidden state trajectories and, with the compiled
+            backend, transition matrices. Each trajectory has its own stream, so the sampled trajectories do not
+            depend on nthreads. If None, the seed is drawn from numpy.random.
+        nthreads : int, optional, default=1
+            number of threads that sample hidden state trajectories in parallel. Each thread has its own workspace.
 
         """
         # Sanity checks.
@@ -99,6 +110,15 @@ class BayesianHMMSampler(object):
         else:
             # Generate our own initial model.
             self.model = self._generateInitialModel(type)
+        if self.model.is_reversible and not reversible:
+            # a reversible model is a valid starting point of non-reversible sampling
+            from bhmm.hmm.generic_hmm import HMM
+            self.model = HMM(self.model.transition_matrix, self.model.output_model, lag=self.model.lag,
+                             Pi=self.model.initial_distribution, stationary=self.model.is_stationary, reversible=False)
+        elif reversible and not self.model.is_reversible:
+            logger().warn('Requested reversible='+str(reversible)+' but initial model is reversible='+
+                          str(self.model.is_reversible)+'. Using reversible='+str(self.model.is_reversible))
+            self.reversible = False
 
         # prior counts
         if transition_matrix_prior is None:
@@ -118,16 +138,51 @@ class BayesianHMMSampler(object):
         self.transition_matrix_sampling_steps = transition_matrix_sampling_steps
 
         # implementation options
-        hidden.set_implementation(config.kernel)
+        hidden.set_implementation(config.kernel, logspace=config.logspace)
         self.model.output_model.set_implementation(config.kernel)
 
-        # pre-construct hidden variables
-        self.alpha = np.zeros((self.maxT,self.nstates), config.dtype, order='C')
-        self.pobs = np.zeros((self.maxT,self.nstates), config.dtype, order='C')
+        # pre-construct hidden variables, one workspace per thread
+        self.nthreads = nthreads
+        self._workspaces = [(np.zeros((self.maxT,self.nstates), config.dtype, order='C'),
+                             np.zeros((self.maxT,self.nstates), config.dtype, order='C'))
+                            for i in range(max(1, nthreads))]
+        self.alpha, self.pobs = self._workspaces[0]
+
+        # one random number stream per trajectory and one for the transition matrix sampler
+        if seed is None:
+            seed = np.random.randint(2**31)
+        self._seed = seed
+        self._create_rng_states(chain=0)
+
+        # state of the transition matrix sampler, which is continued in every cycle: the flux matrix, starting
+        # from the initial model
+        self._X = np.zeros((self.nstates, self.nstates))
+        if self.reversible:
+            self._X[:, :] = self._flux_matrix(self.model.transition_matrix)
+        logger().info("Transition matrix sampling backend: "+self.transition_matrix_sampling_backend)
 
         return
 
-    def sample(self, nsamples, nburn=0, nthin=1, save_hidden_state_trajectory=False):
+    @staticmethod
+    def _flux_matrix(T):
+        """ Flux matrix pi_i T_ij of a transition matrix. pi is computed from T, as the model may be non-stationary. """
+        from pyemma.msm import analysis as msmana
+        return msmana.stationary_distribution(T)[:, None] * T
+
+    def _create_rng_states(self, chain=0):
+        """ Creates the random number streams of a chain. Each chain uses nobs+1 streams of the seed. """
+        first = chain * (self.nobs + 1)
+        self._rng_states = [hidden.create_rng_state(self._seed, stream=first+i) for i in range(self.nobs)]
+        self._tmatrix_rng_state = hidden.create_rng_state(self._seed, stream=first+self.nobs)
+
+    @property
+    def transition_matrix_sampling_backend(self):
+        r""" Implementation of the transition matrix sampler, 'c' (compiled) or 'python' """
+        from bhmm.msm.transition_matrix_sampling_rev import backend
+        return backend()
+
+    def sample(self, nsamples, nburn=0, nthin=1, save_hidden_state_trajectory=False, checkpoint=None,
+               checkpoint_interval=10, sample_file=None):
         """Sample from the BHMM posterior.
 
         Parameters
@@ -140,11 +195,25 @@ class BayesianHMMSampler(object):
             The number of Gibbs sampling updates used to generate each returned sample.
         save_hidden_state_trajectory : bool, optional, default=False
             If True, the hidden state trajectory for each sample will be saved as well.
+        checkpoint : str, optional, default=None
+            Name of a checkpoint file. If given, the state of the sampler (current model, samples collected so far
+            and the states of all random number streams) is written to this file before the first Gibbs sampling
+            update, every checkpoint_interval updates and at the end. An interrupted run can be continued with
+            :meth:`resume`.
+        checkpoint_interval : int, optional, default=10
+            Number of Gibbs sampling updates between two checkpoints. As all samples collected so far are written
+            to every checkpoint, very small intervals slow down long runs.
+        sample_file : str, optional, default=None
+            Name of a file to which each sample is appended as soon as it is generated, instead of keeping the
+            samples in memory. Use this for long runs, in particular with save_hidden_state_trajectory=True. An
+            existing file is replaced. The returned samples are memory-mapped from the file, see
+            :class:`HMMSampleFile <bhmm.hmm.sample_store.HMMSampleFile>`. With a checkpoint, only the name of the
+            sample file is written to the checkpoint.
 
         Returns
         -------
-        models : list of bhmm.HMM
-            The sampled HMM models from the Bayesian posterior.
+        models : :class:`HMMSampleStore <bhmm.hmm.sample_store.HMMSampleStore>`
+            The sampled HMM models from the Bayesian posterior. Indexing or iterating gives bhmm.HMM objects.
 
         Examples
         --------
@@ -157,29 +226,177 @@ class BayesianHMMSampler(object):
         >>> samples = sampled_model.sample(nsamples, nburn=nburn, nthin=nthin)
 
         """
+        if sample_file is not None:
+            models = HMMSampleFile.create(sample_file, self.model,
+                                          save_hidden_state_trajectories=save_hidden_state_trajectory,
+                                          observation_lengths=self.Ts)
+        else:
+            models = HMMSampleStore(self.model, nsamples,
+                                    save_hidden_state_trajectories=save_hidden_state_trajectory)
+        if checkpoint is not None:
+            self._save_checkpoint(checkpoint, nsamples, nburn, nthin, save_hidden_state_trajectory, 0, models)
+        return self._sample(nsamples, nburn, nthin, save_hidden_state_trajectory, 0, models, checkpoint,
+                            checkpoint_interval)
 
-        # Run burn-in.
-        for iteration in range(nburn):
-            logger().info("Burn-in   %8d / %8d" % (iteration, nburn))
-            self._update()
+    @classmethod
+    def resume(cls, observations, checkpoint, nthreads=1, checkpoint_interval=10):
+        """Continues sampling from a checkpoint file written by :meth:`sample`.
+
+        The sampler is restored from the checkpoint without estimating an initial model, and the remaining Gibbs
+        sampling updates are done with the random number streams of the interrupted run, so that the result is
+        the same as that of an uninterrupted run. Note that this resets the state of numpy.random.
+
+        Parameters
+        ----------
+        observations : list of numpy arrays representing temporal data
+            The observations of the interrupted run.
+        checkpoint : str
+            Name of the checkpoint file. Further checkpoints are written to the same file.
+        nthreads : int, optional, default=1
+            number of threads that sample hidden state trajectories in parallel.
+        checkpoint_interval : int, optional, default=10
+            Number of Gibbs sampling updates between two checkpoints.
+
+        Returns
+        -------
+        models : :class:`HMMSampleStore <bhmm.hmm.sample_store.HMMSampleStore>`
+            All sampled HMM models, including those collected before the interruption.
+
+        """
+        state = load_checkpoint(checkpoint, 'bhmm')
+        if state['observation_lengths'] != [len(o) for o in observations]:
+            raise ValueError('Checkpoint '+str(checkpoint)+' was written by a sampler with different observations.')
+        sampler = cls(observations, state['nstates'], initial_model=state['model'], reversible=state['reversible'],
+                      transition_matrix_sampling_steps=state['transition_matrix_sampling_steps'],
+                      transition_matrix_prior=state['prior'], seed=0, nthreads=nthreads)
+        sampler._rng_states = state['rng_states']
+        sampler._X = state['X']
+        sampler._tmatrix_rng_state = state['tmatrix_rng_state']
+        np.random.set_state(state['numpy_rng_state'])
+        logger().info("Resuming BHMM sampling from checkpoint "+str(checkpoint)+" after "+str(state['nupdates'])+
+                      " updates")
+        return sampler._sample(state['nsamples'], state['nburn'], state['nthin'],
+                               state['save_hidden_state_trajectory'], state['nupdates'], state['models'],
+                               checkpoint, checkpoint_interval)
+
+    def sample_chains(self, nchains, nsamples, nburn=0, nthin=1, save_hidden_state_trajectory=False,
+                      nprocesses=None, dispersion=10.0):
+        """Samples from the BHMM posterior with several independent chains.
+
+        Each chain starts from a dispersed starting point and has its own random number streams, including its own
+        numpy.random state, derived from the seed of the sampler and the chain index, so that the result does not
+        depend on the number of processes. The first chain starts from the initial model. The other chains start
+        from the initial model with a transition matrix that is drawn from a broad distribution around the initial
+        transition matrix, namely the posterior of `dispersion` pseudo-counts per state. The output model is not
+        dispersed, so that the chains use the same labeling of the hidden states. Use nburn to let the chains
+        forget their starting points, and assess convergence with the R-hat and effective sample size diagnostics
+        of :class:`SampledHMM <bhmm.hmm.generic_sampled_hmm.SampledHMM>`.
+
+        Parameters
+        ----------
+        nchains : int
+            The number of chains.
+        nsamples : int
+            The number of samples to generate in each chain.
+        nburn : int, optional, default=0
+            The number of samples to discard to burn-in in each chain.
+        nthin : int, optional, default=1
+            The number of Gibbs sampling updates used to generate each returned sample.
+        save_hidden_state_trajectory : bool, optional, default=False
+            If True, the hidden state trajectory for each sample will be saved as well.
+        nprocesses : int, optional, default=None
+            Number of worker processes that run the chains. If None, one process per CPU is used, but not more
+            than nchains. With a single process, the chains are run one after another in this process.
+        dispersion : float, optional, default=10.0
+            Pseudo-counts per state of the distribution from which the starting transition matrices are drawn.
+            Smaller values give more dispersed starting points.
+
+        Returns
+        -------
+        chains : list of :class:`HMMSampleStore <bhmm.hmm.sample_store.HMMSampleStore>`
+            The sampled HMM models of each chain.
+
+        """
+        from multiprocessing import Pool, cpu_count
+        if nprocesses is None:
+            nprocesses = cpu_count()
+        nprocesses = max(1, min(nprocesses, nchains))
+        tasks = [(chain, nsamples, nburn, nthin, save_hidden_state_trajectory, dispersion) for chain in range(nchains)]
+        if nprocesses > 1:
+            # forked workers inherit the sampler including the observations without pickling
+            pool = Pool(nprocesses, initializer=_init_chain_process, initargs=(self,))
+            try:
+                chains = pool.map(_sample_chain_process, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            chains = [self._sample_chain(*task) for task in tasks]
+        return chains
 
-        # Collect data.
-        models = list()
-        for iteration in range(nsamples):
-            logger().info("Iteration %8d / %8d" % (iteration, nsamples))
-            # Run a number of Gibbs sampling updates to generate each sample.
-            for thin in range(nthin):
-                self._update()
-            # Save a copy of the current model.
-            model_copy = copy.deepcopy(self.model)
-            #print "Sampled: \n",repr(model_copy)
-            if not save_hidden_state_trajectory:
-                model_copy.hidden_state_trajectory = None
-            models.append(model_copy)
-
-        # Return the list of models saved.
+    def _sample_chain(self, chain, nsamples, nburn, nthin, save_hidden_state_trajectory, dispersion):
+        """Runs one chain of :meth:`sample_chains` and restores the state of the sampler afterwards
+
+        """
+        state = (self.model, self._X, self._rng_states, self._tmatrix_rng_state, np.random.get_state())
+        try:
+            self.model = copy.deepcopy(self.model)
+            self._X = self._X.copy()
+            self._create_rng_states(chain=chain)
+            np.random.seed([self._seed, chain])
+            if chain > 0:
+                # dispersed starting point
+                T = self.model.transition_matrix
+                T = sample_P(dispersion * T, 100, reversible=self.reversible, rng_state=self._tmatrix_rng_state)
+                self.model.update(T)
+                if self.reversible:
+                    self._X[:, :] = self._flux_matrix(T)
+            logger().info("Chain %d" % chain)
+            models = HMMSampleStore(self.model, nsamples, save_hidden_state_trajectories=save_hidden_state_trajectory)
+            return self._sample(nsamples, nburn, nthin, save_hidden_state_trajectory, 0, models, None, None)
+        finally:
+            self.model, self._X, self._rng_states, self._tmatrix_rng_state = state[:4]
+            np.random.set_state(state[4])
+
+    def _sample(self, nsamples, nburn, nthin, save_hidden_state_trajectory, nupdates, models, checkpoint,
+                checkpoint_interval):
+        """Runs the Gibbs sampling updates of :meth:`sample`, starting after `nupdates` updates
+
+        """
+        ntotal = nburn + nsamples * nthin
+        while nupdates < ntotal:
+            if nupdates < nburn:
+                logger().info("Burn-in   %8d / %8d" % (nupdates, nburn))
+            elif (nupdates - nburn) % nthin == 0:
+                logger().info("Iteration %8d / %8d" % (len(models), nsamples))
+            self._update()
+            nupdates += 1
+            # Store the parameters of the current model after every nthin updates following the burn-in.
+            if nupdates > nburn and (nupdates - nburn) % nthin == 0:
+                models.append(self.model)
+            if checkpoint is not None and (nupdates % checkpoint_interval == 0 or nupdates == ntotal):
+                self._save_checkpoint(checkpoint, nsamples, nburn, nthin, save_hidden_state_trajectory, nupdates,
+                                      models)
+
+        # Return the models saved.
         return models
 
+    def _save_checkpoint(self, checkpoint, nsamples, nburn, nthin, save_hidden_state_trajectory, nupdates, models):
+        """Writes the state of the sampler after `nupdates` Gibbs sampling updates to a checkpoint file
+
+        """
+        # the hidden state trajectories are sampled anew in the next update
+        model = copy.copy(self.model)
+        model.hidden_state_trajectories = None
+        save_checkpoint(checkpoint, {'kind': 'bhmm', 'nstates': self.nstates, 'observation_lengths': list(self.Ts),
+                                     'reversible': self.reversible, 'prior': self.prior,
+                                     'transition_matrix_sampling_steps': self.transition_matrix_sampling_steps,
+                                     'model': model, 'nsamples': nsamples, 'nburn': nburn, 'nthin': nthin,
+                                     'save_hidden_state_trajectory': save_hidden_state_trajectory,
+                                     'nupdates': nupdates, 'models': models, 'rng_states': self._rng_states,
+                                     'X': self._X, 'tmatrix_rng_state': self._tmatrix_rng_state,
+                                     'numpy_rng_state': np.random.get_state()})
+
     def _update(self):
         """Update the current model using one round of Gibbs sampling.
 
@@ -198,13 +415,50 @@ class BayesianHMMSampler(object):
         """Sample a new set of state trajectories from the conditional distribution P(S | T, E, O)
 
         """
-        self.model.hidden_state_trajectories = list()
-        for trajectory_index in range(self.nobs):
-            hidden_state_trajectory = self._sampleHiddenStateTrajectory(self.observations[trajectory_index])
-            self.model.hidden_state_trajectories.append(hidden_state_trajectory)
+        trajectories = [None] * self.nobs
+
+        def sample_trajectories(worker):
+            # each worker uses its own workspace for every nthreads'th trajectory
+            for i in range(worker, self.nobs, len(self._workspaces)):
+                trajectories[i] = self._sampleHiddenStateTrajectory(self.observations[i], rng_state=self._rng_states[i],
+                                                                    workspace=self._workspaces[worker])
+
+        if len(self._workspaces) > 1 and self.nobs > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(len(self._workspaces))
+            try:
+                pool.map(sample_trajectories, range(len(self._workspaces)))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            sample_trajectories(0)
+        self.model.hidden_state_trajectories = trajectories
         return
 
-    def _sampleHiddenStateTrajectory(self, obs, dtype=np.int32):
+    def sample_hidden_state_trajectories(self, nsamples):
+        """Draws several hidden state trajectories from the conditional distribution P(S | T, E, O) of the current model
+
+        The forward variables of each observed trajectory are computed once, and all paths are drawn from them with
+        :func:`bhmm.hidden.sample_paths`. Averages over the paths give Rao-Blackwellized estimates of path
+        statistics for the current model, and the paths can be used for posterior-predictive checks. The current
+        model is not changed, but the random number streams of the sampler are advanced.
+
+        Parameters
+        ----------
+        nsamples : int
+            The number of hidden state trajectories to draw for each observed trajectory.
+
+        Returns
+        -------
+        S : list of numpy.array with dimensions (nsamples, T_i)
+            S[i][k] is the k'th hidden state trajectory of the observed trajectory i.
+
+        """
+        return [self._sampleHiddenStateTrajectory(obs, rng_state=rng_state, nsamples=nsamples)
+                for (obs, rng_state) in zip(self.observations, self._rng_states)]
+
+    def _sampleHiddenStateTrajectory(self, obs, dtype=np.int32, rng_state=None, workspace=None, nsamples=None):
         """Sample a hidden state trajectory from the conditional distribution P(s | T, E, o)
 
         Parameters
@@ -213,11 +467,18 @@ class BayesianHMMSampler(object):
             observation[n] is the nth observation
         dtype : numpy.dtype, optional, default=numpy.int32
             The dtype to to use for returned state trajectory.
+        rng_state : ndarray((4), dtype=numpy.uint64), optional, default=None
+            random number stream, see :func:`bhmm.hidden.create_rng_state`. If None, one is seeded from numpy.random.
+        workspace : tuple of two ndarray((maxT,nstates)), optional, default=None
+            arrays for the forward variables and output probabilities. If None, the first workspace is used.
+        nsamples : int, optional, default=None
+            If given, this number of trajectories is drawn from the same forward variables.
 
         Returns
         -------
         s_t : numpy.array with dimensions (T,) of type `dtype`
-            Hidden state trajectory, with s_t[t] the hidden state corresponding to observation o_t[t]
+            Hidden state trajectory, with s_t[t] the hidden state corresponding to observation o_t[t]. If nsamples
+            is given, an array with dimensions (nsamples, T) of trajectories.
 
         Examples
         --------
@@ -235,12 +496,21 @@ class BayesianHMMSampler(object):
         A = self.model.transition_matrix
         pi = self.model.initial_distribution
 
+        if workspace is None:
+            workspace = self._workspaces[0]
+        alpha, pobs = workspace
+
         # compute output probability matrix
-        self.model.output_model.p_obs(obs, out=self.pobs)
+        if config.logspace:
+            self.model.output_model.log_p_obs(obs, out=pobs)
+        else:
+            self.model.output_model.p_obs(obs, out=pobs)
         # forward variables
-        logprob = hidden.forward(A, self.pobs, pi, T = T, alpha_out=self.alpha)[0]
+        logprob = hidden.forward(A, pobs, pi, T = T, alpha_out=alpha)[0]
         # sample path
-        S = hidden.sample_path(self.alpha, A, self.pobs, T = T)
+        if nsamples is not None:
+            return hidden.sample_paths(alpha, A, pobs, nsamples, T = T, rng_state = rng_state)
+        S = hidden.sample_path(alpha, A, pobs, T = T, rng_state = rng_state)
 
         return S
 
@@ -248,8 +518,12 @@ class BayesianHMMSampler(object):
         """Sample a new set of emission probabilites from the conditional distribution P(E | S, O)
 
         """
-        observations_by_state = [ self.model.collect_observations_in_state(self.observations, state) for state in range(self.model.nstates) ]
-        self.model.output_model._sample_output_mode(observations_by_state)
+        # counts and moments (or symbol histograms) of the observations in each state, in one pass per trajectory
+        output_model = self.model.output_model
+        statistics = output_model._init_sufficient_statistics()
+        for (obs, S) in zip(self.observations, self.model.hidden_state_trajectories):
+            output_model._add_state_statistics(statistics, obs, S)
+        output_model._sample_output_mode(statistics)
         return
 
     def _updateTransitionMatrix(self):
@@ -261,7 +535,8 @@ class BayesianHMMSampler(object):
         # apply prior
         C += self.prior
         # sample T-matrix
-        Tij = sample_P(C, self.transition_matrix_sampling_steps, reversible=self.reversible)
+        Tij = sample_P(C, self.transition_matrix_sampling_steps, reversible=self.reversible, X=self._X,
+                       rng_state=self._tmatrix_rng_state)
         self.model.update(Tij)
 
     def _generateInitialModel(self, output_model_type):
@@ -274,3 +549,17 @@ class BayesianHMMSampler(object):
         model = mlhmm.fit()
         return model
 
+
+# Sampler of the worker processes of BayesianHMMSampler.sample_chains
+_chain_process_data = {}
+
+
+def _init_chain_process(sampler):
+    """ Initializes a worker process with the sampler """
+    _chain_process_data.clear()
+    _chain_process_data['sampler'] = sampler
+
+
+def _sample_chain_process(task):
+    """ Runs one chain in a worker process and returns its samples """
+    return _chain_process_data['sampler']._sample_chain(*task)
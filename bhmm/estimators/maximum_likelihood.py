@@ -10,18 +10,17 @@ __license__ = "LGPL"
 __maintainer__ = "Frank Noe"
 __email__="frank DOT noe AT fu-berlin DOT de"
 
+import os
 import time
 import numpy as np
 import copy
 
-# TODO: reactivate multiprocessing
-# from multiprocessing import Queue, Process, cpu_count
-
 # BHMM imports
 import bhmm
 import bhmm.hidden as hidden
 from bhmm.util.logger import logger
 from bhmm.util import config
+from bhmm.util.checkpoint import save_checkpoint, load_checkpoint
 
 class MaximumLikelihoodEstimator(object):
     """
@@ -44,10 +43,13 @@ class MaximumLikelihoodEstimator(object):
     ----------
     [1] L. E. Baum and J. A. Egon, "An inequality with applications to statistical estimation for probabilistic
         functions of a Markov process and to a model for ecology," Bull. Amer. Meteorol. Soc., vol. 73, pp. 360-363, 1967.
+    [2] R. Varadhan and C. Roland, "Simple and globally convergent methods for accelerating the convergence of any
+        EM algorithm," Scand. J. Stat., vol. 35, pp. 335-353, 2008.
 
     """
     def __init__(self, observations, nstates, initial_model=None, type='gaussian',
-                 reversible=True, stationary=True, p=None, accuracy=1e-3, maxit=1000):
+                 reversible=True, stationary=True, p=None, accuracy=1e-3, maxit=1000, checkpointed=False,
+                 nthreads=1, streaming=False, accelerated=False, copy_observations=True):
         """Initialize a Bayesian hidden Markov model sampler.
 
         Parameters
@@ -77,10 +79,44 @@ class MaximumLikelihoodEstimator(object):
         maxit : int
             stopping criterion for EM iteration. When so many iterations are performanced without reaching the requested
             accuracy, the iteration is stopped without convergence (a warning is given)
+        checkpointed : bool, optional, default=False
+            If True, the forward-backward algorithm only stores the forward variables at about sqrt(T) checkpoints
+            of each trajectory and recomputes the rest, so that memory grows with sqrt(T) instead of T. Use this
+            for trajectories that are too long to hold T x nstates arrays in memory. Each iteration needs an
+            additional forward pass, and hidden_state_probabilities are not available.
+        nthreads : int, optional, default=1
+            Number of threads used by the forward-backward algorithm. If larger than 1, the trajectories are
+            distributed over a pool of worker threads in chunks of similar total length, and each worker processes
+            its chunk with its own workspace. If the trajectories are too long to be balanced in this way, each
+            trajectory is instead split into segments that are processed in parallel (see
+            :func:`bhmm.hidden.forward_backward_parallel`), so that also a single long trajectory can use all cores.
+            Not used in checkpointed mode.
+        streaming : bool, optional, default=False
+            If True, the state probabilities are not stored. Instead, the E-step reduces them to the sufficient
+            statistics of the M-step chunk by chunk: the transition counts, the state probabilities at the first
+            time steps, and the weighted observation statistics of the output model (weight sums and weighted
+            first and second moments for Gaussian outputs, weighted symbol histograms for discrete outputs). The
+            forward-backward buffers are then bounded by the longest trajectory instead of growing with the total
+            number of observations. The observations are not concatenated, so that together with
+            copy_observations=False, the estimator can work on strided views into the original arrays.
+            hidden_state_probabilities are not available.
+        accelerated : bool, optional, default=False
+            If True, the EM iteration is accelerated by the squared extrapolation method SQUAREM [2]: after every
+            two Baum-Welch iterations, the parameters are extrapolated along the direction of the last updates,
+            followed by another Baum-Welch iteration. If this iteration has a lower likelihood than the last
+            Baum-Welch iteration, the extrapolation is discarded. This usually reduces the number of iterations
+            for slowly converging models, e.g. with very metastable hidden states.
+        copy_observations : bool, optional, default=True
+            If True, the estimator works on a copy of the observations. If False, the given observation arrays are
+            referenced and must not be modified while the estimator is used. This allows several estimators to
+            share the same data.
 
         """
         # Store a copy of the observations.
-        self._observations = copy.deepcopy(observations)
+        if copy_observations:
+            self._observations = copy.deepcopy(observations)
+        else:
+            self._observations = observations
         self._nobs = len(observations)
         self._Ts = [len(o) for o in observations]
         self._maxT = np.max(self._Ts)
@@ -118,20 +154,57 @@ class MaximumLikelihoodEstimator(object):
             else:
                 self._fixed_initial_distribution = np.array(p)
 
-        # pre-construct hidden variables
-        self._alpha = np.zeros((self._maxT,self._nstates), config.dtype, order='C')
-        self._beta = np.zeros((self._maxT,self._nstates), config.dtype, order='C')
-        self._pobs = np.zeros((self._maxT,self._nstates), config.dtype, order='C')
-        self._gammas = [np.zeros((len(self._observations[i]),self._nstates), config.dtype, order='C') for i in range(self._nobs)]
-        self._Cs = [np.zeros((self._nstates,self._nstates), config.dtype, order='C') for i in range(self._nobs)]
+        self._checkpointed = checkpointed
+        self._streaming = streaming
+        self._accelerated = accelerated
+        self._nthreads = nthreads
+        self._C = np.zeros((self._nstates,self._nstates), config.dtype, order='C')
+        self._offsets = hidden.trajectory_offsets(self._Ts)
+        # worker processes and trajectory chunks, only set during fit_parallel
+        self._process_pool = None
+        self._process_chunks = None
+        # output and state probability buffers of the default mode, see _allocate_buffers
+        self._pobs = None
+        self._gamma = None
+        if checkpointed or streaming:
+            # only sufficient statistics are kept
+            self._gammas = None
+            self._gamma0_sum = np.zeros((self._nstates))
+            self._output_statistics = None
+            # observations are only concatenated chunk-wise when needed, so that the trajectories can also be
+            # strided views into larger arrays
+            self._observations_concatenated = None
+            if not checkpointed:
+                # chunks of trajectories that are processed in one kernel call. Short trajectories are combined to
+                # chunks of up to 2^16 observations.
+                self._stream_chunks = self._bounded_chunks(max(self._maxT, 2**16))
+        else:
+            # concatenated observations, so that all trajectories can be processed in one kernel call. They are
+            # only created together with the buffers, when the first estimation step runs in this process.
+            self._observations_concatenated = None
+            self._gammas = None
+
+            # With several threads, chunks of trajectories are processed in parallel. A trajectory that is longer
+            # than the share of one thread is split into segments instead.
+            self._parallel_in_time = (nthreads > 1 and self._maxT > self._offsets[-1] / float(nthreads))
+            self._chunks = None
+            if nthreads > 1 and not self._parallel_in_time:
+                self._chunks = self._trajectory_chunks(nthreads)
+                # transition counts of each worker
+                self._Cs = [np.zeros_like(self._C) for chunk in self._chunks]
+
+            # Gaussian output probabilities are evaluated inside the forward-backward kernel, unless the trajectories
+            # are processed in parallel segments.
+            self._fused_gaussian = (self._hmm.output_model.model_type == 'gaussian' and not self._parallel_in_time)
 
         # convergence options
         self._accuracy = accuracy
         self._maxit = maxit
         self._likelihoods = None
+        self._start_records = None
 
         # Kernel for computing things
-        hidden.set_implementation(config.kernel)
+        hidden.set_implementation(config.kernel, logspace=config.logspace)
         self._hmm.output_model.set_implementation(config.kernel)
 
     @property
@@ -181,9 +254,25 @@ class MaximumLikelihoodEstimator(object):
 
     @property
     def hidden_state_probabilities(self):
-        r""" Probabilities of hidden states at every trajectory and time point """
+        r""" Probabilities of hidden states at every trajectory and time point
+
+        None in checkpointed or streaming mode, after fit_parallel or fit_multistart and before the first fit.
+
+        """
         return self._gammas
 
+    @property
+    def start_records(self):
+        r""" Convergence record of every initial model of the last call of fit_multistart
+
+        Each record is a dict with the entries 'initial_model', 'model' (the final model of this start),
+        'likelihoods' (log-likelihood in each iteration), 'iterations', 'converged', 'pruned' (True if the start
+        was stopped because it trailed the best start), 'time' (seconds spent on this start) and 'best' (True for
+        the start whose model has been selected).
+
+        """
+        return self._start_records
+
     @property
     def hmm(self):
         r""" The estimated HMM """
@@ -210,44 +299,258 @@ class MaximumLikelihoodEstimator(object):
         assert self._stationary, 'Estimator is not stationary'
         return self._hmm.Pi
 
-    def _forward_backward(self, itraj):
+    def _trajectory_chunks(self, nchunks):
         """
-        Estimation step: Runs the forward-back algorithm on trajectory with index itraj
+        Splits the trajectories into at most nchunks contiguous ranges of similar total length
 
-        Parameters
-        ----------
-        itraj : int
-            index of the observation trajectory to process
+        Returns
+        -------
+        chunks : list of (int, int)
+            each chunk is a range k0:k1 of trajectory indexes
+
+        """
+        # chunk boundaries at the trajectory starts closest to equal shares of the total length
+        shares = np.linspace(0, self._offsets[-1], nchunks+1)
+        bounds = np.unique(np.searchsorted(self._offsets, shares[1:-1]))
+        bounds = [0] + [k for k in bounds if 0 < k < self._nobs] + [self._nobs]
+        return [(bounds[i], bounds[i+1]) for i in range(len(bounds)-1)]
+
+    def _bounded_chunks(self, max_length):
+        """
+        Splits the trajectories into contiguous ranges whose total length does not exceed max_length
+
+        A trajectory that is longer than max_length forms a chunk of its own.
+
+        Returns
+        -------
+        chunks : list of (int, int)
+            each chunk is a range k0:k1 of trajectory indexes
+
+        """
+        chunks = []
+        k0 = 0
+        for k in range(1, self._nobs + 1):
+            if k == self._nobs or self._offsets[k+1] - self._offsets[k0] > max_length:
+                chunks.append((k0, k))
+                k0 = k
+        return chunks
+
+    def _allocate_buffers(self):
+        """
+        Allocates the concatenated observations and the output and state probability buffers of the default mode
+
+        The buffers are allocated on first use, so that they are not created by fit_parallel, whose estimation
+        steps run in worker processes, nor by fit_multistart, which concatenates the observations once and uses
+        the buffers of its worker threads.
+
+        """
+        if self._gamma is not None:
+            return
+        self._observations_concatenated = np.concatenate(self._observations)
+        if not self._fused_gaussian:
+            self._pobs = np.zeros((self._offsets[-1],self._nstates), config.dtype, order='C')
+        self._gamma = np.zeros((self._offsets[-1],self._nstates), config.dtype, order='C')
+        self._gammas = [self._gamma[self._offsets[i]:self._offsets[i+1]] for i in range(self._nobs)]
+
+    def _release_buffers(self):
+        """ Frees the buffers of the default mode. hidden_state_probabilities are not available afterwards. """
+        if not (self._checkpointed or self._streaming):
+            self._observations_concatenated = None
+        self._pobs = None
+        self._gamma = None
+        self._gammas = None
+
+    def _chunk_observations(self, k0, k1):
+        """
+        Returns the observations of the trajectories k0:k1 as one array
+
+        If the estimator keeps concatenated observations, a view is returned. Otherwise a single trajectory is
+        returned as is, and several trajectories are concatenated.
+
+        """
+        if self._observations_concatenated is not None:
+            return self._observations_concatenated[self._offsets[k0]:self._offsets[k1]]
+        if k1 - k0 == 1:
+            return np.asarray(self._observations[k0])
+        return np.concatenate(self._observations[k0:k1])
+
+    def _forward_backward_chunk(self, k0, k1, C_out):
+        """
+        Runs the forward-backward algorithm on the trajectories k0:k1
+
+        The output probabilities, state probabilities and log-likelihoods are written into the rows of the shared
+        buffers that belong to these trajectories, and the transition counts into C_out. Different chunks can
+        therefore be processed by different threads.
+
+        """
+        A = self._hmm.transition_matrix
+        pi = self._hmm.stationary_distribution
+        output_model = self._hmm.output_model
+        t0, t1 = self._offsets[k0], self._offsets[k1]
+        offsets = self._offsets[k0:k1+1] - t0
+        obs = self._observations_concatenated[t0:t1]
+        if self._fused_gaussian:
+            return hidden.forward_backward_batch_gaussian(A, obs, output_model.means, output_model.sigmas, pi,
+                                                          offsets, gamma_out=self._gamma[t0:t1], C_out=C_out)[0]
+        # compute output probability matrix
+        pobs = self._pobs[t0:t1]
+        if config.logspace:
+            output_model.log_p_obs(obs, out=pobs)
+        else:
+            output_model.p_obs(obs, out=pobs)
+        return hidden.forward_backward_batch(A, pobs, pi, offsets, gamma_out=self._gamma[t0:t1], C_out=C_out)[0]
+
+    def _forward_backward(self):
+        """
+        Estimation step: Runs the forward-back algorithm on all trajectories
+
+        All trajectories are processed in a single batched kernel call, or in one call per chunk of trajectories
+        when several threads are used. The state probabilities are written into self._gammas and the summed
+        Baum-Welch transition count matrix into self._C. For Gaussian output models, the kernel evaluates the
+        output probabilities itself, so that no output probability matrix is stored.
+
+        Results
+        -------
+        logprobs : ndarray(K, dtype=float)
+            The log-probability of each observation sequence given the HMM parameters
+
+        """
+        self._allocate_buffers()
+        if self._chunks is not None:
+            # chunks of trajectories in parallel threads
+            logprobs = np.zeros((self._nobs))
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(len(self._chunks))
+
+            def process_chunk(i):
+                k0, k1 = self._chunks[i]
+                logprobs[k0:k1] = self._forward_backward_chunk(k0, k1, self._Cs[i])
+
+            try:
+                pool.map(process_chunk, range(len(self._chunks)))
+            finally:
+                pool.close()
+                pool.join()
+            self._C[:] = np.sum(self._Cs, axis=0)
+            return logprobs
+        if not self._parallel_in_time:
+            return self._forward_backward_chunk(0, self._nobs, self._C)
+
+        # parallel in time
+        A = self._hmm.transition_matrix
+        pi = self._hmm.stationary_distribution
+        if config.logspace:
+            self._hmm.output_model.log_p_obs(self._observations_concatenated, out=self._pobs)
+        else:
+            self._hmm.output_model.p_obs(self._observations_concatenated, out=self._pobs)
+        logprobs = np.zeros((self._nobs))
+        C = np.zeros_like(self._C)
+        self._C[:] = 0.0
+        for k in range(self._nobs):
+            logprobs[k] = hidden.forward_backward_parallel(A, self._pobs[self._offsets[k]:self._offsets[k+1]], pi,
+                                                           nthreads=self._nthreads, gamma_out=self._gammas[k],
+                                                           C_out=C)[0]
+            self._C += C
+        return logprobs
+
+    def _forward_backward_streaming(self):
+        """
+        Estimation step without storing state probabilities: Reduces each chunk of trajectories to statistics
+
+        The chunks are processed one after the other, or distributed over a pool of threads that each own their
+        buffers. The state probabilities at the first time step are summed in self._gamma0_sum, the transition
+        counts in self._C, and the weighted observation statistics of the output model in self._output_statistics.
+
+        Results
+        -------
+        logprobs : ndarray(K, dtype=float)
+            The log-probability of each observation sequence given the HMM parameters
+
+        """
+        A = self._hmm.transition_matrix
+        pi = self._hmm.stationary_distribution
+        output_model = self._hmm.output_model
+        nworkers = min(self._nthreads, len(self._stream_chunks))
+        logprobs = np.zeros((self._nobs))
+
+        def process_chunks(w):
+            results = []
+            buffers = {}
+            for (k0, k1) in self._stream_chunks[w::nworkers]:
+                result = _forward_backward_statistics(A, pi, output_model, self._chunk_observations(k0, k1),
+                                                      self._offsets[k0:k1+1] - self._offsets[k0], buffers=buffers)
+                logprobs[k0:k1] = result[0]
+                results.append(result)
+            return results
+
+        if nworkers > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(nworkers)
+            try:
+                results = pool.map(process_chunks, range(nworkers))
+            finally:
+                pool.close()
+                pool.join()
+            results = [result for worker_results in results for result in worker_results]
+        else:
+            results = process_chunks(0)
+
+        # sum statistics of all chunks
+        self._gamma0_sum[:] = 0.0
+        self._C[:] = 0.0
+        self._output_statistics = output_model._init_sufficient_statistics()
+        for (logprobs_chunk, C, gamma0_sum, statistics) in results:
+            self._C += C
+            self._gamma0_sum += gamma0_sum
+            output_model._merge_sufficient_statistics(self._output_statistics, statistics)
+        return logprobs
+
+    def _forward_backward_checkpointed(self):
+        """
+        Estimation step with O(sqrt(T)) memory: Runs the checkpointed forward-back algorithm on all trajectories
+
+        Instead of the state probabilities, only the sufficient statistics of the M-step are accumulated: the
+        state probabilities at the first time step are summed in self._gamma0_sum, the transition counts in
+        self._C, and the weighted observation statistics of the output model in self._output_statistics.
 
         Results
         -------
-        logprob : float
-            The probability to observe the observation sequence given the HMM parameters
-        gamma : ndarray(T,N, dtype=float)
-            state probabilities for each t
-        count_matrix : ndarray(N,N, dtype=float)
-            the Baum-Welch transition count matrix from the hidden state trajectory
+        logprobs : ndarray(K, dtype=float)
+            The log-probability of each observation sequence given the HMM parameters
 
         """
         # get parameters
         A = self._hmm.transition_matrix
         pi = self._hmm.stationary_distribution
-        obs = self._observations[itraj]
-        T = len(obs)
-        # compute output probability matrix
-        self._hmm.output_model.p_obs(obs, out=self._pobs)
-        # forward variables
-        logprob = hidden.forward(A, self._pobs, pi, T = T, alpha_out=self._alpha)[0]
-        # backward variables
-        hidden.backward(A, self._pobs, T = T, beta_out=self._beta)
-        # gamma
-        hidden.state_probabilities(self._alpha, self._beta, gamma_out = self._gammas[itraj])
-        # count matrix
-        hidden.transition_counts(self._alpha, self._beta, A, self._pobs, out = self._Cs[itraj])
+        output_model = self._hmm.output_model
+        K = len(self._observations)
+        N = self._nstates
+        # reset statistics
+        self._gamma0_sum[:] = 0.0
+        self._C[:] = 0.0
+        self._output_statistics = output_model._init_sufficient_statistics()
+        C = np.zeros((N,N), config.dtype)
+        logprobs = np.zeros((K))
+        for k in range(K):
+            obs = self._observations[k]
+
+            def p_obs(t0, t1):
+                if config.logspace:
+                    return output_model.log_p_obs(obs[t0:t1])
+                return output_model.p_obs(obs[t0:t1])
+
+            def add_statistics(t0, t1, gamma):
+                if t0 == 0:
+                    self._gamma0_sum += gamma[0]
+                output_model._add_sufficient_statistics(self._output_statistics, obs[t0:t1], gamma)
+
+            logprobs[k] = hidden.forward_backward_checkpointed(A, pi, len(obs), p_obs,
+                                                               gamma_callback=add_statistics, C_out=C)[0]
+            self._C += C
         # return results
-        return logprob
+        return logprobs
 
-    def _update_model(self, gammas, count_matrices):
+    def _update_model(self, gammas, C):
         """
         Maximization step: Updates the HMM model given the hidden state assignment and count matrices
 
@@ -255,75 +558,217 @@ class MaximumLikelihoodEstimator(object):
         ----------
         gamma : [ ndarray(T,N, dtype=float) ]
             list of state probabilities for each trajectory
-        count_matrix : [ ndarray(N,N, dtype=float) ]
-            list of the Baum-Welch transition count matrices for each hidden state trajectory
+        C : ndarray(N,N, dtype=float)
+            the Baum-Welch transition count matrix, summed over all hidden state trajectories
 
         """
         K = len(self._observations)
         N = self._nstates
 
-        C = np.zeros((N,N))
         gamma0_sum = np.zeros((N))
         for k in range(K):
             # update state counts
             gamma0_sum += gammas[k][0]
-            # update count matrix
-            # print 'C['+str(k)+'] = ',count_matrices[k]
-            C += count_matrices[k]
 
+        self._update_transition_model(C, gamma0_sum)
+
+        # update output model
+        # TODO: need to parallelize model fitting. Otherwise we can't gain much speed!
+        self._hmm.output_model._estimate_output_model(self._observations, gammas)
+
+    def _update_transition_model(self, C, gamma0_sum, hmm=None):
+        """
+        Maximization step of the hidden transition matrix and the stationary or initial distribution
+
+        Parameters
+        ----------
+        C : ndarray(N,N, dtype=float)
+            the Baum-Welch transition count matrix, summed over all hidden state trajectories
+        gamma0_sum : ndarray(N, dtype=float)
+            state probabilities at the first time step, summed over all hidden state trajectories
+        hmm : HMM, optional, default=None
+            the model to be updated. If None, the model of this estimator is updated.
+
+        """
+        if hmm is None:
+            hmm = self._hmm
         logger().info("Count matrix = \n"+str(C))
 
-        # compute new transition matrix
-        from bhmm.msm.tmatrix_disconnected import estimate_P,stationary_distribution
-        T = estimate_P(C, reversible=self._hmm.is_reversible, fixed_statdist=self._fixed_stationary_distribution)
-        # stationary or init distribution
-        if self._hmm.is_stationary:
-            if self._fixed_stationary_distribution is None:
-                pi = stationary_distribution(C,T)
-            else:
-                pi = self._fixed_stationary_distribution
-        else:
-            if self._fixed_initial_distribution is None:
-                pi = gamma0_sum / np.sum(gamma0_sum)
-            else:
-                pi = self._fixed_initial_distribution
+        T, pi = _estimate_transition_model(C, gamma0_sum, hmm.is_reversible, hmm.is_stationary,
+                                           fixed_stationary_distribution=self._fixed_stationary_distribution,
+                                           fixed_initial_distribution=self._fixed_initial_distribution)
 
         # update model
-        self._hmm.update(T, pi)
+        hmm.update(T, pi)
 
         logger().info("T: \n"+str(T))
         logger().info("pi: \n"+str(pi))
 
-        # update output model
-        # TODO: need to parallelize model fitting. Otherwise we can't gain much speed!
-        self._hmm.output_model._estimate_output_model(self._observations, gammas)
+    def _em_step(self):
+        """
+        Runs one Baum-Welch iteration: the estimation step with the current model, followed by the maximization step
+
+        Returns
+        -------
+        loglik : float
+            The log-likelihood of the model before the update
+
+        """
+        if self._checkpointed or self._streaming or self._process_pool is not None:
+            if self._process_pool is not None:
+                loglik = np.sum(self._forward_backward_processes())
+            elif self._checkpointed:
+                loglik = np.sum(self._forward_backward_checkpointed())
+            else:
+                loglik = np.sum(self._forward_backward_streaming())
+            self._update_transition_model(self._C, self._gamma0_sum)
+            self._hmm.output_model._estimate_output_model_from_statistics(self._output_statistics)
+        else:
+            loglik = np.sum(self._forward_backward())
+            self._update_model(self._gammas, self._C)
+        return loglik
+
+    def _get_parameters(self):
+        """
+        Returns the parameters of the current model as a flat vector
+
+        Reversible transition matrices are represented by the symmetric matrix of stationary fluxes
+        X_ij = pi_i T_ij, so that any non-negative extrapolation of the parameters is again a reversible model.
+        Extrapolations of the fluxes or transition matrices also keep fixed stationary distributions.
+
+        """
+        T = self._hmm.transition_matrix
+        if self._hmm.is_reversible:
+            from pyemma.msm import analysis as msmana
+            T = msmana.stationary_distribution(T)[:,None] * T
+        parameters = [np.array(T, dtype=np.float64).flatten()]
+        if not self._hmm.is_stationary:
+            parameters.append(self._hmm.initial_distribution)
+        parameters.append(self._hmm.output_model._get_parameters())
+        return np.concatenate(parameters)
+
+    def _set_parameters(self, parameters):
+        """
+        Sets the model parameters from a flat vector as returned by _get_parameters
+
+        Returns
+        -------
+        valid : bool
+            False if the parameters do not define a valid model. The model is then left unchanged.
+
+        """
+        N = self._nstates
+        X = np.reshape(parameters[:N*N], (N,N))
+        if np.any(X < 0) or np.any(np.sum(X, axis=1) <= 0):
+            return False
+        if self._hmm.is_reversible:
+            X = 0.5 * (X + X.T)
+        T = X / np.sum(X, axis=1)[:,None]
+        if self._hmm.is_stationary:
+            pi = self._fixed_stationary_distribution
+            offset = N*N
+        else:
+            pi = parameters[N*N:N*N+N]
+            if np.any(pi < 0):
+                return False
+            offset = N*N+N
+        if not self._hmm.output_model._set_parameters(parameters[offset:]):
+            return False
+        self._hmm.update(T, pi)
+        return True
+
+    def _extrapolate(self, parameters0, parameters1, parameters2):
+        """
+        Sets the model to the SQUAREM extrapolation of three subsequent Baum-Welch iterates
+
+        The steplength alpha = -|r| / |v| is computed from the update r = p1 - p0 and its change v = p2 - 2 p1 + p0.
+        If the extrapolated parameters p0 - 2 alpha r + alpha^2 v are not valid, alpha is moved towards -1, where
+        the extrapolation gives p2.
+
+        Returns
+        -------
+        extrapolated : bool
+            False if no valid extrapolation beyond p2 has been found, and the model was not changed
+
+        """
+        r = parameters1 - parameters0
+        v = parameters2 - parameters1 - r
+        norm_v = np.linalg.norm(v)
+        if norm_v == 0:
+            return False
+        alpha = -np.linalg.norm(r) / norm_v
+        while alpha < -1.01:
+            if self._set_parameters(parameters0 - 2.0 * alpha * r + alpha**2 * v):
+                logger().info("extrapolated with steplength "+str(alpha))
+                return True
+            alpha = 0.5 * (alpha - 1.0)
+        return False
 
     def compute_viterbi_paths(self):
         """
         Computes the viterbi paths using the current HMM model
 
+        The output probabilities are written into the buffer of the E-step, or not stored at all for Gaussian output
+        models. In checkpointed or streaming mode, they are computed for one trajectory at a time. In checkpointed
+        mode, the Viterbi traceback is also stored in segments of length sqrt(T).
+
         """
         # get parameters
         K = len(self._observations)
         A = self._hmm.transition_matrix
         pi = self._hmm.stationary_distribution
+        output_model = self._hmm.output_model
+        gaussian = (output_model.model_type == 'gaussian')
+        # without the buffers of the default mode, e.g. after fit_parallel, the trajectories are processed one by one
+        per_trajectory = (self._checkpointed or self._streaming or self._observations_concatenated is None)
+
+        # compute output probability matrix of all trajectories at once
+        if not per_trajectory and not gaussian:
+            if config.logspace:
+                output_model.log_p_obs(self._observations_concatenated, out=self._pobs)
+            else:
+                output_model.p_obs(self._observations_concatenated, out=self._pobs)
 
         # compute viterbi path for each trajectory
         paths = np.empty((K), dtype=object)
         for itraj in range(K):
             obs = self._observations[itraj]
-            # compute output probability matrix
-            pobs = self._hmm.output_model.p_obs(obs)
-            # hidden path
-            paths[itraj] = hidden.viterbi(A, pobs, pi)
+            segment_length = int(np.sqrt(len(obs))) if self._checkpointed else None
+            if gaussian:
+                paths[itraj] = hidden.viterbi_gaussian(A, obs, output_model.means, output_model.sigmas, pi,
+                                                       segment_length=segment_length)
+            elif per_trajectory:
+                if config.logspace:
+                    pobs = output_model.log_p_obs(obs)
+                else:
+                    pobs = output_model.p_obs(obs)
+                paths[itraj] = hidden.viterbi(A, pobs, pi, segment_length=segment_length)
+            else:
+                pobs = self._pobs[self._offsets[itraj]:self._offsets[itraj+1]]
+                paths[itraj] = hidden.viterbi(A, pobs, pi)
 
         # done
         return paths
 
-    def fit(self):
+    def fit(self, checkpoint=None, checkpoint_interval=10, resume=False):
         """
         Maximum-likelihood estimation of the HMM using the Baum-Welch algorithm
 
+        Parameters
+        ----------
+        checkpoint : str, optional, default=None
+            Name of a checkpoint file. If given, the state of the iteration (current model, likelihood history and
+            iteration counters) is written to this file every checkpoint_interval Baum-Welch iterations and when
+            the iteration has finished.
+        checkpoint_interval : int, optional, default=10
+            Number of Baum-Welch iterations between two checkpoints.
+        resume : bool, optional, default=False
+            If True and the checkpoint file exists, the iteration is continued from the state in the checkpoint
+            file instead of the initial model, e.g. after the job has been interrupted. The estimator must have
+            been constructed with the same observations and options as the interrupted one. If the checkpoint file
+            does not exist, the iteration starts from the initial model, so that the same call can be used to
+            start and to restart a job.
+
         Returns
         -------
         model : HMM
@@ -333,7 +778,6 @@ class MaximumLikelihoodEstimator(object):
         logger().info("=================================================================")
         logger().info("Running Baum-Welch:")
         logger().info("  input observations: "+str(self.nobservations)+" of lengths "+str(self.observation_lengths))
-        logger().info("  initial HMM guess:"+str(self._hmm))
 
         initial_time = time.time()
 
@@ -341,26 +785,80 @@ class MaximumLikelihoodEstimator(object):
         self._likelihoods = np.zeros((self.maxit))
         loglik = 0.0
         converged = False
+        # accelerated EM: parameters at the start of the last Baum-Welch iterations, the model to fall back to if an
+        # extrapolation is discarded, and the number of Baum-Welch iterations including discarded ones
+        parameters = []
+        fallback = None
+        nextrapolations = 0
+        nsteps = 0
+
+        if resume and checkpoint is not None and os.path.exists(checkpoint):
+            state = load_checkpoint(checkpoint, 'mlhmm')
+            if state['nstates'] != self._nstates or state['observation_lengths'] != list(self._Ts):
+                raise ValueError('Checkpoint '+str(checkpoint)+' was written by an estimation with different '
+                                 'observations or number of states.')
+            self._hmm = state['hmm']
+            self._hmm.output_model.set_implementation(config.kernel)
+            it, nsteps, nextrapolations = state['it'], state['nsteps'], state['nextrapolations']
+            loglik, converged = state['loglik'], state['converged']
+            parameters, fallback = state['parameters'], state['fallback']
+            self._likelihoods = np.zeros((max(self.maxit, it)))
+            self._likelihoods[:it] = state['likelihoods']
+            logger().info("  resuming from checkpoint "+str(checkpoint)+" after "+str(nsteps)+" iterations")
+        last_checkpoint = nsteps
+        logger().info("  initial HMM guess:"+str(self._hmm))
 
-        while (not converged and it < self.maxit):
-            loglik = 0.0
-            for k in range(self._nobs):
-                loglik += self._forward_backward(k)
-
-            self._update_model(self._gammas, self._Cs)
+        def save():
+            save_checkpoint(checkpoint, {'kind': 'mlhmm', 'nstates': self._nstates,
+                                         'observation_lengths': list(self._Ts), 'hmm': self._hmm,
+                                         'likelihoods': self._likelihoods[:it], 'loglik': loglik,
+                                         'converged': converged, 'it': it, 'nsteps': nsteps,
+                                         'nextrapolations': nextrapolations, 'parameters': parameters,
+                                         'fallback': fallback})
+
+        while (not converged and nsteps < self.maxit):
+            if checkpoint is not None and nsteps - last_checkpoint >= checkpoint_interval:
+                save()
+                last_checkpoint = nsteps
+            if self._accelerated and fallback is None:
+                parameters.append(self._get_parameters())
+            loglik = self._em_step()
+            nsteps += 1
+            extrapolated = fallback is not None
+            if extrapolated:
+                if not loglik >= self._likelihoods[it-1]:
+                    # extrapolation is worse than the last Baum-Welch iterate. Continue from the Baum-Welch iterate.
+                    logger().info("extrapolation discarded, ll = "+str(loglik))
+                    self._hmm = fallback
+                    fallback = None
+                    loglik = self._likelihoods[it-1]
+                    continue
+                fallback = None
+                nextrapolations += 1
             logger().info(str(it)+" ll = "+str(loglik))
             #print self.model.output_model
             #print "---------------------"
 
             self._likelihoods[it] = loglik
 
-            if it > 0:
+            # convergence is only tested between Baum-Welch iterates
+            if it > 0 and not extrapolated:
                 if loglik - self._likelihoods[it-1] < self._accuracy:
                     #print "CONVERGED! Likelihood change = ",(loglik - self.likelihoods[it-1])
                     converged = True
 
             it += 1
 
+            if self._accelerated and len(parameters) == 2:
+                if not converged:
+                    fallback = copy.deepcopy(self._hmm)
+                    if not self._extrapolate(parameters[0], parameters[1], self._get_parameters()):
+                        fallback = None
+                parameters = []
+
+        if checkpoint is not None:
+            save()
+
         # truncate likelihood history
         self._likelihoods = self._likelihoods[:it]
         # set final likelihood
@@ -370,6 +868,9 @@ class MaximumLikelihoodEstimator(object):
         elapsed_time = final_time - initial_time
 
         logger().info("maximum likelihood HMM:"+str(self._hmm))
+        if self._accelerated:
+            logger().info("Baum-Welch iterations: %d, of which %d started from accepted extrapolations and %d from "
+                          "discarded extrapolations" % (nsteps, nextrapolations, nsteps - it))
         logger().info("Elapsed time for Baum-Welch solution: %.3f s" % elapsed_time)
         logger().info("Computing Viterbi path:")
 
@@ -387,78 +888,387 @@ class MaximumLikelihoodEstimator(object):
         return self._hmm
 
 
-    # TODO: reactive multiprocessing
-    # ###################
-    # # MULTIPROCESSING
-    #
-    # def _forward_backward_worker(self, work_queue, done_queue):
-    #     try:
-    #         for k in iter(work_queue.get, 'STOP'):
-    #             (weight, gamma, count_matrix) = self._forward_backward(k)
-    #             done_queue.put((k, weight, gamma, count_matrix))
-    #     except Exception, e:
-    #         done_queue.put(e.message)
-    #     return True
-    #
-    #
-    # def fit_parallel(self):
-    #     """
-    #     Maximum-likelihood estimation of the HMM using the Baum-Welch algorithm
-    #
-    #     Returns
-    #     -------
-    #     The hidden markov model
-    #
-    #     """
-    #     K = len(self.observations)#, len(A), len(B[0])
-    #     gammas = np.empty(K, dtype=object)
-    #     count_matrices = np.empty(K, dtype=object)
-    #
-    #     it        = 0
-    #     converged = False
-    #
-    #     num_threads = min(cpu_count(), K)
-    #     work_queue = Queue()
-    #     done_queue = Queue()
-    #     processes = []
-    #
-    #     while (not converged):
-    #         print "it", it
-    #         loglik = 0.0
-    #
-    #         # fill work queue
-    #         for k in range(K):
-    #             work_queue.put(k)
-    #
-    #         # start processes
-    #         for w in xrange(num_threads):
-    #             p = Process(target=self._forward_backward_worker, args=(work_queue, done_queue))
-    #             p.start()
-    #             processes.append(p)
-    #             work_queue.put('STOP')
-    #
-    #         # end processes
-    #         for p in processes:
-    #             p.join()
-    #
-    #         # done signal
-    #         done_queue.put('STOP')
-    #
-    #         # get results
-    #         for (k, ll, gamma, count_matrix) in iter(done_queue.get, 'STOP'):
-    #             loglik += ll
-    #             gammas[k] = gamma
-    #             count_matrices[k] = count_matrix
-    #
-    #         # update T, pi
-    #         self._update_model(gammas, count_matrices)
-    #
-    #         self.likelihoods[it] = loglik
-    #
-    #         if it > 0:
-    #             if loglik - self.likelihoods[it-1] < self.accuracy:
-    #                 converged = True
-    #
-    #         it += 1
-    #
-    #     return self.model
+    def fit_multistart(self, initial_models, prune_after=5, prune_margin=0.01):
+        """
+        Maximum-likelihood estimation of the HMM with the Baum-Welch algorithm from several initial models
+
+        All initial models are iterated concurrently, one Baum-Welch iteration per round. The observations of this
+        estimator are concatenated once and shared by all starts, and the output and state probability buffers of
+        the estimation step are owned by the worker threads (nthreads of this estimator) rather than by the starts,
+        so that memory does not grow with the number of starts. After prune_after iterations, starts whose
+        log-likelihood trails the best start by more than the margin are stopped. The model with the highest
+        log-likelihood is selected.
+
+        Parameters
+        ----------
+        initial_models : list of HMM
+            the initial models, e.g. generated by :func:`bhmm.init.gaussian.random_model_gaussian1d` or
+            :func:`bhmm.init.discrete.random_model_discrete`
+        prune_after : int, optional, default=5
+            number of iterations after which trailing starts are pruned
+        prune_margin : float or None, optional, default=0.01
+            log-likelihood margin per observation. A start is pruned if its log-likelihood is lower than that of
+            the best start by more than prune_margin times the total number of observations. If None, no start
+            is pruned.
+
+        Returns
+        -------
+        model : HMM
+            The maximum likelihood HMM model of the best start. The records of all starts are available in
+            start_records.
+
+        """
+        initial_time = time.time()
+        if self._checkpointed:
+            chunks = [(k, k+1) for k in range(self._nobs)]
+        elif self._streaming:
+            chunks = self._stream_chunks
+        else:
+            chunks = [(0, self._nobs)]
+            # a single concatenated copy of the observations, used by all starts and iterations
+            observations = self._chunk_observations(0, self._nobs)
+        starts = [{'initial_model': initial_model, 'model': copy.deepcopy(initial_model), 'likelihoods': [],
+                   'converged': False, 'pruned': False, 'time': 0.0, 'best': False}
+                  for initial_model in initial_models]
+        for start in starts:
+            start['model'].output_model.set_implementation(config.kernel)
+
+        def estimation_step(start, buffers):
+            t = time.time()
+            A = start['model'].transition_matrix
+            pi = start['model'].stationary_distribution
+            output_model = start['model'].output_model
+            loglik = 0.0
+            C = np.zeros((self._nstates, self._nstates))
+            gamma0_sum = np.zeros((self._nstates))
+            statistics = output_model._init_sufficient_statistics()
+            for (k0, k1) in chunks:
+                if self._checkpointed or self._streaming:
+                    chunk_observations = self._chunk_observations(k0, k1)
+                else:
+                    chunk_observations = observations
+                result = _forward_backward_statistics(A, pi, output_model, chunk_observations,
+                                                      self._offsets[k0:k1+1] - self._offsets[k0],
+                                                      checkpointed=self._checkpointed, buffers=buffers)
+                loglik += np.sum(result[0])
+                C += result[1]
+                gamma0_sum += result[2]
+                output_model._merge_sufficient_statistics(statistics, result[3])
+            start['time'] += time.time() - t
+            return loglik, C, gamma0_sum, statistics
+
+        # buffers of each worker thread
+        nworkers = max(1, min(self._nthreads, len(starts)))
+        buffers = [{} for w in range(nworkers)]
+        pool = None
+        if nworkers > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(nworkers)
+
+        it = 0
+        active = list(starts)
+        try:
+            while len(active) > 0 and it < self.maxit:
+                # estimation steps of all active starts
+                if pool is not None:
+                    def process_starts(w):
+                        return [estimation_step(start, buffers[w]) for start in active[w::nworkers]]
+                    worker_results = pool.map(process_starts, range(nworkers))
+                    results = [None] * len(active)
+                    for w in range(nworkers):
+                        results[w::nworkers] = worker_results[w]
+                else:
+                    results = [estimation_step(start, buffers[0]) for start in active]
+
+                # maximization steps and convergence
+                for (start, (loglik, C, gamma0_sum, statistics)) in zip(active, results):
+                    t = time.time()
+                    self._update_transition_model(C, gamma0_sum, hmm=start['model'])
+                    start['model'].output_model._estimate_output_model_from_statistics(statistics)
+                    likelihoods = start['likelihoods']
+                    if len(likelihoods) > 0 and loglik - likelihoods[-1] < self._accuracy:
+                        start['converged'] = True
+                    likelihoods.append(loglik)
+                    start['time'] += time.time() - t
+                it += 1
+
+                # prune starts that trail the best start
+                if prune_margin is not None and it >= prune_after:
+                    leader = max([start['likelihoods'][-1] for start in starts if not start['pruned']])
+                    threshold = leader - prune_margin * self._offsets[-1]
+                    for start in active:
+                        if not start['converged'] and start['likelihoods'][-1] < threshold:
+                            start['pruned'] = True
+                            logger().info("pruned start "+str(starts.index(start))+" at iteration "+str(it)+
+                                          " with ll = "+str(start['likelihoods'][-1]))
+                active = [start for start in active if not start['converged'] and not start['pruned']]
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        # select best start
+        for start in starts:
+            start['likelihoods'] = np.array(start['likelihoods'])
+            start['iterations'] = len(start['likelihoods'])
+        best = max([start for start in starts if not start['pruned']], key=lambda start: start['likelihoods'][-1])
+        best['best'] = True
+        self._start_records = starts
+        self._hmm = best['model']
+        self._likelihoods = best['likelihoods']
+        self._hmm.likelihood = self._likelihoods[-1]
+        logger().info("Elapsed time for %d starts: %.3f s" % (len(starts), time.time() - initial_time))
+
+        # Compute hidden state trajectories using the Viterbi algorithm.
+        self._hmm.hidden_state_trajectories = self.compute_viterbi_paths()
+        return self._hmm
+
+    def _forward_backward_processes(self):
+        """
+        Estimation step in worker processes: Runs the forward-back algorithm on chunks of trajectories in parallel
+
+        The workers read the observations from shared memory and only return the log-likelihoods and the
+        sufficient statistics of their chunk, which are summed into self._gamma0_sum, self._C and
+        self._output_statistics as in the checkpointed mode.
+
+        Results
+        -------
+        logprobs : ndarray(K, dtype=float)
+            The log-probability of each observation sequence given the HMM parameters
+
+        """
+        A = self._hmm.transition_matrix
+        pi = self._hmm.stationary_distribution
+        output_model = self._hmm.output_model
+        tasks = [(k0, k1, A, pi, output_model, self._checkpointed) for (k0, k1) in self._process_chunks]
+        results = self._process_pool.map(_forward_backward_process, tasks)
+        # sum statistics of all chunks
+        self._gamma0_sum[:] = 0.0
+        self._C[:] = 0.0
+        self._output_statistics = output_model._init_sufficient_statistics()
+        for (logprobs, C, gamma0_sum, statistics) in results:
+            self._C += C
+            self._gamma0_sum += gamma0_sum
+            output_model._merge_sufficient_statistics(self._output_statistics, statistics)
+        return np.concatenate([result[0] for result in results])
+
+    def fit_parallel(self, nprocesses=None, checkpoint=None, checkpoint_interval=10, resume=False):
+        """
+        Maximum-likelihood estimation of the HMM using the Baum-Welch algorithm with a pool of worker processes
+
+        The trajectories are split into chunks of similar total length, and the forward-backward algorithm of each
+        chunk runs in a separate process. The observations are copied into shared memory once, when the processes
+        are started. In each iteration, only the current model is sent to the workers, and only log-likelihoods
+        and sufficient statistics are sent back, so that the state probabilities are never transferred. Each
+        worker keeps its own output probability and state probability buffers over all iterations. As in the
+        checkpointed mode, hidden_state_probabilities are not computed.
+
+        Parameters
+        ----------
+        nprocesses : int, optional, default=None
+            Number of worker processes. If None, one process per CPU is used. A single trajectory is never split,
+            so more processes than trajectories are not used.
+        checkpoint : str, optional, default=None
+            Name of a checkpoint file, see :meth:`fit`.
+        checkpoint_interval : int, optional, default=10
+            Number of Baum-Welch iterations between two checkpoints.
+        resume : bool, optional, default=False
+            If True and the checkpoint file exists, the iteration is continued from the checkpoint, see :meth:`fit`.
+
+        Returns
+        -------
+        model : HMM
+            The maximum likelihood HMM model.
+
+        """
+        from multiprocessing import Pool, cpu_count
+        from multiprocessing.sharedctypes import RawArray
+        if nprocesses is None:
+            nprocesses = cpu_count()
+        # copy observations into shared memory. Forked workers inherit it without pickling.
+        dtype = np.result_type(*[np.asarray(obs).dtype for obs in self._observations])
+        raw_observations = RawArray('b', int(self._offsets[-1]) * dtype.itemsize)
+        observations = np.frombuffer(raw_observations, dtype=dtype)
+        for k in range(self._nobs):
+            observations[self._offsets[k]:self._offsets[k+1]] = self._observations[k]
+        del observations
+        # the estimation steps run in the workers, so the parent does not need the buffers of the default mode
+        self._release_buffers()
+
+        self._process_chunks = self._trajectory_chunks(nprocesses)
+        self._process_pool = Pool(len(self._process_chunks), initializer=_init_process,
+                                  initargs=(raw_observations, dtype, self._offsets))
+        self._gamma0_sum = np.zeros((self._nstates))
+        try:
+            return self.fit(checkpoint=checkpoint, checkpoint_interval=checkpoint_interval, resume=resume)
+        finally:
+            self._process_pool.close()
+            self._process_pool.join()
+            self._process_pool = None
+            self._process_chunks = None
+
+
+def _buffer(buffers, name, shape):
+    """ Returns the named buffer from the dictionary buffers, which is only reallocated when it is too small """
+    size = shape[0] * shape[1]
+    buf = buffers.get(name)
+    if buf is None or buf.size < size:
+        buf = np.zeros((size), config.dtype)
+        buffers[name] = buf
+    return buf[:size].reshape(shape)
+
+
+def _forward_backward_statistics(A, pi, output_model, observations, offsets, checkpointed=False, buffers=None):
+    """
+    Runs the forward-backward algorithm on concatenated trajectories and reduces them to sufficient statistics
+
+    The state probabilities of the trajectories are only held in a buffer of length offsets[-1], or segment-wise
+    in checkpointed mode, and are reduced to the statistics of the M-step straight away.
+
+    Parameters
+    ----------
+    A : ndarray(N,N, dtype=float)
+        transition matrix of the hidden states
+    pi : ndarray(N, dtype=float)
+        initial distribution of hidden states
+    output_model : OutputModel
+        output model that supports sufficient statistics
+    observations : ndarray(T)
+        concatenated observation trajectories
+    offsets : ndarray(K+1, dtype=int)
+        trajectory start indexes into observations, followed by the total length
+    checkpointed : bool, optional, default=False
+        If True, each trajectory is processed with the checkpointed forward-backward algorithm
+    buffers : dict, optional, default=None
+        output and state probability buffers that are reused by subsequent calls
+
+    Returns
+    -------
+    logprobs : ndarray(K, dtype=float)
+        The log-probability of each observation sequence given the HMM parameters
+    C : ndarray(N,N, dtype=float)
+        the Baum-Welch transition count matrix, summed over the trajectories
+    gamma0_sum : ndarray(N, dtype=float)
+        state probabilities at the first time step, summed over the trajectories
+    statistics : object
+        sufficient statistics of the output model
+
+    """
+    if buffers is None:
+        buffers = {}
+    N = len(pi)
+    K = len(offsets) - 1
+    logprobs = np.zeros((K))
+    C = np.zeros((N,N), config.dtype)
+    gamma0_sum = np.zeros((N))
+    statistics = output_model._init_sufficient_statistics()
+    if checkpointed:
+        C_k = np.zeros((N,N), config.dtype)
+        for k in range(K):
+            obs = observations[offsets[k]:offsets[k+1]]
+
+            def p_obs(t0, t1):
+                if config.logspace:
+                    return output_model.log_p_obs(obs[t0:t1])
+                return output_model.p_obs(obs[t0:t1])
+
+            def add_statistics(t0, t1, gamma):
+                if t0 == 0:
+                    gamma0_sum[:] += gamma[0]
+                output_model._add_sufficient_statistics(statistics, obs[t0:t1], gamma)
+
+            logprobs[k] = hidden.forward_backward_checkpointed(A, pi, len(obs), p_obs,
+                                                               gamma_callback=add_statistics, C_out=C_k)[0]
+            C += C_k
+        return logprobs, C, gamma0_sum, statistics
+
+    T = offsets[-1]
+    gamma = _buffer(buffers, 'gamma', (T, N))
+    if output_model.model_type == 'gaussian':
+        logprobs[:] = hidden.forward_backward_batch_gaussian(A, observations, output_model.means, output_model.sigmas,
+                                                             pi, offsets, gamma_out=gamma, C_out=C)[0]
+    else:
+        pobs = _buffer(buffers, 'pobs', (T, N))
+        if config.logspace:
+            output_model.log_p_obs(observations, out=pobs)
+        else:
+            output_model.p_obs(observations, out=pobs)
+        logprobs[:] = hidden.forward_backward_batch(A, pobs, pi, offsets, gamma_out=gamma, C_out=C)[0]
+    gamma0_sum += np.sum(gamma[offsets[:-1]], axis=0)
+    output_model._add_sufficient_statistics(statistics, observations, gamma)
+    return logprobs, C, gamma0_sum, statistics
+
+
+def _estimate_transition_model(C, gamma0_sum, reversible, stationary, fixed_stationary_distribution=None,
+                               fixed_initial_distribution=None):
+    """
+    Estimates the hidden transition matrix and the stationary or initial distribution from sufficient statistics
+
+    Parameters
+    ----------
+    C : ndarray(N,N, dtype=float)
+        the Baum-Welch transition count matrix, summed over all hidden state trajectories
+    gamma0_sum : ndarray(N, dtype=float)
+        state probabilities at the first time step, summed over all hidden state trajectories
+    reversible : bool
+        If True, the transition matrix is estimated under the detailed balance constraint
+    stationary : bool
+        If True, pi is the stationary distribution of the transition matrix. Otherwise, pi is the initial
+        distribution estimated from gamma0_sum.
+    fixed_stationary_distribution : ndarray(N), optional, default=None
+        stationary distribution that constrains the transition matrix
+    fixed_initial_distribution : ndarray(N), optional, default=None
+        initial distribution of non-stationary models that is not estimated
+
+    Returns
+    -------
+    T : ndarray(N,N, dtype=float)
+        transition matrix
+    pi : ndarray(N, dtype=float)
+        stationary or initial distribution
+
+    """
+    # Model parameters are always estimated in double precision, also when the hidden state kernels run in single
+    # precision.
+    C = np.asarray(C, dtype=np.float64)
+    from bhmm.msm.tmatrix_disconnected import estimate_P,stationary_distribution
+    T = estimate_P(C, reversible=reversible, fixed_statdist=fixed_stationary_distribution)
+    if stationary:
+        if fixed_stationary_distribution is None:
+            pi = stationary_distribution(C,T)
+        else:
+            pi = fixed_stationary_distribution
+    else:
+        if fixed_initial_distribution is None:
+            pi = gamma0_sum / np.sum(gamma0_sum)
+        else:
+            pi = fixed_initial_distribution
+    return T, pi
+
+
+# Data of the worker processes of MaximumLikelihoodEstimator.fit_parallel. Each process holds the shared
+# observations, the trajectory offsets and its own buffers.
+_process_data = {}
+
+
+def _init_process(raw_observations, dtype, offsets):
+    """ Initializes a worker process with the observations in shared memory """
+    _process_data.clear()
+    _process_data['observations'] = np.frombuffer(raw_observations, dtype=dtype)
+    _process_data['offsets'] = offsets
+    _process_data['buffers'] = {}
+
+
+def _forward_backward_process(task):
+    """
+    Runs the forward-backward algorithm on the trajectories k0:k1 in a worker process
+
+    Returns the log-likelihoods and sufficient statistics of these trajectories, see _forward_backward_statistics.
+
+    """
+    k0, k1, A, pi, output_model, checkpointed = task
+    offsets = _process_data['offsets']
+    t0, t1 = offsets[k0], offsets[k1]
+    return _forward_backward_statistics(A, pi, output_model, _process_data['observations'][t0:t1],
+                                        offsets[k0:k1+1] - t0, checkpointed=checkpointed,
+                                        buffers=_process_data['buffers'])
@@ -0,0 +1,199 @@
+"""
+Online maximum-likelihood estimation of hidden Markov models
+
+"""
+
+__author__ = "Frank Noe and John D. Chodera"
+__copyright__ = "Copyright 2015, John D. Chodera and Frank Noe"
+__credits__ = ["Frank Noe", "John D. Chodera"]
+__license__ = "LGPL"
+__maintainer__ = "Frank Noe"
+__email__="frank DOT noe AT fu-berlin DOT de"
+
+import copy
+import numpy as np
+
+import bhmm
+import bhmm.hidden as hidden
+from bhmm.estimators.maximum_likelihood import _forward_backward_statistics, _estimate_transition_model
+from bhmm.util.logger import logger
+from bhmm.util import config
+
+class OnlineMaximumLikelihoodEstimator(object):
+    """
+    Online maximum-likelihood hidden Markov model (HMM) estimation with mini-batch EM.
+
+    Observation trajectories are consumed in mini-batches. For each batch, the estimation step is done with the
+    current model, and the sufficient statistics of the batch are blended into running statistics with a decaying
+    step size eta_b = (b + delay)^(-decay), where b is the number of previous batches. The model is then estimated
+    from the running statistics [1]. Old batches are never revisited, so the cost per batch does not grow with the
+    size of the data set.
+
+    The first batch replaces the statistics of the initial model. With discrete output models, symbols that do not
+    occur in the first batch therefore get zero output probability, and the first batch must contain all symbols.
+
+    Examples
+    --------
+
+    >>> import bhmm
+    >>> bhmm.config.verbose = False
+    >>>
+    >>> from bhmm import testsystems
+    >>> [model, O, S] = testsystems.generate_synthetic_observations(ntrajectories=10, length=1000)
+    >>> estimator = OnlineMaximumLikelihoodEstimator(model.nstates, initial_model=model)
+    >>> batches = [O[i:i+2] for i in range(0, 10, 2)]
+    >>> model = estimator.fit(batches)
+
+    References
+    ----------
+    [1] O. Cappe and E. Moulines, "On-line expectation-maximization algorithm for latent data models,"
+        J. R. Statist. Soc. B, vol. 71, pp. 593-613, 2009.
+
+    """
+    def __init__(self, nstates, initial_model=None, type='gaussian', reversible=True, p=None, decay=0.6, delay=1.0):
+        """Initialize an online maximum-likelihood estimator.
+
+        Parameters
+        ----------
+        nstates : int
+            The number of states in the model.
+        initial_model : HMM, optional, default=None
+            If specified, the given initial model will be used to initialize the estimation.
+            Otherwise, a heuristic scheme is used to generate an initial guess from the first batch.
+        type : str, optional, default='gaussian'
+            Output model type from ['gaussian', 'discrete']. Only used if no initial model is given.
+        reversible : bool, optional, default=True
+            If True, the transition matrix is estimated under the detailed balance constraint. Only used if no
+            initial model is given.
+        p : ndarray (nstates), optional, default=None
+            Fixed stationary distribution. If given, transition matrices will be estimated with the constraint that
+            they have p as their stationary distribution.
+        decay : float, optional, default=0.6
+            Exponent of the step size eta_b = (b + delay)^(-decay). Must be in (0.5, 1]. Smaller values forget old
+            batches faster.
+        delay : float, optional, default=1.0
+            Offset of the step size eta_b = (b + delay)^(-decay). Must be at least 1. Larger values give smaller
+            step sizes, i.e. more averaging over batches, but the batches that have been processed with a poor
+            early model are forgotten more slowly.
+
+        """
+        if not (0.5 < decay <= 1.0):
+            raise ValueError('decay must be in (0.5, 1], but is '+str(decay))
+        if delay < 1.0:
+            raise ValueError('delay must be at least 1, but is '+str(delay))
+        self._nstates = nstates
+        self._type = type
+        self._reversible = reversible
+        self._fixed_stationary_distribution = None
+        if p is not None:
+            self._fixed_stationary_distribution = np.array(p)
+        self._decay = decay
+        self._delay = delay
+
+        self._hmm = None
+        if initial_model is not None:
+            self._hmm = copy.deepcopy(initial_model)
+            self._reversible = self._hmm.is_reversible
+
+        # running sufficient statistics
+        self._C = None
+        self._gamma0_sum = None
+        self._output_statistics = None
+        self._nbatches = 0
+        self._likelihoods = []
+
+    @property
+    def hmm(self):
+        r""" The current HMM estimate """
+        return self._hmm
+
+    @property
+    def nbatches(self):
+        r""" Number of batches processed so far """
+        return self._nbatches
+
+    @property
+    def stepsize(self):
+        r""" Step size with which the next batch will be blended into the running statistics """
+        return (self._nbatches + self._delay) ** (-self._decay)
+
+    @property
+    def likelihoods(self):
+        r""" Log-likelihood of each batch given the model before it was updated with that batch """
+        return np.array(self._likelihoods)
+
+    def partial_fit(self, batch):
+        """
+        Updates the model with a mini-batch of observation trajectories
+
+        Parameters
+        ----------
+        batch : list of numpy arrays representing temporal data
+            `batch[i]` is a 1d numpy array corresponding to an observed trajectory
+
+        Returns
+        -------
+        model : HMM
+            The updated HMM model.
+
+        """
+        if self._hmm is None:
+            self._hmm = bhmm.init_hmm(batch, self._nstates, type=self._type)
+        hidden.set_implementation(config.kernel, logspace=config.logspace)
+        self._hmm.output_model.set_implementation(config.kernel)
+
+        # estimation step on the batch with the current model
+        A = self._hmm.transition_matrix
+        pi = self._hmm.initial_distribution
+        output_model = self._hmm.output_model
+        offsets = hidden.trajectory_offsets([len(obs) for obs in batch])
+        logprobs, C, gamma0_sum, statistics = _forward_backward_statistics(A, pi, output_model,
+                                                                           np.concatenate(batch), offsets)
+        if not np.all(np.isfinite(logprobs)):
+            raise ValueError('Batch '+str(self._nbatches)+' contains observations that are impossible under the '
+                             'current model. For discrete output models, all symbols must occur in the first batch.')
+
+        # blend batch statistics into running statistics
+        eta = self.stepsize
+        if self._nbatches == 0:
+            self._C = np.array(C, dtype=np.float64)
+            self._gamma0_sum = gamma0_sum
+            self._output_statistics = statistics
+        else:
+            self._C = (1.0 - eta) * self._C + eta * C
+            self._gamma0_sum = (1.0 - eta) * self._gamma0_sum + eta * gamma0_sum
+            output_statistics = output_model._init_sufficient_statistics()
+            output_model._merge_sufficient_statistics(output_statistics, self._output_statistics, weight=1.0-eta)
+            output_model._merge_sufficient_statistics(output_statistics, statistics, weight=eta)
+            self._output_statistics = output_statistics
+        self._nbatches += 1
+        self._likelihoods.append(np.sum(logprobs))
+        logger().info("batch "+str(self._nbatches)+" ll = "+str(np.sum(logprobs))+" step size = "+str(eta))
+
+        # maximization step from running statistics. Non-stationary models get the initial distribution of the
+        # running state probabilities at the first time steps.
+        T, pi = _estimate_transition_model(self._C, self._gamma0_sum, self._reversible, self._hmm.is_stationary,
+                                           fixed_stationary_distribution=self._fixed_stationary_distribution)
+        self._hmm.update(T, pi)
+        output_model._estimate_output_model_from_statistics(self._output_statistics)
+        return self._hmm
+
+    def fit(self, batches):
+        """
+        Updates the model with all mini-batches of an iterable
+
+        Parameters
+        ----------
+        batches : iterable of lists of numpy arrays
+            each element is a mini-batch as accepted by partial_fit. Can be a generator, so that batches are
+            only loaded when they are processed.
+
+        Returns
+        -------
+        model : HMM
+            The updated HMM model.
+
+        """
+        for batch in batches:
+            self.partial_fit(batch)
+        return self._hmm
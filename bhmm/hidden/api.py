@@ -29,8 +29,11 @@ __IMPL_C__ = 1
 # implementation used
 __impl__= __IMPL_PYTHON__
 
+# if True, all pobs arguments are logarithms of observation probabilities
+__logspace__ = False
 
-def set_implementation(impl):
+
+def set_implementation(impl, logspace=False):
     """
     Sets the implementation of this module
 
@@ -38,9 +41,15 @@ def set_implementation(impl):
     ----------
     impl : str
         One of ["python", "c"]
+    logspace : bool, optional, default = False
+        If True, the kernels expect log observation probabilities in all pobs arguments. Use this when the
+        observation probabilities are too small to be represented, e.g. for very peaked output distributions
+        or in single precision. Each row of log observation probabilities is shifted by its maximum before
+        it is exponentiated, so all other results are the same as in the default mode.
 
     """
-    global __impl__
+    global __impl__, __logspace__
+    __logspace__ = logspace
     if impl.lower() == 'python':
         __impl__ = __IMPL_PYTHON__
     elif impl.lower() == 'c':
@@ -60,7 +69,8 @@ def forward(A, pobs, pi, T=None, alpha_out=None):
     A : ndarray((N,N), dtype = float)
         transition matrix of the hidden states
     pobs : ndarray((T,N), dtype = float)
-        pobs[t,i] is the observation probability for observation at time t given hidden state i
+        pobs[t,i] is the observation probability for observation at time t given hidden state i, or its
+        logarithm if the log-space mode has been selected with :func:`set_implementation`
     pi : ndarray((N), dtype = float)
         initial distribution of hidden states
     T : int, optional, default = None
@@ -79,13 +89,46 @@ def forward(A, pobs, pi, T=None, alpha_out=None):
 
     """
     if __impl__ == __IMPL_PYTHON__:
-        return ip.forward(A, pobs, pi, T=T, alpha_out=alpha_out, dtype=config.dtype)
+        return ip.forward(A, pobs, pi, T=T, alpha_out=alpha_out, dtype=config.dtype, logspace=__logspace__)
     elif __impl__ == __IMPL_C__:
-        return ic.forward(A, pobs, pi, T=T, alpha_out=alpha_out, dtype=config.dtype)
+        return ic.forward(A, pobs, pi, T=T, alpha_out=alpha_out, dtype=config.dtype, logspace=__logspace__)
     else:
         raise RuntimeError('Nonexisting implementation selected: '+str(__impl__))
 
 
+def loglikelihood(A, pobs, pi, T=None):
+    """Compute log P( obs | A, B, pi ) without storing the forward coefficients.
+
+    Runs the forward recursion while keeping only the current forward row, so the memory requirement is O(N)
+    instead of the O(T N) of :func:`forward`. Use this function when only the likelihood is needed, e.g. for
+    scoring models on held-out data.
+
+    Parameters
+    ----------
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    pobs : ndarray((T,N), dtype = float)
+        pobs[t,i] is the observation probability for observation at time t given hidden state i, or its
+        logarithm if the log-space mode has been selected with :func:`set_implementation`
+    pi : ndarray((N), dtype = float)
+        initial distribution of hidden states
+    T : int, optional, default = None
+        trajectory length. If not given, T = pobs.shape[0] will be used.
+
+    Returns
+    -------
+    logprob : float
+        The probability to observe the sequence `ob` with the model given
+        by `A`, `B` and `pi`.
+
+    """
+    if __impl__ == __IMPL_PYTHON__:
+        return ip.loglikelihood(A, pobs, pi, T=T, dtype=config.dtype, logspace=__logspace__)
+    elif __impl__ == __IMPL_C__:
+        return ic.loglikelihood(A, pobs, pi, T=T, dtype=config.dtype, logspace=__logspace__)
+    else:
+        raise RuntimeError('Nonexisting implementation selected: '+str(__impl__))
+
 def backward(A, pobs, T=None, beta_out=None):
     """Compute all backward coefficients. With scaling!
 
@@ -94,7 +137,8 @@ def backward(A, pobs, T=None, beta_out=None):
     A : ndarray((N,N), dtype = float)
         transition matrix of the hidden states
     pobs : ndarray((T,N), dtype = float)
-        pobs[t,i] is the observation probability for observation at time t given hidden state i
+        pobs[t,i] is the observation probability for observation at time t given hidden state i, or its
+        logarithm if the log-space mode has been selected with :func:`set_implementation`
     T : int, optional, default = None
         trajectory length. If not given, T = pobs.shape[0] will be used.
     beta_out : ndarray((T,N), dtype = float), optional, default = None
@@ -108,9 +152,9 @@ def backward(A, pobs, T=None, beta_out=None):
 
     """
     if __impl__ == __IMPL_PYTHON__:
-        return ip.backward(A, pobs, T=T, beta_out=beta_out, dtype=config.dtype)
+        return ip.backward(A, pobs, T=T, beta_out=beta_out, dtype=config.dtype, logspace=__logspace__)
     elif __impl__ == __IMPL_C__:
-        return ic.backward(A, pobs, T=T, beta_out=beta_out, dtype=config.dtype)
+        return ic.backward(A, pobs, T=T, beta_out=beta_out, dtype=config.dtype, logspace=__logspace__)
     else:
         raise RuntimeError('Nonexisting implementation selected: '+str(__impl__))
 
@@ -234,7 +278,8 @@ def transition_counts(alpha, beta, A, pobs, T = None, out = None):
     A : ndarray((N,N), dtype = float)
         transition matrix of the hidden states
     pobs : ndarray((T,N), dtype = float)
-        pobs[t,i] is the observation probability for observation at time t given hidden state i
+        pobs[t,i] is the observation probability for observation at time t given hidden state i, or its
+        logarithm if the log-space mode has been selected with :func:`set_implementation`
     T : int
         number of time steps
     out : ndarray((N,N), dtype = float), optional, default = None
@@ -252,24 +297,524 @@ def transition_counts(alpha, beta, A, pobs, T = None, out = None):
 
     """
     if __impl__ == __IMPL_PYTHON__:
-        return ip.transition_counts(alpha, beta, A, pobs, T=T, out=out, dtype=config.dtype)
+        return ip.transition_counts(alpha, beta, A, pobs, T=T, out=out, dtype=config.dtype, logspace=__logspace__)
     elif __impl__ == __IMPL_C__:
-        return ic.transition_counts(alpha, beta, A, pobs, T=T, out=out, dtype=config.dtype)
+        return ic.transition_counts(alpha, beta, A, pobs, T=T, out=out, dtype=config.dtype, logspace=__logspace__)
     else:
         raise RuntimeError('Nonexisting implementation selected: '+str(__impl__))
 
 
-def viterbi(A, pobs, pi):
+def forward_backward_batch(A, pobs, pi, offsets, gamma_out=None, C_out=None):
+    """ Run the forward-backward algorithm on many trajectories in a single kernel call.
+
+    All trajectories are passed as one concatenated pobs array, and trajectory k occupies the rows
+    offsets[k]:offsets[k+1]. This avoids the per-call overhead of forward, backward, state_probabilities and
+    transition_counts when many short trajectories are processed.
+
+    Parameters
+    ----------
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    pobs : ndarray((sum_k T_k,N), dtype = float)
+        observation probabilities of all K trajectories, concatenated along the time axis, or their
+        logarithms if the log-space mode has been selected with :func:`set_implementation`
+    pi : ndarray((N), dtype = float)
+        initial distribution of hidden states
+    offsets : ndarray((K+1), dtype = int)
+        trajectory start indexes into pobs, followed by the total length. Use :func:`trajectory_offsets` to
+        compute them from the trajectory lengths.
+    gamma_out : ndarray((sum_k T_k,N), dtype = float), optional, default = None
+        containter for the state probabilities. If None, a new container will be created.
+    C_out : ndarray((N,N), dtype = float), optional, default = None
+        containter for the summed transition count matrix. If None, a new matrix will be created.
+
+    Returns
+    -------
+    logprobs : ndarray((K), dtype = float)
+        logprobs[k] is the log-likelihood of trajectory k
+    gamma : ndarray((sum_k T_k,N), dtype = float)
+        state probabilities of all trajectories, concatenated in the same way as pobs
+    C : ndarray((N,N), dtype = float)
+        transition counts summed over all trajectories
+
+    See Also
+    --------
+    forward, backward, state_probabilities, transition_counts : single-trajectory kernels
+
+    """
+    if __impl__ == __IMPL_PYTHON__:
+        return ip.forward_backward_batch(A, pobs, pi, offsets, gamma_out=gamma_out, C_out=C_out, dtype=config.dtype, logspace=__logspace__)
+    elif __impl__ == __IMPL_C__:
+        return ic.forward_backward_batch(A, pobs, pi, offsets, gamma_out=gamma_out, C_out=C_out, dtype=config.dtype, logspace=__logspace__)
+    else:
+        raise RuntimeError('Nonexisting implementation selected: '+str(__impl__))
+
+
+def forward_backward_batch_gaussian(A, obs, means, sigmas, pi, offsets, gamma_out=None, C_out=None):
+    """ Run the forward-backward algorithm with a one-dimensional Gaussian output model on many trajectories.
+
+    Same as :func:`forward_backward_batch` with the observation probabilities of a Gaussian output model, but the
+    Gaussian densities are evaluated inside the forward and backward recursions, so the (sum_k T_k,N) array of
+    observation probabilities is never created. The densities are evaluated in log space, so the result is safe
+    from underflow regardless of the log-space mode selected with :func:`set_implementation`.
+
+    Parameters
+    ----------
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    obs : ndarray((sum_k T_k), dtype = float)
+        observations of all K trajectories, concatenated along the time axis
+    means : ndarray((N), dtype = float)
+        means of the Gaussian output distributions of the hidden states
+    sigmas : ndarray((N), dtype = float)
+        standard deviations of the Gaussian output distributions of the hidden states
+    pi : ndarray((N), dtype = float)
+        initial distribution of hidden states
+    offsets : ndarray((K+1), dtype = int)
+        trajectory start indexes into obs, followed by the total length. Use :func:`trajectory_offsets` to
+        compute them from the trajectory lengths.
+    gamma_out : ndarray((sum_k T_k,N), dtype = float), optional, default = None
+        containter for the state probabilities. If None, a new container will be created.
+    C_out : ndarray((N,N), dtype = float), optional, default = None
+        containter for the summed transition count matrix. If None, a new matrix will be created.
+
+    Returns
+    -------
+    logprobs : ndarray((K), dtype = float)
+        logprobs[k] is the log-likelihood of trajectory k
+    gamma : ndarray((sum_k T_k,N), dtype = float)
+        state probabilities of all trajectories, concatenated in the same way as obs
+    C : ndarray((N,N), dtype = float)
+        transition counts summed over all trajectories
+
+    """
+    if __impl__ == __IMPL_PYTHON__:
+        return ip.forward_backward_batch_gaussian(A, obs, means, sigmas, pi, offsets, gamma_out=gamma_out, C_out=C_out, dtype=config.dtype)
+    elif __impl__ == __IMPL_C__:
+        return ic.forward_backward_batch_gaussian(A, obs, means, sigmas, pi, offsets, gamma_out=gamma_out, C_out=C_out, dtype=config.dtype)
+    else:
+        raise RuntimeError('Nonexisting implementation selected: '+str(__impl__))
+
+def loglikelihood_batch(A, pobs, pi, offsets):
+    """Compute the log-likelihoods of many trajectories in a single kernel call.
+
+    Same as calling :func:`loglikelihood` for each trajectory, with the trajectories concatenated as in
+    :func:`forward_backward_batch`.
+
+    Parameters
+    ----------
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    pobs : ndarray((sum_k T_k,N), dtype = float)
+        observation probabilities of all K trajectories, concatenated along the time axis, or their
+        logarithms if the log-space mode has been selected with :func:`set_implementation`
+    pi : ndarray((N), dtype = float)
+        initial distribution of hidden states
+    offsets : ndarray((K+1), dtype = int)
+        trajectory start indexes into pobs, followed by the total length. Use :func:`trajectory_offsets` to
+        compute them from the trajectory lengths.
+
+    Returns
+    -------
+    logprobs : ndarray((K), dtype = float)
+        logprobs[k] is the log-likelihood of trajectory k
+
+    """
+    if __impl__ == __IMPL_PYTHON__:
+        return ip.loglikelihood_batch(A, pobs, pi, offsets, dtype=config.dtype, logspace=__logspace__)
+    elif __impl__ == __IMPL_C__:
+        return ic.loglikelihood_batch(A, pobs, pi, offsets, dtype=config.dtype, logspace=__logspace__)
+    else:
+        raise RuntimeError('Nonexisting implementation selected: '+str(__impl__))
+
+
+def loglikelihood_batch_gaussian(A, obs, means, sigmas, pi, offsets):
+    """Compute the log-likelihoods of many trajectories with a one-dimensional Gaussian output model.
+
+    Same as :func:`loglikelihood_batch` with the observation probabilities of a Gaussian output model, which
+    are evaluated on the fly as in :func:`forward_backward_batch_gaussian`.
+
+    Parameters
+    ----------
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    obs : ndarray((sum_k T_k), dtype = float)
+        observations of all K trajectories, concatenated along the time axis
+    means : ndarray((N), dtype = float)
+        means of the Gaussian output distributions of the hidden states
+    sigmas : ndarray((N), dtype = float)
+        standard deviations of the Gaussian output distributions of the hidden states
+    pi : ndarray((N), dtype = float)
+        initial distribution of hidden states
+    offsets : ndarray((K+1), dtype = int)
+        trajectory start indexes into obs, followed by the total length. Use :func:`trajectory_offsets` to
+        compute them from the trajectory lengths.
+
+    Returns
+    -------
+    logprobs : ndarray((K), dtype = float)
+        logprobs[k] is the log-likelihood of trajectory k
+
+    """
+    if __impl__ == __IMPL_PYTHON__:
+        return ip.loglikelihood_batch_gaussian(A, obs, means, sigmas, pi, offsets, dtype=config.dtype)
+    elif __impl__ == __IMPL_C__:
+        return ic.loglikelihood_batch_gaussian(A, obs, means, sigmas, pi, offsets, dtype=config.dtype)
+    else:
+        raise RuntimeError('Nonexisting implementation selected: '+str(__impl__))
+
+def trajectory_offsets(lengths):
+    """ Offsets of trajectories with the given lengths in a concatenated array
+
+    Parameters
+    ----------
+    lengths : list of int
+        trajectory lengths T_k
+
+    Returns
+    -------
+    offsets : ndarray((K+1), dtype = int)
+        offsets[k] is the start index of trajectory k and offsets[K] is the total length
+
+    """
+    offsets = np.zeros((len(lengths)+1), dtype=int)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def forward_backward_checkpointed(A, pi, T, p_obs, gamma_callback=None, segment_length=None, C_out=None):
+    """ Run the forward-backward algorithm on a single long trajectory with O(sqrt(T)) memory.
+
+    The trajectory is split into segments of length L (sqrt(T) by default). The forward pass only stores the
+    forward coefficients at the last time step of each segment. The backward pass runs over the segments in
+    reverse order, recomputes the forward coefficients of each segment from its checkpoint, and passes the state
+    probabilities of the segment to gamma_callback. Observation probabilities are requested segment-wise from
+    p_obs, so neither pobs nor gamma of the whole trajectory are ever held in memory. This costs one additional
+    forward pass and one additional evaluation of the observation probabilities.
+
+    Parameters
+    ----------
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    pi : ndarray((N), dtype = float)
+        initial distribution of hidden states
+    T : int
+        trajectory length
+    p_obs : callable
+        p_obs(t0, t1) returns the ndarray((t1-t0,N), dtype = float) of observation probabilities (or their
+        logarithms in the log-space mode) for the time steps t0 to t1-1.
+    gamma_callback : callable, optional, default = None
+        gamma_callback(t0, t1, gamma) is called once for every segment with the state probabilities of the time
+        steps t0 to t1-1. Segments are passed in reverse order, and gamma is only valid during the call.
+    segment_length : int, optional, default = None
+        number of time steps per segment. If None, ceil(sqrt(T)) is used.
+    C_out : ndarray((N,N), dtype = float), optional, default = None
+        containter for the transition count matrix. If None, a new matrix will be created.
+
+    Returns
+    -------
+    logprob : float
+        The log-likelihood of the trajectory
+    state_counts : ndarray((N), dtype = float)
+        state_counts[i] is the summed probability to be in state i
+    C : ndarray((N,N), dtype = float)
+        counts[i, j] is the summed probability to transition from i to j
+
+    See Also
+    --------
+    forward_backward_batch : fast forward-backward when all trajectories fit into memory
+
+    """
+    N = A.shape[0]
+    if segment_length is None:
+        segment_length = max(1, int(np.ceil(np.sqrt(T))))
+    L = segment_length
+    starts = list(range(0, T, L))
+    # checkpoints: forward coefficients at the last time step of each segment
+    checkpoints = np.zeros((len(starts),N), dtype=config.dtype)
+    # workspace. Segments are extended by the first time step of the next segment.
+    alpha = np.zeros((L+1,N), dtype=config.dtype)
+    beta = np.zeros((L+1,N), dtype=config.dtype)
+    gamma = np.zeros((L,N), dtype=config.dtype)
+    pobs = np.zeros((L+1,N), dtype=config.dtype)
+    C = np.zeros((N,N), dtype=config.dtype)
+    if C_out is None:
+        C_out = np.zeros((N,N), dtype=config.dtype)
+    else:
+        C_out[:] = 0.0
+    state_counts = np.zeros((N), dtype=np.float64)
+
+    # forward pass. Continuing the recursion of the previous segment is equivalent to starting with the
+    # initial distribution alpha(t0-1) A.
+    logprob = 0.0
+    for s, t0 in enumerate(starts):
+        n = min(t0 + L, T) - t0
+        pobs[:n] = p_obs(t0, t0+n)
+        p0 = pi if s == 0 else np.dot(checkpoints[s-1], A)
+        logprob += forward(A, pobs, p0, T=n, alpha_out=alpha)[0]
+        checkpoints[s] = alpha[n-1]
+
+    # backward pass
+    pobs_next = np.zeros((N), dtype=config.dtype)
+    beta_next = np.zeros((N), dtype=config.dtype)
+    for s in range(len(starts)-1, -1, -1):
+        t0 = starts[s]
+        n = min(t0 + L, T) - t0
+        pobs[:n] = p_obs(t0, t0+n)
+        p0 = pi if s == 0 else np.dot(checkpoints[s-1], A)
+        forward(A, pobs, p0, T=n, alpha_out=alpha)
+        if s == len(starts)-1:
+            backward(A, pobs, T=n, beta_out=beta)
+            Tc = n
+        else:
+            # the backward recursion is started from beta(t0+n), which enters like the observation probability
+            # of an additional time step that is followed by a uniform beta.
+            if __logspace__:
+                with np.errstate(divide='ignore'):
+                    pobs[n] = pobs_next + np.log(beta_next)
+            else:
+                pobs[n] = pobs_next * beta_next
+            backward(A, pobs, T=n+1, beta_out=beta)
+            # transition counts include the transition into the next segment
+            pobs[n] = pobs_next
+            beta[n] = beta_next
+            Tc = n+1
+        C_out += transition_counts(alpha, beta, A, pobs, T=Tc, out=C)
+        state_probabilities(alpha[:n], beta[:n], gamma_out=gamma[:n])
+        state_counts += np.sum(gamma[:n], axis=0)
+        if gamma_callback is not None:
+            gamma_callback(t0, t0+n, gamma[:n])
+        # carry over to the previous segment
+        pobs_next[:] = pobs[0]
+        beta_next[:] = beta[0]
+
+    return logprob, state_counts, C_out
+
+
+def transfer_matrix(A, pobs, T=None, out=None):
+    """ Compute the transfer matrix of a trajectory segment, i.e. the product of A diag(pobs[t]) over all t.
+
+    The forward coefficients after the segment are proportional to alpha P, where alpha are the forward
+    coefficients before the segment. Likewise, the backward coefficients before the segment are proportional to
+    P beta. The matrix is only defined up to a constant factor, and is scaled such that its largest element is 1.
+
+    Parameters
+    ----------
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    pobs : ndarray((T,N), dtype = float)
+        pobs[t,i] is the observation probability for observation at time t given hidden state i, or its
+        logarithm if the log-space mode has been selected with :func:`set_implementation`
+    T : int, optional, default = None
+        number of time steps. If not given, T = pobs.shape[0] will be used.
+    out : ndarray((N,N), dtype = float), optional, default = None
+        containter for the resulting matrix. If None, a new matrix will be created.
+
+    Returns
+    -------
+    P : ndarray((N,N), dtype = float)
+        transfer matrix of the segment
+
+    """
+    if __impl__ == __IMPL_PYTHON__:
+        return ip.transfer_matrix(A, pobs, T=T, out=out, dtype=config.dtype, logspace=__logspace__)
+    elif __impl__ == __IMPL_C__:
+        return ic.transfer_matrix(A, pobs, T=T, out=out, dtype=config.dtype, logspace=__logspace__)
+    else:
+        raise RuntimeError('Nonexisting implementation selected: '+str(__impl__))
+
+
+def _emission_row(pobs_row):
+    """ Observation probabilities of a single time step, rescaled to a maximum of 1 """
+    if __logspace__:
+        return np.exp(pobs_row - np.max(pobs_row))
+    return pobs_row / np.max(pobs_row)
+
+
+def forward_backward_parallel(A, pobs, pi, nsegments=None, nthreads=None, gamma_out=None, C_out=None):
+    """ Run the forward-backward algorithm on a single trajectory, parallelized over time.
+
+    The trajectory is split into segments. First, the transfer matrices of all segments are computed in
+    parallel (see :func:`transfer_matrix`). Combining them in a prefix scan over the segments gives the forward
+    coefficients at the end and the backward coefficients at the start of every segment. As there are only as
+    many segments as threads, the scan itself is cheap and done sequentially. Second, forward, backward, state
+    probabilities and transition counts of all segments are computed in parallel, starting from these
+    coefficients. The total work is increased by a factor of about N/2, so this pays off for few hidden states
+    and many cores.
+
+    Parameters
+    ----------
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    pobs : ndarray((T,N), dtype = float)
+        pobs[t,i] is the observation probability for observation at time t given hidden state i, or its
+        logarithm if the log-space mode has been selected with :func:`set_implementation`
+    pi : ndarray((N), dtype = float)
+        initial distribution of hidden states
+    nsegments : int, optional, default = None
+        number of segments. If None, one segment per thread is used.
+    nthreads : int, optional, default = None
+        number of threads. If None, the number of CPUs is used.
+    gamma_out : ndarray((T,N), dtype = float), optional, default = None
+        containter for the state probabilities. If None, a new container will be created.
+    C_out : ndarray((N,N), dtype = float), optional, default = None
+        containter for the transition count matrix. If None, a new matrix will be created.
+
+    Returns
+    -------
+    logprob : float
+        The log-likelihood of the trajectory
+    gamma : ndarray((T,N), dtype = float)
+        state probabilities
+    C : ndarray((N,N), dtype = float)
+        transition counts
+
+    See Also
+    --------
+    forward_backward_batch : forward-backward for many trajectories in a single thread
+
+    """
+    import multiprocessing
+    from multiprocessing.pool import ThreadPool
+    T, N = pobs.shape[0], A.shape[0]
+    if nthreads is None:
+        nthreads = multiprocessing.cpu_count()
+    if nsegments is None:
+        nsegments = nthreads
+    nsegments = max(1, min(nsegments, T))
+    # segment k contains the time steps bounds[k]:bounds[k+1]
+    bounds = [(k * T) // nsegments for k in range(nsegments + 1)]
+    if gamma_out is None:
+        gamma_out = np.zeros((T,N), dtype=config.dtype)
+    elif T > gamma_out.shape[0]:
+        raise ValueError('gamma_out must at least have length T in order to fit trajectory.')
+    if C_out is None:
+        C_out = np.zeros((N,N), dtype=config.dtype)
+    # the state at the first time step of each segment is treated separately, because the forward pass into a
+    # segment is initialized at the previous segment's last step, and the backward pass out of a segment is
+    # initialized at the next segment's first step.
+    def inner_transfer_matrix(k):
+        return transfer_matrix(A, pobs[bounds[k]+1:bounds[k+1]])
+
+    pool = ThreadPool(nthreads)
+    try:
+        P = pool.map(inner_transfer_matrix, range(nsegments))
+
+        # prefix scan of the forward coefficients at the last step of each segment
+        alpha_last = np.zeros((nsegments,N))
+        v = np.array(pi, dtype=np.float64)
+        for k in range(nsegments):
+            if k > 0:
+                v = np.dot(v, A)
+            v = np.dot(v * _emission_row(pobs[bounds[k]]), P[k])
+            alpha_last[k] = v / np.sum(v)
+            v = alpha_last[k]
+        # suffix scan of the backward coefficients at the first step of each segment
+        beta_first = np.zeros((nsegments,N))
+        v = np.ones((N)) / N
+        for k in range(nsegments-1, -1, -1):
+            v = np.dot(P[k], v)
+            beta_first[k] = v / np.sum(v)
+            v = np.dot(A, _emission_row(pobs[bounds[k]]) * beta_first[k])
+
+        def process_segment(k):
+            t0, t1 = bounds[k], bounds[k+1]
+            n = t1 - t0
+            last = (k == nsegments-1)
+            # segment extended by the first step of the next segment
+            pobs_k = np.zeros((n+1,N), dtype=config.dtype)
+            pobs_k[:n] = pobs[t0:t1]
+            alpha = np.zeros((n+1,N), dtype=config.dtype)
+            beta = np.zeros((n+1,N), dtype=config.dtype)
+            C = np.zeros((N,N), dtype=config.dtype)
+            p0 = pi if k == 0 else np.dot(alpha_last[k-1], A)
+            logprob = forward(A, pobs_k, p0, T=n, alpha_out=alpha)[0]
+            if last:
+                backward(A, pobs_k, T=n, beta_out=beta)
+                transition_counts(alpha, beta, A, pobs_k, T=n, out=C)
+            else:
+                # start the backward pass from the beta of the next segment's first step, as in
+                # forward_backward_checkpointed
+                if __logspace__:
+                    with np.errstate(divide='ignore'):
+                        pobs_k[n] = pobs[t1] + np.log(beta_first[k+1])
+                else:
+                    pobs_k[n] = pobs[t1] * beta_first[k+1]
+                backward(A, pobs_k, T=n+1, beta_out=beta)
+                pobs_k[n] = pobs[t1]
+                beta[n] = beta_first[k+1]
+                transition_counts(alpha, beta, A, pobs_k, T=n+1, out=C)
+            state_probabilities(alpha[:n], beta[:n], gamma_out=gamma_out[t0:t1])
+            return logprob, C
+
+        results = pool.map(process_segment, range(nsegments))
+    finally:
+        pool.close()
+        pool.join()
+
+    C_out[:] = 0.0
+    logprob = 0.0
+    for (logprob_k, C_k) in results:
+        logprob += logprob_k
+        C_out += C_k
+    return logprob, gamma_out, C_out
+
+
+def viterbi(A, pobs, pi, segment_length=None):
     """ Estimate the hidden pathway of maximum likelihood using the Viterbi algorithm.
 
+    The Viterbi scores are computed in log space, and the traceback table stores the state indexes in the smallest
+    integer type that fits the number of states.
+
     Parameters
     ----------
     A : ndarray((N,N), dtype = float)
         transition matrix of the hidden states
     pobs : ndarray((T,N), dtype = float)
-        pobs[t,i] is the observation probability for observation at time t given hidden state i
+        pobs[t,i] is the observation probability for observation at time t given hidden state i, or its
+        logarithm if the log-space mode has been selected with :func:`set_implementation`
+    pi : ndarray((N), dtype = float)
+        initial distribution of hidden states
+    segment_length : int, optional, default = None
+        if given, the traceback table only holds one segment of this length at a time, and the traceback of each
+        segment is recomputed from the Viterbi scores at its start. This reduces the memory of the traceback from
+        O(T N) to O(T/segment_length N + segment_length N) at the cost of a second pass over the trajectory.
+        A good choice for very long trajectories is int(sqrt(T)). By default, the full traceback is stored.
+
+    Returns
+    -------
+    q : numpy.array shape (T)
+        maximum likelihood hidden path
+
+    """
+    if __impl__ == __IMPL_PYTHON__:
+        return ip.viterbi(A, pobs, pi, segment_length=segment_length, dtype=config.dtype, logspace=__logspace__)
+    elif __impl__ == __IMPL_C__:
+        return ic.viterbi(A, pobs, pi, segment_length=segment_length, dtype=config.dtype, logspace=__logspace__)
+    else:
+        raise RuntimeError('Nonexisting implementation selected: '+str(__impl__))
+
+
+def viterbi_gaussian(A, obs, means, sigmas, pi, segment_length=None):
+    """ Estimate the hidden pathway of maximum likelihood for a one-dimensional Gaussian output model.
+
+    Same as :func:`viterbi` with the observation probabilities of a Gaussian output model, which are evaluated on
+    the fly as in :func:`forward_backward_batch_gaussian`.
+
+    Parameters
+    ----------
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    obs : ndarray((T), dtype = float)
+        observation trajectory
+    means : ndarray((N), dtype = float)
+        means of the Gaussian output distributions of the hidden states
+    sigmas : ndarray((N), dtype = float)
+        standard deviations of the Gaussian output distributions of the hidden states
     pi : ndarray((N), dtype = float)
         initial distribution of hidden states
+    segment_length : int, optional, default = None
+        segment length of the traceback, see :func:`viterbi`
 
     Returns
     -------
@@ -278,14 +823,42 @@ def viterbi(A, pobs, pi):
 
     """
     if __impl__ == __IMPL_PYTHON__:
-        return ip.viterbi(A, pobs, pi, dtype=config.dtype)
+        return ip.viterbi_gaussian(A, obs, means, sigmas, pi, segment_length=segment_length, dtype=config.dtype)
+    elif __impl__ == __IMPL_C__:
+        return ic.viterbi_gaussian(A, obs, means, sigmas, pi, segment_length=segment_length, dtype=config.dtype)
+    else:
+        raise RuntimeError('Nonexisting implementation selected: '+str(__impl__))
+
+
+def create_rng_state(seed, stream=0):
+    """ Creates the state of an independent random number stream for :func:`sample_path`
+
+    The sampling kernels use the xoshiro256** generator. Its state is initialized from the seed and the stream number,
+    so that e.g. each trajectory or thread can use its own stream. Both implementations produce the same random
+    numbers for the same state.
+
+    Parameters
+    ----------
+    seed : int
+        random seed
+    stream : int, optional, default = 0
+        stream number
+
+    Returns
+    -------
+    state : ndarray((4), dtype = np.uint64)
+        generator state. Advanced in place by every call to :func:`sample_path`.
+
+    """
+    if __impl__ == __IMPL_PYTHON__:
+        return ip.create_rng_state(seed, stream=stream)
     elif __impl__ == __IMPL_C__:
-        return ic.viterbi(A, pobs, pi, dtype=config.dtype)
+        return ic.create_rng_state(seed, stream=stream)
     else:
         raise RuntimeError('Nonexisting implementation selected: '+str(__impl__))
 
 
-def sample_path(alpha, A, pobs, T = None):
+def sample_path(alpha, A, pobs, T = None, rng_state = None):
     """ Sample the hidden pathway S from the conditional distribution P ( S | Parameters, Observations )
 
     Parameters
@@ -295,20 +868,62 @@ def sample_path(alpha, A, pobs, T = None):
     A : ndarray((N,N), dtype = float)
         transition matrix of the hidden states
     pobs : ndarray((T,N), dtype = float)
-        pobs[t,i] is the observation probability for observation at time t given hidden state i
+        pobs[t,i] is the observation probability for observation at time t given hidden state i, or its
+        logarithm if the log-space mode has been selected with :func:`set_implementation`
     T : int
         number of time steps
+    rng_state : ndarray((4), dtype = np.uint64), optional, default = None
+        random number generator state as created by :func:`create_rng_state`, which is advanced in place. Use
+        one state per thread when sampling from several threads. If None, a new state is seeded from numpy.random.
 
     Returns
     -------
     S : numpy.array shape (T)
-        maximum likelihood hidden path
+        sampled hidden path
+
+    """
+    if __impl__ == __IMPL_PYTHON__:
+        return ip.sample_path(alpha, A, pobs, T = T, rng_state = rng_state, dtype=config.dtype)
+    elif __impl__ == __IMPL_C__:
+        return ic.sample_path(alpha, A, pobs, T = T, rng_state = rng_state, dtype=config.dtype)
+    else:
+        raise RuntimeError('Nonexisting implementation selected: '+str(__impl__))
+
+
+def sample_paths(alpha, A, pobs, nsamples, T = None, rng_state = None):
+    """ Sample several hidden pathways S from the conditional distribution P ( S | Parameters, Observations )
+
+    All paths are drawn from the same forward coefficients, so that the O(T N^2) forward pass is done once for
+    many paths, e.g. for Rao-Blackwellized estimates or posterior-predictive checks. The random numbers, and hence
+    the paths, are the same as for nsamples calls of :func:`sample_path` with the same rng_state.
+
+    Parameters
+    ----------
+    alpha : ndarray((T,N), dtype = float), optional, default = None
+        alpha[t,i] is the ith forward coefficient of time t.
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    pobs : ndarray((T,N), dtype = float)
+        pobs[t,i] is the observation probability for observation at time t given hidden state i, or its
+        logarithm if the log-space mode has been selected with :func:`set_implementation`
+    nsamples : int
+        number of paths
+    T : int
+        number of time steps
+    rng_state : ndarray((4), dtype = np.uint64), optional, default = None
+        random number generator state as created by :func:`create_rng_state`, which is advanced in place. If None,
+        a new state is seeded from numpy.random.
+
+    Returns
+    -------
+    S : numpy.array shape (nsamples, T)
+        sampled hidden paths
 
     """
     if __impl__ == __IMPL_PYTHON__:
-        return ip.sample_path(alpha, A, pobs, T = T, dtype=config.dtype)
+        return ip.sample_paths(alpha, A, pobs, nsamples, T = T, rng_state = rng_state, dtype=config.dtype)
     elif __impl__ == __IMPL_C__:
-        return ic.sample_path(alpha, A, pobs, T = T, dtype=config.dtype)
+        return ic.sample_paths(alpha, A, pobs, nsamples, T = T, rng_state = rng_state, dtype=config.dtype)
     else:
         raise RuntimeError('Nonexisting implementation selected: '+str(__impl__))
 
@@ -1,7 +1,6 @@
 #include "_hidden.h"
 #include <stdio.h>
 #include <stdlib.h>
-#include <time.h>
 #include <math.h>
 
 #ifndef __DIMS__
@@ -13,123 +12,191 @@
 #endif
 
 
-double _forward(
-        double *alpha,
-        const double *A,
-        const double *pobs,
-        const double *pi,
-        int N, int T)
+/*
+ Viterbi traceback tables store state indexes in the smallest unsigned integer type that fits N
+*/
+static int _traceback_width(int N)
 {
-    int i, j, t;
-    double sum, logprob, scaling;
+    if (N <= 256)
+        return 1;
+    if (N <= 65536)
+        return 2;
+    return 4;
+}
 
-    // first alpha and scaling factors
-    scaling = 0.0;
-    for (i = 0; i < N; i++) {
-        alpha[i]  = pi[i] * pobs[i];
-        scaling += alpha[i];
-    }
+static void _traceback_set(char *row, int width, int j, int i)
+{
+    if (width == 1)
+        ((unsigned char*) row)[j] = (unsigned char) i;
+    else if (width == 2)
+        ((unsigned short*) row)[j] = (unsigned short) i;
+    else
+        ((int*) row)[j] = i;
+}
 
-    // initialize likelihood
-    logprob = log(scaling);
+static int _traceback_get(const char *row, int width, int j)
+{
+    if (width == 1)
+        return ((const unsigned char*) row)[j];
+    if (width == 2)
+        return ((const unsigned short*) row)[j];
+    return ((const int*) row)[j];
+}
 
-    // scale first alpha
-    if (scaling != 0)
+/*
+ Shifts log scores to a maximum of 0
+*/
+static void _shift_to_max(double *v, int N)
+{
+    int i;
+    double vmax = -INFINITY;
+    for (i = 0; i < N; i++)
+        if (v[i] > vmax)
+            vmax = v[i];
+    if (vmax > -INFINITY)
         for (i = 0; i < N; i++)
-            alpha[i] /= scaling;
+            v[i] -= vmax;
+}
 
-    // iterate trajectory
-    for (t = 0; t < T-1; t++)
+/*
+ One step of the Viterbi recursion in log space:
+    vnext_j = max_i (v_i + log A_ij) + log e_j
+ logAT is the transposed logarithm of the transition matrix. The argmax is stored in traceback_row, unless it is NULL.
+ The scores are shifted to a maximum of 0, which leaves the path unchanged.
+*/
+static void _viterbi_step(double *vnext, char *traceback_row, int width,
+                          const double *v, const double *logAT, const double *e, int N)
+{
+    int i, j, maxi;
+    double m, s;
+    for (j = 0; j < N; j++)
     {
-        scaling = 0.0;
-        // compute new alpha and scaling
-        for (j = 0; j < N; j++)
+        maxi = 0;
+        m = v[0] + logAT[j*N];
+        for (i = 1; i < N; i++)
         {
-            sum = 0.0;
-            for (i = 0; i < N; i++)
+            s = v[i] + logAT[j*N+i];
+            if (s > m)
             {
-                sum += alpha[t*N+i]*A[i*N+j];
+                m = s;
+                maxi = i;
             }
-            alpha[(t+1)*N+j] = sum * pobs[(t+1)*N+j];
-            scaling += alpha[(t+1)*N+j];
         }
-        // scale this row
-        if (scaling != 0)
-            for (j = 0; j < N; j++)
-                alpha[(t+1)*N+j] /= scaling;
-
-        // update likelihood
-        logprob += log(scaling);
+        if (traceback_row != NULL)
+            _traceback_set(traceback_row, width, j, maxi);
+        vnext[j] = m + log(e[j]);
     }
-
-    return logprob;
+    _shift_to_max(vnext, N);
 }
 
 
-void _backward(
-        double *beta,
-        const double *A,
-        const double *pobs,
-        int N, int T)
-{
-    int i, j, t;
-    double sum, scaling;
+/*
+ Forward-backward kernels in double and single precision, for observation probabilities and their logarithms.
+ See _hidden_kernels.h for the meaning of the macros.
+*/
+#define REAL double
+#define NAME(f) f
+#define LOGSPACE 0
+#include "_hidden_kernels.h"
+#undef REAL
+#undef NAME
+#undef LOGSPACE
+
+#define REAL float
+#define NAME(f) f##32
+#define LOGSPACE 0
+#include "_hidden_kernels.h"
+#undef REAL
+#undef NAME
+#undef LOGSPACE
+
+#define REAL double
+#define NAME(f) f##_log
+#define GAMMA _computeGamma
+#define LOGSPACE 1
+#include "_hidden_kernels.h"
+#undef REAL
+#undef NAME
+#undef GAMMA
+#undef LOGSPACE
+
+#define REAL float
+#define NAME(f) f##_log32
+#define GAMMA _computeGamma32
+#define LOGSPACE 1
+#include "_hidden_kernels.h"
+#undef REAL
+#undef NAME
+#undef GAMMA
+#undef LOGSPACE
 
-    // first beta and scaling factors
-    scaling = 0.0;
-    for (i = 0; i < N; i++)
-    {
-        beta[(T-1)*N+i] = 1.0;
-        scaling += beta[(T-1)*N+i];
+/*
+ Fused kernels for one-dimensional Gaussian output models. Instead of reading observation probabilities from a
+ T x N array, they evaluate the Gaussian densities of the observations obs with the state means and standard
+ deviations sigmas on the fly. The densities are computed in log space, so they are safe from underflow.
+*/
+static double _gaussian_emission_row(double *e, double o, const double *means, const double *sigmas, int N)
+{
+    int i;
+    double m, z;
+    for (i = 0; i < N; i++) {
+        z = (o - means[i]) / sigmas[i];
+        e[i] = -0.5*z*z - log(sigmas[i]);
     }
-
-    // scale first beta
+    m = e[0];
+    for (i = 1; i < N; i++)
+        if (e[i] > m)
+            m = e[i];
     for (i = 0; i < N; i++)
-        beta[(T-1)*N+i] /= scaling;
-
-    // iterate trajectory
-    for (t = T-2; t >= 0; t--)
-    {
-        scaling = 0.0;
-        // compute new beta and scaling
-        for (i = 0; i < N; i++)
-        {
-            sum = 0.0;
-            for (j = 0; j < N; j++)
-            {
-                sum += A[i*N+j] * pobs[(t+1)*N+j] * beta[(t+1)*N+j];
-            }
-            beta[t*N+i] = sum;
-            scaling += sum;
-        }
-        // scale this row
-        if (scaling != 0)
-            for (j = 0; j < N; j++)
-                beta[t*N+j] /= scaling;
-    }
+        e[i] = exp(e[i] - m);
+    return m - 0.5*log(2.0*M_PI);
 }
 
-
-void _computeGamma(
-        double *gamma,
-        const double *alpha,
-        const double *beta,
-        int N, int T)
+static double _gaussian_emission_row32(double *e, float o, const float *means, const float *sigmas, int N)
 {
-    int i, t;
-    double sum;
-
-    for (t = 0; t < T; t++) {
-        sum = 0.0;
-        for (i = 0; i < N; i++) {
-            gamma[t*N+i] = alpha[t*N+i]*beta[t*N+i];
-            sum += gamma[t*N+i];
-        }
-        for (i = 0; i < N; i++)
-            gamma[t*N+i] /= sum;
+    int i;
+    double m, z;
+    for (i = 0; i < N; i++) {
+        z = ((double) o - means[i]) / sigmas[i];
+        e[i] = -0.5*z*z - log((double) sigmas[i]);
     }
+    m = e[0];
+    for (i = 1; i < N; i++)
+        if (e[i] > m)
+            m = e[i];
+    for (i = 0; i < N; i++)
+        e[i] = exp(e[i] - m);
+    return m - 0.5*log(2.0*M_PI);
 }
 
+#define EMISSION_ARGS const REAL *obs, const REAL *means, const REAL *sigmas
+#define EMISSION_PASS(t0) obs + (t0), means, sigmas
+#define LOGSPACE 1
+
+#define REAL double
+#define NAME(f) f##_gaussian
+#define GAMMA _computeGamma
+#define EMISSION_ROW(e, t) _gaussian_emission_row(e, obs[t], means, sigmas, N)
+#include "_hidden_kernels.h"
+#undef REAL
+#undef NAME
+#undef GAMMA
+#undef EMISSION_ROW
+
+#define REAL float
+#define NAME(f) f##_gaussian32
+#define GAMMA _computeGamma32
+#define EMISSION_ROW(e, t) _gaussian_emission_row32(e, obs[t], means, sigmas, N)
+#include "_hidden_kernels.h"
+#undef REAL
+#undef NAME
+#undef GAMMA
+#undef EMISSION_ROW
+
+#undef EMISSION_ARGS
+#undef EMISSION_PASS
+#undef LOGSPACE
+
 /*
 void _compute_state_counts(
         double *state_counts,
@@ -145,40 +212,6 @@ void _compute_state_counts(
 }*/
 
 
-void _compute_transition_counts(
-        double *transition_counts,
-        const double *A,
-        const double *pobs,
-        const double *alpha,
-        const double *beta,
-        int N, int T)
-{
-    int i, j, t;
-    double sum, *tmp;
-
-    // initialize
-    for (i = 0; i < N; i++)
-        for (j = 0; j < N; j++)
-            transition_counts[i*N+j] = 0.0;
-
-    tmp = (double*) malloc(N*N * sizeof(double));
-    for (t = 0; t < T-1; t++)
-    {
-        sum = 0.0;
-        for (i = 0; i < N; i++)
-            for (j = 0; j < N; j++)
-            {
-                tmp[i*N+j] = alpha[t*N+i] * A[i*N+j] * pobs[(t+1)*N+j] * beta[(t+1)*N+j];
-                sum += tmp[i*N+j];
-            }
-        for (i = 0; i < N; i++)
-            for (j = 0; j < N; j++)
-                transition_counts[i*N+j] += tmp[i*N+j] / sum;
-    }
-    free(tmp);
-}
-
-
 int argmax(double* v, int N)
 {
     int i;
@@ -196,100 +229,70 @@ int argmax(double* v, int N)
 }
 
 
-void _compute_viterbi(
-        int *path,
-        const double *A,
-        const double *pobs,
-        const double *pi,
-        int N, int T)
+/*
+ Random number generator for the sampling kernels: xoshiro256** by D. Blackman and S. Vigna. Each stream has its own
+ state of four 64 bit words, so that streams can be used by different threads. The state of stream number `stream`
+ is initialized with splitmix64 from the seed and the stream number.
+*/
+static uint64_t _splitmix64(uint64_t *x)
 {
-    int i, j, t, maxi;
-    double sum, maxprod, p;
-
-    // allocate v
-    double* v = (double*) malloc(N * sizeof(double));
-    double* vnext = (double*) malloc(N * sizeof(double));
-    double* h = (double*) malloc(N * sizeof(double));
-    double* vh;
-
-    // allocate ptr
-    int* ptr = (int*) malloc(T*N * sizeof(int));
-
-    // initialization of v
-    sum = 0.0;
-    for (i = 0; i < N; i++)
-    {
-        v[i] = pobs[i] * pi[i];
-        sum += v[i];
-    }
-    // normalize
-    for (i = 0; i < N; i++)
-    {
-        v[i] /= sum;
-    }
+    uint64_t z = (*x += 0x9E3779B97F4A7C15ULL);
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL;
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL;
+    return z ^ (z >> 31);
+}
 
-    // iteration of v
-    for (t = 1; t < T; t++)
-    {
-        sum = 0.0;
-        for (j = 0; j < N; j++)
-        {
-            for (i = 0; i < N; i++)
-            {
-                h[i] = v[i] * A[i*N+j];
-            }
-            maxi = argmax(h, N);
-            ptr[t*N + j] = maxi;
-            vnext[j] = pobs[t*N + j] * v[maxi] * A[maxi*N+j];
-            sum += vnext[j];
-        }
-        // normalize
-        for (i = 0; i < N; i++)
-        {
-            vnext[i] /= sum;
-        }
-        // update v
-        vh = v;
-        v = vnext;
-        vnext = vh;
-    }
+void _rng_seed(uint64_t *state, uint64_t seed, uint64_t stream)
+{
+    int i;
+    uint64_t x = seed;
+    uint64_t key = _splitmix64(&x);
+    x = key ^ stream;
+    // the first word of the splitmix64 sequence decorrelates neighboring stream numbers
+    x = _splitmix64(&x);
+    for (i = 0; i < 4; i++)
+        state[i] = _splitmix64(&x);
+}
 
-    // path reconstruction
-    path[T-1] = argmax(v,N);
-    for (t = T-2; t >= 0; t--)
-    {
-        path[t] = ptr[(t+1)*N+path[t+1]];
-    }
+static uint64_t _rotl(const uint64_t x, int k)
+{
+    return (x << k) | (x >> (64 - k));
+}
 
-    // free memory
-    free(v);
-    free(vnext);
-    free(h);
-    free(ptr);
+static uint64_t _rng_next(uint64_t *s)
+{
+    const uint64_t result = _rotl(s[1] * 5, 7) * 9;
+    const uint64_t t = s[1] << 17;
+    s[2] ^= s[0];
+    s[3] ^= s[1];
+    s[1] ^= s[2];
+    s[0] ^= s[3];
+    s[2] ^= t;
+    s[3] = _rotl(s[3], 45);
+    return result;
 }
 
-int _random_choice(const double* p, const int N)
+double _rng_uniform(uint64_t *state)
 {
-    double dR = (double)rand();
-    double dM = (double)RAND_MAX;
-    double r = dR / (dM + 1.0);
-    double s = 0.0;
-    int i;
-    for (i = 0; i < N; i++)
-    {
-        s += p[i];
-        if (s >= r)
-        {
-            return(i);
-        }
-    }
+    // 53 random bits in [0,1)
+    return (_rng_next(state) >> 11) * (1.0 / 9007199254740992.0);
+}
 
-    printf("ERROR: random select method could not select anything. Probably p is not normalized.\n");
-    for (i = 0; i < N; i++)
+/*
+ Returns the first index i with cumulative[i] > r, given nondecreasing cumulative weights. Binary search.
+*/
+int _random_choice(const double* cumulative, const int N, const double r)
+{
+    int lo = 0, hi = N-1, mid;
+    while (lo < hi)
     {
-        printf("%i \t %f\n",i,p[i]);
+        mid = (lo + hi) / 2;
+        if (cumulative[mid] > r)
+            hi = mid;
+        else
+            lo = mid + 1;
     }
-    exit(1);
+    return lo;
 }
 
 void _normalize(double* v, const int N)
@@ -312,44 +315,65 @@ void _sample_path(
         const double *alpha,
         const double *A,
         const double *pobs,
-        const int N, const int T)
+        const int N, const int T,
+        uint64_t *rng_state)
 {
-    // initialize variables
-    int i,t;
-    double* psel = (double*) malloc(N * sizeof(double));
-
-    // initialize random number generator
-    srand(time(NULL));
+    _sample_paths(path, alpha, A, pobs, N, T, 1, rng_state);
+}
 
-    // Sample final state.
-    //printf("t = %i ",(T-1));
+/*
+ Samples K hidden paths from the same forward variables. path is a (K,T) array. The paths are drawn one after the
+ other, so that the random numbers are the same as for K calls of _sample_path.
+*/
+void _sample_paths(
+        int *path,
+        const double *alpha,
+        const double *A,
+        const double *pobs,
+        const int N, const int T, const int K,
+        uint64_t *rng_state)
+{
+    int i, j, t, k;
+    double s;
+    int *p;
+    // cumulative weights of the distribution to draw from
+    double* cumulative = (double*) malloc(N * sizeof(double));
+    // transposed transition matrix, so that the weights of each step are computed from contiguous memory
+    double* AT = (double*) malloc(N*N * sizeof(double));
     for (i = 0; i < N; i++)
+        for (j = 0; j < N; j++)
+            AT[j*N+i] = A[i*N+j];
+
+    for (k = 0; k < K; k++)
     {
-        psel[i] = alpha[(T-1)*N+i];
-        //printf("%f\t",psel[i]);
-    }
-    //printf("\n");
-    _normalize(psel, N);
-    // Draw from this distribution.
-    path[T-1] = _random_choice(psel, N);
-    //printf(" drawn: %i\n",path[T-1]);
-
-    // Work backwards from T-2 to 0.
-    for (t = T-2; t >= 0; t--)
-    {
-        //printf("t = %i ",t);
-        // Compute P(s_t = i | s_{t+1}..s_T).
+        p = path + (size_t) k * T;
+        // Sample final state from P(s_T-1 = i) ~ alpha_i(T-1). The weights are not normalized, instead the uniform
+        // random number is scaled to their sum.
+        s = 0.0;
         for (i = 0; i < N; i++)
         {
-            psel[i] = alpha[t*N+i] * A[i*N+path[t+1]];
-            //printf("%f\t",psel[i]);
+            s += alpha[(T-1)*N+i];
+            cumulative[i] = s;
+        }
+        p[T-1] = _random_choice(cumulative, N, _rng_uniform(rng_state) * s);
+
+        // Work backwards from T-2 to 0.
+        for (t = T-2; t >= 0; t--)
+        {
+            // P(s_t = i | s_{t+1}..s_T) ~ alpha_i(t) A_ij with j = s_t+1
+            j = p[t+1];
+            s = 0.0;
+            for (i = 0; i < N; i++)
+            {
+                s += alpha[t*N+i] * AT[j*N+i];
+                cumulative[i] = s;
+            }
+            p[t] = _random_choice(cumulative, N, _rng_uniform(rng_state) * s);
         }
-        //printf("\n");
-        _normalize(psel, N);
-        // Draw from this distribution.
-        path[t] = _random_choice(psel, N);
-        //printf(" drawn: %i\n",path[t]);
     }
+
+    free(cumulative);
+    free(AT);
 }
 
 /*
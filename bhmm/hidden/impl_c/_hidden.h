@@ -1,61 +1,137 @@
 #ifndef HMM_H_
 #define HMM_H_
 
+#include <stdint.h>
+
 /*
  API FUNCTIONS
 */
 
-double _forward(
-        double *alpha,
-        const double *A,
-        const double *pobs,
-        const double *pi,
+/*
+ Forward-backward kernels. Each of them exists in four variants: double precision (no suffix), single precision
+ (suffix 32) and the same two for log observation probabilities (suffixes _log and _log32). The fused variants for
+ one-dimensional Gaussian output models (suffixes _gaussian and _gaussian32) take the observations, means and
+ standard deviations in place of the observation probabilities.
+*/
+#define __PROBS__(REAL) const REAL *pobs
+#define __GAUSSIAN__(REAL) const REAL *obs, const REAL *means, const REAL *sigmas
+#define __HIDDEN_KERNEL_DECLARATIONS__(REAL, NAME, EMISSION) \
+double NAME(_forward)( \
+        REAL *alpha, \
+        const REAL *A, \
+        EMISSION(REAL), \
+        const REAL *pi, \
+        int N, int T); \
+\
+void NAME(_backward)( \
+        REAL *beta, \
+        const REAL *A, \
+        EMISSION(REAL), \
+        int N, int T); \
+\
+void NAME(_compute_transition_counts)( \
+        REAL *transition_counts, \
+        const REAL *A, \
+        EMISSION(REAL), \
+        const REAL *alpha, \
+        const REAL *beta, \
+        int N, int T); \
+\
+void NAME(_add_transition_counts)( \
+        double *transition_counts, \
+        double *tmp, \
+        const REAL *A, \
+        EMISSION(REAL), \
+        const REAL *alpha, \
+        const REAL *beta, \
+        int N, int T); \
+\
+void NAME(_forward_backward_batch)( \
+        double *logprobs, \
+        REAL *gamma, \
+        REAL *transition_counts, \
+        const REAL *A, \
+        EMISSION(REAL), \
+        const REAL *pi, \
+        const int *offsets, \
+        int N, int K); \
+\
+double NAME(_loglikelihood)( \
+        const REAL *A, \
+        EMISSION(REAL), \
+        const REAL *pi, \
+        int N, int T); \
+\
+void NAME(_loglikelihood_batch)( \
+        double *logprobs, \
+        const REAL *A, \
+        EMISSION(REAL), \
+        const REAL *pi, \
+        const int *offsets, \
+        int N, int K); \
+\
+void NAME(_viterbi)( \
+        int *path, \
+        const REAL *A, \
+        EMISSION(REAL), \
+        const REAL *pi, \
+        int N, int T, int segment_length); \
+\
+void NAME(_transfer_matrix)( \
+        REAL *P, \
+        const REAL *A, \
+        EMISSION(REAL), \
         int N, int T);
 
-void _backward(
-        double *beta,
-        const double *A,
-        const double *pobs,
-        int N, int T);
+#define __NAME_64__(f) f
+#define __NAME_32__(f) f##32
+#define __NAME_LOG64__(f) f##_log
+#define __NAME_LOG32__(f) f##_log32
+#define __NAME_GAUSSIAN64__(f) f##_gaussian
+#define __NAME_GAUSSIAN32__(f) f##_gaussian32
+__HIDDEN_KERNEL_DECLARATIONS__(double, __NAME_64__, __PROBS__)
+__HIDDEN_KERNEL_DECLARATIONS__(float, __NAME_32__, __PROBS__)
+__HIDDEN_KERNEL_DECLARATIONS__(double, __NAME_LOG64__, __PROBS__)
+__HIDDEN_KERNEL_DECLARATIONS__(float, __NAME_LOG32__, __PROBS__)
+__HIDDEN_KERNEL_DECLARATIONS__(double, __NAME_GAUSSIAN64__, __GAUSSIAN__)
+__HIDDEN_KERNEL_DECLARATIONS__(float, __NAME_GAUSSIAN32__, __GAUSSIAN__)
 
 void _computeGamma(
         double *gamma,
         const double *alpha,
         const double *beta,
-        int T, int N);
-
-void _compute_state_counts(
-        double *state_counts,
-        const double *gamma,
-        int T, int N);
+        int N, int T);
 
-void _compute_transition_counts(
-        double *transition_counts,
-        const double *A,
-        const double *pobs,
-        const double *alpha,
-        const double *beta,
+void _computeGamma32(
+        float *gamma,
+        const float *alpha,
+        const float *beta,
         int N, int T);
 
-void _compute_viterbi(
+void _sample_path(
         int *path,
+        const double *alpha,
         const double *A,
         const double *pobs,
-        const double *pi,
-        int N, int T);
+        const int N, const int T,
+        uint64_t *rng_state);
 
-void _sample_path(
+void _sample_paths(
         int *path,
         const double *alpha,
         const double *A,
         const double *pobs,
-        const int N, const int T);
+        const int N, const int T, const int K,
+        uint64_t *rng_state);
+
+void _rng_seed(uint64_t *state, uint64_t seed, uint64_t stream);
+double _rng_uniform(uint64_t *state);
 
 /*
  HELPER FUNCTIONS
 */
 int argmax(double* v, int N);
-int _random_choice(const double* p, const int N);
+int _random_choice(const double* cumulative, const int N, const double r);
 void _normalize(double* v, const int N);
 
 
@@ -0,0 +1,489 @@
+/*
+ Forward-backward kernels, written once for all supported data types.
+
+ This file is included by _hidden.c once per kernel variant. Before each inclusion the following macros
+ must be defined:
+
+    REAL        floating point type of alpha, beta, gamma, A, pobs and pi (double or float)
+    NAME(f)     function name of f for this variant, e.g. f, f##32, f##_log or f##_log32
+    LOGSPACE    0 if pobs contains observation probabilities, 1 if it contains their logarithms
+    GAMMA       (optional) an existing _computeGamma function for REAL. If not defined, it is generated.
+
+ By default, observation probabilities are read from a T x N array pobs. Other sources of observation
+ probabilities are plugged in by defining the following three macros:
+
+    EMISSION_ARGS       parameter list that replaces "const REAL *pobs"
+    EMISSION_PASS(t0)   arguments to pass on to other kernels for the trajectory starting at time t0
+    EMISSION_ROW(e, t)  computes the observation probabilities of time t into the double array e, rescaled to a
+                        maximum of 1, and returns the logarithm of the scaling factor
+
+ All sums are accumulated in double precision. Each row of emission probabilities is rescaled by its maximum
+ before it enters the recursions, and the logarithm of that factor is added to the likelihood. The scaled
+ alpha, beta, gamma and transition counts do not depend on this factor, but it keeps the products
+ alpha * A * pobs away from the underflow limit, which is quickly reached in single precision and for very
+ peaked emission densities. In log space the emission rows are exponentiated after subtracting their maximum,
+ so that observations whose probabilities are not representable at all can still be processed.
+*/
+
+
+#ifndef EMISSION_ARGS
+#define EMISSION_ARGS const REAL *pobs
+#define EMISSION_PASS(t0) pobs + (t0)*N
+#define EMISSION_ROW(e, t) NAME(_emission_row)(e, pobs + (t)*N, N)
+#define __DEFAULT_EMISSION__
+
+static double NAME(_emission_row)(
+        double *e,
+        const REAL *pobs,
+        int N)
+{
+    int i;
+    double m;
+
+    // maximum of this row
+    m = pobs[0];
+    for (i = 1; i < N; i++)
+        if (pobs[i] > m)
+            m = pobs[i];
+#if LOGSPACE
+    for (i = 0; i < N; i++)
+        e[i] = exp(pobs[i] - m);
+    return m;
+#else
+    if (m <= 0)
+    {
+        for (i = 0; i < N; i++)
+            e[i] = 0.0;
+        return log(0.0);
+    }
+    for (i = 0; i < N; i++)
+        e[i] = pobs[i] / m;
+    return log(m);
+#endif
+}
+#endif
+
+
+double NAME(_forward)(
+        REAL *alpha,
+        const REAL *A,
+        EMISSION_ARGS,
+        const REAL *pi,
+        int N, int T)
+{
+    int i, j, t;
+    double sum, logprob, scaling;
+    double *e = (double*) malloc(N * sizeof(double));
+
+    // first alpha and scaling factors
+    logprob = EMISSION_ROW(e, 0);
+    scaling = 0.0;
+    for (i = 0; i < N; i++) {
+        alpha[i]  = pi[i] * e[i];
+        scaling += alpha[i];
+    }
+
+    // initialize likelihood
+    logprob += log(scaling);
+
+    // scale first alpha
+    if (scaling != 0)
+        for (i = 0; i < N; i++)
+            alpha[i] /= scaling;
+
+    // iterate trajectory
+    for (t = 0; t < T-1; t++)
+    {
+        logprob += EMISSION_ROW(e, t+1);
+        scaling = 0.0;
+        // compute new alpha and scaling
+        for (j = 0; j < N; j++)
+        {
+            sum = 0.0;
+            for (i = 0; i < N; i++)
+            {
+                sum += alpha[t*N+i]*A[i*N+j];
+            }
+            alpha[(t+1)*N+j] = sum * e[j];
+            scaling += alpha[(t+1)*N+j];
+        }
+        // scale this row
+        if (scaling != 0)
+            for (j = 0; j < N; j++)
+                alpha[(t+1)*N+j] /= scaling;
+
+        // update likelihood
+        logprob += log(scaling);
+    }
+
+    free(e);
+    return logprob;
+}
+
+
+void NAME(_backward)(
+        REAL *beta,
+        const REAL *A,
+        EMISSION_ARGS,
+        int N, int T)
+{
+    int i, j, t;
+    double sum, scaling;
+    double *e = (double*) malloc(N * sizeof(double));
+
+    // first beta and scaling factors
+    for (i = 0; i < N; i++)
+        beta[(T-1)*N+i] = 1.0 / N;
+
+    // iterate trajectory
+    for (t = T-2; t >= 0; t--)
+    {
+        EMISSION_ROW(e, t+1);
+        scaling = 0.0;
+        // compute new beta and scaling
+        for (i = 0; i < N; i++)
+        {
+            sum = 0.0;
+            for (j = 0; j < N; j++)
+            {
+                sum += A[i*N+j] * e[j] * beta[(t+1)*N+j];
+            }
+            beta[t*N+i] = sum;
+            scaling += sum;
+        }
+        // scale this row
+        if (scaling != 0)
+            for (j = 0; j < N; j++)
+                beta[t*N+j] /= scaling;
+    }
+
+    free(e);
+}
+
+
+#ifndef GAMMA
+#define GAMMA NAME(_computeGamma)
+#define __DEFAULT_GAMMA__
+void NAME(_computeGamma)(
+        REAL *gamma,
+        const REAL *alpha,
+        const REAL *beta,
+        int N, int T)
+{
+    int i, t;
+    double sum;
+
+    for (t = 0; t < T; t++) {
+        sum = 0.0;
+        for (i = 0; i < N; i++) {
+            gamma[t*N+i] = alpha[t*N+i]*beta[t*N+i];
+            sum += gamma[t*N+i];
+        }
+        for (i = 0; i < N; i++)
+            gamma[t*N+i] /= sum;
+    }
+}
+#endif
+
+
+void NAME(_add_transition_counts)(
+        double *transition_counts,
+        double *tmp,
+        const REAL *A,
+        EMISSION_ARGS,
+        const REAL *alpha,
+        const REAL *beta,
+        int N, int T)
+{
+    int i, j, t;
+    double sum;
+    // the emission row is stored behind the N*N block of tmp
+    double *e = tmp + N*N;
+
+    for (t = 0; t < T-1; t++)
+    {
+        EMISSION_ROW(e, t+1);
+        sum = 0.0;
+        for (i = 0; i < N; i++)
+            for (j = 0; j < N; j++)
+            {
+                tmp[i*N+j] = alpha[t*N+i] * A[i*N+j] * e[j] * beta[(t+1)*N+j];
+                sum += tmp[i*N+j];
+            }
+        for (i = 0; i < N; i++)
+            for (j = 0; j < N; j++)
+                transition_counts[i*N+j] += tmp[i*N+j] / sum;
+    }
+}
+
+
+void NAME(_compute_transition_counts)(
+        REAL *transition_counts,
+        const REAL *A,
+        EMISSION_ARGS,
+        const REAL *alpha,
+        const REAL *beta,
+        int N, int T)
+{
+    int i;
+    // counts are accumulated in double precision, followed by the workspace of _add_transition_counts
+    double *counts = (double*) calloc(2*N*N + N, sizeof(double));
+
+    NAME(_add_transition_counts)(counts, counts + N*N, A, EMISSION_PASS(0), alpha, beta, N, T);
+    for (i = 0; i < N*N; i++)
+        transition_counts[i] = counts[i];
+    free(counts);
+}
+
+
+void NAME(_forward_backward_batch)(
+        double *logprobs,
+        REAL *gamma,
+        REAL *transition_counts,
+        const REAL *A,
+        EMISSION_ARGS,
+        const REAL *pi,
+        const int *offsets,
+        int N, int K)
+{
+    int i, k, T, maxT;
+    REAL *alpha, *beta;
+    double *counts;
+
+    // workspace is sized for the longest trajectory and reused for all others
+    maxT = 0;
+    for (k = 0; k < K; k++)
+        if (offsets[k+1] - offsets[k] > maxT)
+            maxT = offsets[k+1] - offsets[k];
+    alpha = (REAL*) malloc(maxT*N * sizeof(REAL));
+    beta = (REAL*) malloc(maxT*N * sizeof(REAL));
+    // counts are accumulated in double precision, followed by the workspace of _add_transition_counts
+    counts = (double*) calloc(2*N*N + N, sizeof(double));
+
+    // iterate trajectories
+    for (k = 0; k < K; k++)
+    {
+        T = offsets[k+1] - offsets[k];
+        if (T <= 0)
+        {
+            logprobs[k] = 0.0;
+            continue;
+        }
+        logprobs[k] = NAME(_forward)(alpha, A, EMISSION_PASS(offsets[k]), pi, N, T);
+        NAME(_backward)(beta, A, EMISSION_PASS(offsets[k]), N, T);
+        GAMMA(gamma + offsets[k]*N, alpha, beta, N, T);
+        NAME(_add_transition_counts)(counts, counts + N*N, A, EMISSION_PASS(offsets[k]), alpha, beta, N, T);
+    }
+    for (i = 0; i < N*N; i++)
+        transition_counts[i] = counts[i];
+
+    free(alpha);
+    free(beta);
+    free(counts);
+}
+
+
+double NAME(_loglikelihood)(
+        const REAL *A,
+        EMISSION_ARGS,
+        const REAL *pi,
+        int N, int T)
+{
+    int i, j, t;
+    double sum, logprob, scaling;
+    // only the current and the next forward row are kept
+    double *e = (double*) malloc(3*N * sizeof(double));
+    double *alpha = e + N;
+    double *alpha_next = e + 2*N;
+    double *swap;
+
+    if (T <= 0)
+    {
+        free(e);
+        return 0.0;
+    }
+
+    logprob = EMISSION_ROW(e, 0);
+    scaling = 0.0;
+    for (i = 0; i < N; i++) {
+        alpha[i] = pi[i] * e[i];
+        scaling += alpha[i];
+    }
+    logprob += log(scaling);
+    if (scaling != 0)
+        for (i = 0; i < N; i++)
+            alpha[i] /= scaling;
+
+    for (t = 0; t < T-1; t++)
+    {
+        logprob += EMISSION_ROW(e, t+1);
+        scaling = 0.0;
+        for (j = 0; j < N; j++)
+        {
+            sum = 0.0;
+            for (i = 0; i < N; i++)
+                sum += alpha[i]*A[i*N+j];
+            alpha_next[j] = sum * e[j];
+            scaling += alpha_next[j];
+        }
+        if (scaling != 0)
+            for (j = 0; j < N; j++)
+                alpha_next[j] /= scaling;
+        logprob += log(scaling);
+        swap = alpha;
+        alpha = alpha_next;
+        alpha_next = swap;
+    }
+
+    free(e);
+    return logprob;
+}
+
+
+void NAME(_loglikelihood_batch)(
+        double *logprobs,
+        const REAL *A,
+        EMISSION_ARGS,
+        const REAL *pi,
+        const int *offsets,
+        int N, int K)
+{
+    int k;
+    for (k = 0; k < K; k++)
+        logprobs[k] = NAME(_loglikelihood)(A, EMISSION_PASS(offsets[k]), pi, N, offsets[k+1] - offsets[k]);
+}
+
+void NAME(_transfer_matrix)(
+        REAL *P,
+        const REAL *A,
+        EMISSION_ARGS,
+        int N, int T)
+{
+    int i, j, k, t;
+    double sum, maxval;
+    // product and temporary result are kept in double precision, followed by the emission row
+    double *work = (double*) malloc((2*N*N + N) * sizeof(double));
+    double *prod = work, *tmp = work + N*N, *e = work + 2*N*N;
+
+    // start with the identity
+    for (i = 0; i < N*N; i++)
+        prod[i] = 0.0;
+    for (i = 0; i < N; i++)
+        prod[i*N+i] = 1.0;
+
+    // multiply with A diag(pobs[t]) for each time step
+    for (t = 0; t < T; t++)
+    {
+        EMISSION_ROW(e, t);
+        maxval = 0.0;
+        for (i = 0; i < N; i++)
+            for (j = 0; j < N; j++)
+            {
+                sum = 0.0;
+                for (k = 0; k < N; k++)
+                    sum += prod[i*N+k] * A[k*N+j];
+                tmp[i*N+j] = sum * e[j];
+                if (tmp[i*N+j] > maxval)
+                    maxval = tmp[i*N+j];
+            }
+        // rescale so that the largest element is 1
+        if (maxval == 0)
+            maxval = 1.0;
+        for (i = 0; i < N*N; i++)
+            prod[i] = tmp[i] / maxval;
+    }
+
+    for (i = 0; i < N*N; i++)
+        P[i] = prod[i];
+    free(work);
+}
+
+
+/*
+ Viterbi path in log space. The traceback table holds T x N entries of the smallest integer type that fits N.
+ If 0 < segment_length < T, the forward pass only keeps the scores at the start of each segment, and the traceback
+ of each segment is recomputed from there, so the table only holds segment_length x N entries at the cost of an
+ additional pass over the trajectory.
+*/
+void NAME(_viterbi)(
+        int *path,
+        const REAL *A,
+        EMISSION_ARGS,
+        const REAL *pi,
+        int N, int T, int segment_length)
+{
+    int i, j, k, t, t0, t1, nseg, width;
+    double *logAT, *e, *v, *vnext, *swap, *checkpoints;
+    char *traceback;
+
+    if (T <= 0)
+        return;
+    if (segment_length <= 0 || segment_length > T)
+        segment_length = T;
+    nseg = (T + segment_length - 1) / segment_length;
+    width = _traceback_width(N);
+
+    logAT = (double*) malloc(N*N * sizeof(double));
+    for (i = 0; i < N; i++)
+        for (j = 0; j < N; j++)
+            logAT[j*N+i] = log(A[i*N+j]);
+    e = (double*) malloc(3*N * sizeof(double));
+    v = e + N;
+    vnext = e + 2*N;
+    checkpoints = (double*) malloc(nseg*N * sizeof(double));
+    traceback = (char*) malloc((size_t) segment_length * N * width);
+
+    // forward pass, keeping only the scores at the segment starts
+    EMISSION_ROW(e, 0);
+    for (i = 0; i < N; i++)
+        v[i] = log(pi[i]) + log(e[i]);
+    _shift_to_max(v, N);
+    for (k = 0; k < nseg; k++)
+    {
+        for (i = 0; i < N; i++)
+            checkpoints[k*N+i] = v[i];
+        if (k == nseg-1)
+            break;
+        for (t = k*segment_length; t < (k+1)*segment_length; t++)
+        {
+            EMISSION_ROW(e, t+1);
+            _viterbi_step(vnext, NULL, width, v, logAT, e, N);
+            swap = v; v = vnext; vnext = swap;
+        }
+    }
+
+    // backward over segments. Each segment is propagated one step into the next one, whose path is known.
+    for (k = nseg-1; k >= 0; k--)
+    {
+        t0 = k*segment_length;
+        t1 = (k == nseg-1) ? T-1 : (k+1)*segment_length;
+        for (i = 0; i < N; i++)
+            v[i] = checkpoints[k*N+i];
+        for (t = t0; t < t1; t++)
+        {
+            EMISSION_ROW(e, t+1);
+            _viterbi_step(vnext, traceback + (size_t)(t-t0)*N*width, width, v, logAT, e, N);
+            swap = v; v = vnext; vnext = swap;
+        }
+        if (k == nseg-1)
+            path[T-1] = argmax(v, N);
+        for (t = t1; t > t0; t--)
+            path[t-1] = _traceback_get(traceback + (size_t)(t-1-t0)*N*width, width, path[t]);
+    }
+
+    free(logAT);
+    free(e);
+    free(checkpoints);
+    free(traceback);
+}
+
+#ifdef __DEFAULT_EMISSION__
+#undef EMISSION_ARGS
+#undef EMISSION_PASS
+#undef EMISSION_ROW
+#undef __DEFAULT_EMISSION__
+#endif
+#ifdef __DEFAULT_GAMMA__
+#undef GAMMA
+#undef __DEFAULT_GAMMA__
+#endif
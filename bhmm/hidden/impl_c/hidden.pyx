@@ -6,24 +6,67 @@ r"""Cython implementation of HMM forward backward functions.
 import numpy
 import ctypes
 cimport numpy
+from libc.stdint cimport uint64_t
 
 cdef extern from "_hidden.h":
-    double _forward(double * alpha, const double *A, const double *pobs, const double *pi, const int N, const int T)
+    double _forward(double * alpha, const double *A, const double *pobs, const double *pi, const int N, const int T) nogil
+    double _forward32(float * alpha, const float *A, const float *pobs, const float *pi, const int N, const int T) nogil
+    double _forward_log(double * alpha, const double *A, const double *pobs, const double *pi, const int N, const int T) nogil
+    double _forward_log32(float * alpha, const float *A, const float *pobs, const float *pi, const int N, const int T) nogil
 
 cdef extern from "_hidden.h":
-    void _backward(double *beta, const double *A, const double *pobs, const int N, const int T)
+    void _backward(double *beta, const double *A, const double *pobs, const int N, const int T) nogil
+    void _backward32(float *beta, const float *A, const float *pobs, const int N, const int T) nogil
+    void _backward_log(double *beta, const double *A, const double *pobs, const int N, const int T) nogil
+    void _backward_log32(float *beta, const float *A, const float *pobs, const int N, const int T) nogil
 
 # cdef extern from "_hmm.h":
 #     void _computeGamma(double *gamma, const double *alpha, const double *beta, const int T, const int N)
 #
 cdef extern from "_hidden.h":
-    void _compute_transition_counts(double *transition_counts, const double *A, const double *pobs, const double *alpha, const double *beta, int N, int T)
+    void _compute_transition_counts(double *transition_counts, const double *A, const double *pobs, const double *alpha, const double *beta, int N, int T) nogil
+    void _compute_transition_counts32(float *transition_counts, const float *A, const float *pobs, const float *alpha, const float *beta, int N, int T) nogil
+    void _compute_transition_counts_log(double *transition_counts, const double *A, const double *pobs, const double *alpha, const double *beta, int N, int T) nogil
+    void _compute_transition_counts_log32(float *transition_counts, const float *A, const float *pobs, const float *alpha, const float *beta, int N, int T) nogil
 
 cdef extern from "_hidden.h":
-    void _compute_viterbi(int *path, const double *A, const double *pobs, const double *pi, int N, int T)
+    void _transfer_matrix(double *P, const double *A, const double *pobs, int N, int T) nogil
+    void _transfer_matrix32(float *P, const float *A, const float *pobs, int N, int T) nogil
+    void _transfer_matrix_log(double *P, const double *A, const double *pobs, int N, int T) nogil
+    void _transfer_matrix_log32(float *P, const float *A, const float *pobs, int N, int T) nogil
 
 cdef extern from "_hidden.h":
-    void _sample_path(int *path, const double *alpha, const double *A, const double *pobs, const int N, const int T)
+    void _forward_backward_batch(double *logprobs, double *gamma, double *transition_counts, const double *A, const double *pobs, const double *pi, const int *offsets, int N, int K) nogil
+    void _forward_backward_batch32(double *logprobs, float *gamma, float *transition_counts, const float *A, const float *pobs, const float *pi, const int *offsets, int N, int K) nogil
+    void _forward_backward_batch_log(double *logprobs, double *gamma, double *transition_counts, const double *A, const double *pobs, const double *pi, const int *offsets, int N, int K) nogil
+    void _forward_backward_batch_log32(double *logprobs, float *gamma, float *transition_counts, const float *A, const float *pobs, const float *pi, const int *offsets, int N, int K) nogil
+    void _forward_backward_batch_gaussian(double *logprobs, double *gamma, double *transition_counts, const double *A, const double *obs, const double *means, const double *sigmas, const double *pi, const int *offsets, int N, int K) nogil
+    void _forward_backward_batch_gaussian32(double *logprobs, float *gamma, float *transition_counts, const float *A, const float *obs, const float *means, const float *sigmas, const float *pi, const int *offsets, int N, int K) nogil
+
+cdef extern from "_hidden.h":
+    double _loglikelihood(const double *A, const double *pobs, const double *pi, int N, int T) nogil
+    double _loglikelihood32(const float *A, const float *pobs, const float *pi, int N, int T) nogil
+    double _loglikelihood_log(const double *A, const double *pobs, const double *pi, int N, int T) nogil
+    double _loglikelihood_log32(const float *A, const float *pobs, const float *pi, int N, int T) nogil
+    void _loglikelihood_batch(double *logprobs, const double *A, const double *pobs, const double *pi, const int *offsets, int N, int K) nogil
+    void _loglikelihood_batch32(double *logprobs, const float *A, const float *pobs, const float *pi, const int *offsets, int N, int K) nogil
+    void _loglikelihood_batch_log(double *logprobs, const double *A, const double *pobs, const double *pi, const int *offsets, int N, int K) nogil
+    void _loglikelihood_batch_log32(double *logprobs, const float *A, const float *pobs, const float *pi, const int *offsets, int N, int K) nogil
+    void _loglikelihood_batch_gaussian(double *logprobs, const double *A, const double *obs, const double *means, const double *sigmas, const double *pi, const int *offsets, int N, int K) nogil
+    void _loglikelihood_batch_gaussian32(double *logprobs, const float *A, const float *obs, const float *means, const float *sigmas, const float *pi, const int *offsets, int N, int K) nogil
+
+cdef extern from "_hidden.h":
+    void _viterbi(int *path, const double *A, const double *pobs, const double *pi, int N, int T, int segment_length) nogil
+    void _viterbi32(int *path, const float *A, const float *pobs, const float *pi, int N, int T, int segment_length) nogil
+    void _viterbi_log(int *path, const double *A, const double *pobs, const double *pi, int N, int T, int segment_length) nogil
+    void _viterbi_log32(int *path, const float *A, const float *pobs, const float *pi, int N, int T, int segment_length) nogil
+    void _viterbi_gaussian(int *path, const double *A, const double *obs, const double *means, const double *sigmas, const double *pi, int N, int T, int segment_length) nogil
+    void _viterbi_gaussian32(int *path, const float *A, const float *obs, const float *means, const float *sigmas, const float *pi, int N, int T, int segment_length) nogil
+
+cdef extern from "_hidden.h":
+    void _sample_path(int *path, const double *alpha, const double *A, const double *pobs, const int N, const int T, uint64_t *rng_state) nogil
+    void _sample_paths(int *path, const double *alpha, const double *A, const double *pobs, const int N, const int T, const int K, uint64_t *rng_state) nogil
+    void _rng_seed(uint64_t *state, uint64_t seed, uint64_t stream) nogil
 
 
 def cdef_double_array(n1, n2):
@@ -31,7 +74,20 @@ def cdef_double_array(n1, n2):
     return out
 
 
-def forward(A, pobs, pi, T=None, alpha_out=None, dtype=numpy.float32):
+def cdef_float_array(n1, n2):
+    cdef numpy.ndarray[float, ndim=2, mode="c"] out = numpy.zeros( (n1,n2), dtype=numpy.float32, order='C' )
+    return out
+
+
+def cdef_array(n1, n2, dtype):
+    if dtype == numpy.float32:
+        return cdef_float_array(n1, n2)
+    return cdef_double_array(n1, n2)
+
+
+def forward(A, pobs, pi, T=None, alpha_out=None, dtype=numpy.float32, logspace=False):
+    cdef int n, t
+    cdef double logprob
     # set T
     if (T is None):
         T = pobs.shape[0] # if not set, use the length of pobs as trajectory length
@@ -43,26 +99,49 @@ def forward(A, pobs, pi, T=None, alpha_out=None, dtype=numpy.float32):
     # initialize output if necessary
     #cdef numpy.ndarray[double, ndim=2, mode="c"] alpha = numpy.zeros( (T,N), dtype=numpy.double, order='C' )
     if alpha_out is None:
-        alpha = cdef_double_array(T,N)
+        alpha = cdef_array(T,N,dtype)
     elif T > alpha_out.shape[0]:
         raise TypeError('alpha_out must at least have length T in order to fit trajectory.')
     else:
         alpha = alpha_out
+    n = N
+    t = T
 
-    #if dtype == numpy.float32:
-    #    return ext.forward32(A, pobs, pi)
+    # the kernels are run without the GIL, so that they can be called from several threads
     if dtype == numpy.float64:
         palpha = <double*> numpy.PyArray_DATA(alpha)
         pA = <double*> numpy.PyArray_DATA(A)
         ppobs = <double*> numpy.PyArray_DATA(pobs)
         ppi = <double*> numpy.PyArray_DATA(pi)
         # call
-        logprob = _forward(palpha, pA, ppobs, ppi, N, T)
+        if logspace:
+            with nogil:
+                logprob = _forward_log(palpha, pA, ppobs, ppi, n, t)
+        else:
+            with nogil:
+                logprob = _forward(palpha, pA, ppobs, ppi, n, t)
+        return logprob, alpha
+    elif dtype == numpy.float32:
+        A = numpy.ascontiguousarray(A, dtype=numpy.float32)
+        pobs = numpy.ascontiguousarray(pobs, dtype=numpy.float32)
+        pi = numpy.ascontiguousarray(pi, dtype=numpy.float32)
+        palpha32 = <float*> numpy.PyArray_DATA(alpha)
+        pA32 = <float*> numpy.PyArray_DATA(A)
+        ppobs32 = <float*> numpy.PyArray_DATA(pobs)
+        ppi32 = <float*> numpy.PyArray_DATA(pi)
+        # call
+        if logspace:
+            with nogil:
+                logprob = _forward_log32(palpha32, pA32, ppobs32, ppi32, n, t)
+        else:
+            with nogil:
+                logprob = _forward32(palpha32, pA32, ppobs32, ppi32, n, t)
         return logprob, alpha
     else:
         raise TypeError
 
-def backward(A, pobs, T=None, beta_out=None, dtype=numpy.float32):
+def backward(A, pobs, T=None, beta_out=None, dtype=numpy.float32, logspace=False):
+    cdef int n, t
     # set T
     if (T is None):
         T = pobs.shape[0] # if not set, use the length of pobs as trajectory length
@@ -73,21 +152,40 @@ def backward(A, pobs, T=None, beta_out=None, dtype=numpy.float32):
     #cdef numpy.ndarray[double, ndim=2, mode="c"] beta = numpy.zeros( (T,N), dtype=numpy.double, order='C' )
     # prepare beta array
     if beta_out is None:
-        beta = cdef_double_array(T,N)
+        beta = cdef_array(T,N,dtype)
         #cdef numpy.ndarray[double, ndim=2, mode="c"] beta_out = numpy.zeros( (T,N), dtype=numpy.double, order='C' )
     elif T > beta_out.shape[0]:
         raise ValueError('beta_out must at least have length T in order to fit trajectory.')
     else:
         beta = beta_out
+    n = N
+    t = T
 
-    #if dtype == numpy.float32:
-    #    return ext.forward32(A, pobs, pi)
     if dtype == numpy.float64:
         pbeta    = <double*> numpy.PyArray_DATA(beta)
         pA       = <double*> numpy.PyArray_DATA(A)
         ppobs    = <double*> numpy.PyArray_DATA(pobs)
         # call
-        _backward(pbeta, pA, ppobs, N, T)
+        if logspace:
+            with nogil:
+                _backward_log(pbeta, pA, ppobs, n, t)
+        else:
+            with nogil:
+                _backward(pbeta, pA, ppobs, n, t)
+        return beta
+    elif dtype == numpy.float32:
+        A = numpy.ascontiguousarray(A, dtype=numpy.float32)
+        pobs = numpy.ascontiguousarray(pobs, dtype=numpy.float32)
+        pbeta32  = <float*> numpy.PyArray_DATA(beta)
+        pA32     = <float*> numpy.PyArray_DATA(A)
+        ppobs32  = <float*> numpy.PyArray_DATA(pobs)
+        # call
+        if logspace:
+            with nogil:
+                _backward_log32(pbeta32, pA32, ppobs32, n, t)
+        else:
+            with nogil:
+                _backward32(pbeta32, pA32, ppobs32, n, t)
         return beta
     else:
         raise TypeError
@@ -115,7 +213,8 @@ def backward(A, pobs, T=None, beta_out=None, dtype=numpy.float32):
 #         raise ValueError
 #
 #
-def transition_counts(alpha, beta, A, pobs, T = None, out = None, dtype=numpy.float32):
+def transition_counts(alpha, beta, A, pobs, T = None, out = None, dtype=numpy.float32, logspace=False):
+    cdef int n, t
     # set T
     if (T is None):
         T = pobs.shape[0] # if not set, use the length of pobs as trajectory length
@@ -127,13 +226,13 @@ def transition_counts(alpha, beta, A, pobs, T = None, out = None, dtype=numpy.fl
     # output
     #cdef numpy.ndarray[double, ndim=2, mode="c"] C = numpy.zeros( (N,N), dtype=numpy.double, order='C' )
     if out is None:
-        C = cdef_double_array(N,N)
+        C = cdef_array(N,N,dtype)
     else:
         C = out
         #cdef numpy.ndarray[double, ndim=2, mode="c"] out = numpy.zeros( (N,N), dtype=numpy.double, order='C' )
+    n = N
+    t = T
 
-    #if dtype == numpy.float32:
-    #    return ext.forward32(A, pobs, pi)
     if dtype == numpy.float64:
         pC     = <double*> numpy.PyArray_DATA(C)
         pA     = <double*> numpy.PyArray_DATA(A)
@@ -141,51 +240,490 @@ def transition_counts(alpha, beta, A, pobs, T = None, out = None, dtype=numpy.fl
         palpha = <double*> numpy.PyArray_DATA(alpha)
         pbeta  = <double*> numpy.PyArray_DATA(beta)
         # call
-        _compute_transition_counts(pC, pA, ppobs, palpha, pbeta, N, T)
+        if logspace:
+            with nogil:
+                _compute_transition_counts_log(pC, pA, ppobs, palpha, pbeta, n, t)
+        else:
+            with nogil:
+                _compute_transition_counts(pC, pA, ppobs, palpha, pbeta, n, t)
+        return C
+    elif dtype == numpy.float32:
+        A = numpy.ascontiguousarray(A, dtype=numpy.float32)
+        pobs = numpy.ascontiguousarray(pobs, dtype=numpy.float32)
+        alpha = numpy.ascontiguousarray(alpha, dtype=numpy.float32)
+        beta = numpy.ascontiguousarray(beta, dtype=numpy.float32)
+        pC32     = <float*> numpy.PyArray_DATA(C)
+        pA32     = <float*> numpy.PyArray_DATA(A)
+        ppobs32  = <float*> numpy.PyArray_DATA(pobs)
+        palpha32 = <float*> numpy.PyArray_DATA(alpha)
+        pbeta32  = <float*> numpy.PyArray_DATA(beta)
+        # call
+        if logspace:
+            with nogil:
+                _compute_transition_counts_log32(pC32, pA32, ppobs32, palpha32, pbeta32, n, t)
+        else:
+            with nogil:
+                _compute_transition_counts32(pC32, pA32, ppobs32, palpha32, pbeta32, n, t)
         return C
     else:
         raise TypeError
 
 
-def viterbi(A, pobs, pi, dtype=numpy.float32):
+def transfer_matrix(A, pobs, T=None, out=None, dtype=numpy.float32, logspace=False):
+    cdef int n, t
+    # set T
+    if (T is None):
+        T = pobs.shape[0] # if not set, use the length of pobs as trajectory length
+    elif T > pobs.shape[0]:
+        raise ValueError('T must be at most the length of pobs.')
+    N = A.shape[0]
+    if out is None:
+        P = cdef_array(N,N,dtype)
+    else:
+        P = out
+    n = N
+    t = T
+
+    if dtype == numpy.float64:
+        pP     = <double*> numpy.PyArray_DATA(P)
+        pA     = <double*> numpy.PyArray_DATA(A)
+        ppobs  = <double*> numpy.PyArray_DATA(pobs)
+        # call
+        if logspace:
+            with nogil:
+                _transfer_matrix_log(pP, pA, ppobs, n, t)
+        else:
+            with nogil:
+                _transfer_matrix(pP, pA, ppobs, n, t)
+        return P
+    elif dtype == numpy.float32:
+        A = numpy.ascontiguousarray(A, dtype=numpy.float32)
+        pobs = numpy.ascontiguousarray(pobs, dtype=numpy.float32)
+        pP32     = <float*> numpy.PyArray_DATA(P)
+        pA32     = <float*> numpy.PyArray_DATA(A)
+        ppobs32  = <float*> numpy.PyArray_DATA(pobs)
+        # call
+        if logspace:
+            with nogil:
+                _transfer_matrix_log32(pP32, pA32, ppobs32, n, t)
+        else:
+            with nogil:
+                _transfer_matrix32(pP32, pA32, ppobs32, n, t)
+        return P
+    else:
+        raise TypeError
+
+
+def forward_backward_batch(A, pobs, pi, offsets, gamma_out=None, C_out=None, dtype=numpy.float32, logspace=False):
+    cdef int N, K
+    # number of trajectories and states
+    K = len(offsets) - 1
+    N = A.shape[0]
+    if offsets[K] > pobs.shape[0]:
+        raise ValueError('offsets point beyond the end of pobs.')
+    # offsets must be passed as a contiguous int array
+    cdef numpy.ndarray[int, ndim=1, mode="c"] offs
+    offs = numpy.ascontiguousarray(offsets, dtype=ctypes.c_int)
+    # prepare output arrays
+    logprobs = numpy.zeros( (K), dtype=numpy.double, order='C' )
+    if gamma_out is None:
+        gamma = cdef_array(offsets[K],N,dtype)
+    elif offsets[K] > gamma_out.shape[0]:
+        raise ValueError('gamma_out must at least have the total length of all trajectories.')
+    else:
+        gamma = gamma_out
+    if C_out is None:
+        C = cdef_array(N,N,dtype)
+    else:
+        C = C_out
+
+    plogprobs = <double*> numpy.PyArray_DATA(logprobs)
+    poffs     = <int*>    numpy.PyArray_DATA(offs)
+    if dtype == numpy.float64:
+        pgamma    = <double*> numpy.PyArray_DATA(gamma)
+        pC        = <double*> numpy.PyArray_DATA(C)
+        pA        = <double*> numpy.PyArray_DATA(A)
+        ppobs     = <double*> numpy.PyArray_DATA(pobs)
+        ppi       = <double*> numpy.PyArray_DATA(pi)
+        # call
+        if logspace:
+            with nogil:
+                _forward_backward_batch_log(plogprobs, pgamma, pC, pA, ppobs, ppi, poffs, N, K)
+        else:
+            with nogil:
+                _forward_backward_batch(plogprobs, pgamma, pC, pA, ppobs, ppi, poffs, N, K)
+        return logprobs, gamma, C
+    elif dtype == numpy.float32:
+        A = numpy.ascontiguousarray(A, dtype=numpy.float32)
+        pobs = numpy.ascontiguousarray(pobs, dtype=numpy.float32)
+        pi = numpy.ascontiguousarray(pi, dtype=numpy.float32)
+        pgamma32  = <float*> numpy.PyArray_DATA(gamma)
+        pC32      = <float*> numpy.PyArray_DATA(C)
+        pA32      = <float*> numpy.PyArray_DATA(A)
+        ppobs32   = <float*> numpy.PyArray_DATA(pobs)
+        ppi32     = <float*> numpy.PyArray_DATA(pi)
+        # call
+        if logspace:
+            with nogil:
+                _forward_backward_batch_log32(plogprobs, pgamma32, pC32, pA32, ppobs32, ppi32, poffs, N, K)
+        else:
+            with nogil:
+                _forward_backward_batch32(plogprobs, pgamma32, pC32, pA32, ppobs32, ppi32, poffs, N, K)
+        return logprobs, gamma, C
+    else:
+        raise TypeError
+
+
+def forward_backward_batch_gaussian(A, obs, means, sigmas, pi, offsets, gamma_out=None, C_out=None, dtype=numpy.float32):
+    cdef int N, K
+    # number of trajectories and states
+    K = len(offsets) - 1
+    N = A.shape[0]
+    if offsets[K] > obs.shape[0]:
+        raise ValueError('offsets point beyond the end of obs.')
+    # offsets must be passed as a contiguous int array
+    cdef numpy.ndarray[int, ndim=1, mode="c"] offs
+    offs = numpy.ascontiguousarray(offsets, dtype=ctypes.c_int)
+    # prepare output arrays
+    logprobs = numpy.zeros( (K), dtype=numpy.double, order='C' )
+    if gamma_out is None:
+        gamma = cdef_array(offsets[K],N,dtype)
+    elif offsets[K] > gamma_out.shape[0]:
+        raise ValueError('gamma_out must at least have the total length of all trajectories.')
+    else:
+        gamma = gamma_out
+    if C_out is None:
+        C = cdef_array(N,N,dtype)
+    else:
+        C = C_out
+    # observations and output model parameters usually don't come in the kernel precision
+    A = numpy.ascontiguousarray(A, dtype=dtype)
+    obs = numpy.ascontiguousarray(obs, dtype=dtype)
+    means = numpy.ascontiguousarray(means, dtype=dtype)
+    sigmas = numpy.ascontiguousarray(sigmas, dtype=dtype)
+    pi = numpy.ascontiguousarray(pi, dtype=dtype)
+
+    plogprobs = <double*> numpy.PyArray_DATA(logprobs)
+    poffs     = <int*>    numpy.PyArray_DATA(offs)
+    if dtype == numpy.float64:
+        pgamma    = <double*> numpy.PyArray_DATA(gamma)
+        pC        = <double*> numpy.PyArray_DATA(C)
+        pA        = <double*> numpy.PyArray_DATA(A)
+        pobs      = <double*> numpy.PyArray_DATA(obs)
+        pmeans    = <double*> numpy.PyArray_DATA(means)
+        psigmas   = <double*> numpy.PyArray_DATA(sigmas)
+        ppi       = <double*> numpy.PyArray_DATA(pi)
+        # call
+        with nogil:
+            _forward_backward_batch_gaussian(plogprobs, pgamma, pC, pA, pobs, pmeans, psigmas, ppi, poffs, N, K)
+        return logprobs, gamma, C
+    elif dtype == numpy.float32:
+        pgamma32  = <float*> numpy.PyArray_DATA(gamma)
+        pC32      = <float*> numpy.PyArray_DATA(C)
+        pA32      = <float*> numpy.PyArray_DATA(A)
+        pobs32    = <float*> numpy.PyArray_DATA(obs)
+        pmeans32  = <float*> numpy.PyArray_DATA(means)
+        psigmas32 = <float*> numpy.PyArray_DATA(sigmas)
+        ppi32     = <float*> numpy.PyArray_DATA(pi)
+        # call
+        with nogil:
+            _forward_backward_batch_gaussian32(plogprobs, pgamma32, pC32, pA32, pobs32, pmeans32, psigmas32, ppi32, poffs, N, K)
+        return logprobs, gamma, C
+    else:
+        raise TypeError
+
+def loglikelihood(A, pobs, pi, T=None, dtype=numpy.float32, logspace=False):
+    cdef int n, t
+    cdef double logprob
+    # set T
+    if (T is None):
+        T = pobs.shape[0] # if not set, use the length of pobs as trajectory length
+    elif T > pobs.shape[0]:
+        raise ValueError('T must be at most the length of pobs.')
+    n = A.shape[0]
+    t = T
+
+    if dtype == numpy.float64:
+        pA    = <double*> numpy.PyArray_DATA(A)
+        ppobs = <double*> numpy.PyArray_DATA(pobs)
+        ppi   = <double*> numpy.PyArray_DATA(pi)
+        # call
+        if logspace:
+            with nogil:
+                logprob = _loglikelihood_log(pA, ppobs, ppi, n, t)
+        else:
+            with nogil:
+                logprob = _loglikelihood(pA, ppobs, ppi, n, t)
+        return logprob
+    elif dtype == numpy.float32:
+        A = numpy.ascontiguousarray(A, dtype=numpy.float32)
+        pobs = numpy.ascontiguousarray(pobs, dtype=numpy.float32)
+        pi = numpy.ascontiguousarray(pi, dtype=numpy.float32)
+        pA32    = <float*> numpy.PyArray_DATA(A)
+        ppobs32 = <float*> numpy.PyArray_DATA(pobs)
+        ppi32   = <float*> numpy.PyArray_DATA(pi)
+        # call
+        if logspace:
+            with nogil:
+                logprob = _loglikelihood_log32(pA32, ppobs32, ppi32, n, t)
+        else:
+            with nogil:
+                logprob = _loglikelihood32(pA32, ppobs32, ppi32, n, t)
+        return logprob
+    else:
+        raise TypeError
+
+
+def loglikelihood_batch(A, pobs, pi, offsets, dtype=numpy.float32, logspace=False):
+    cdef int N, K
+    K = len(offsets) - 1
+    N = A.shape[0]
+    if offsets[K] > pobs.shape[0]:
+        raise ValueError('offsets point beyond the end of pobs.')
+    cdef numpy.ndarray[int, ndim=1, mode="c"] offs
+    offs = numpy.ascontiguousarray(offsets, dtype=ctypes.c_int)
+    logprobs = numpy.zeros( (K), dtype=numpy.double, order='C' )
+
+    plogprobs = <double*> numpy.PyArray_DATA(logprobs)
+    poffs     = <int*>    numpy.PyArray_DATA(offs)
+    if dtype == numpy.float64:
+        pA    = <double*> numpy.PyArray_DATA(A)
+        ppobs = <double*> numpy.PyArray_DATA(pobs)
+        ppi   = <double*> numpy.PyArray_DATA(pi)
+        # call
+        if logspace:
+            with nogil:
+                _loglikelihood_batch_log(plogprobs, pA, ppobs, ppi, poffs, N, K)
+        else:
+            with nogil:
+                _loglikelihood_batch(plogprobs, pA, ppobs, ppi, poffs, N, K)
+        return logprobs
+    elif dtype == numpy.float32:
+        A = numpy.ascontiguousarray(A, dtype=numpy.float32)
+        pobs = numpy.ascontiguousarray(pobs, dtype=numpy.float32)
+        pi = numpy.ascontiguousarray(pi, dtype=numpy.float32)
+        pA32    = <float*> numpy.PyArray_DATA(A)
+        ppobs32 = <float*> numpy.PyArray_DATA(pobs)
+        ppi32   = <float*> numpy.PyArray_DATA(pi)
+        # call
+        if logspace:
+            with nogil:
+                _loglikelihood_batch_log32(plogprobs, pA32, ppobs32, ppi32, poffs, N, K)
+        else:
+            with nogil:
+                _loglikelihood_batch32(plogprobs, pA32, ppobs32, ppi32, poffs, N, K)
+        return logprobs
+    else:
+        raise TypeError
+
+
+def loglikelihood_batch_gaussian(A, obs, means, sigmas, pi, offsets, dtype=numpy.float32):
+    cdef int N, K
+    K = len(offsets) - 1
+    N = A.shape[0]
+    if offsets[K] > obs.shape[0]:
+        raise ValueError('offsets point beyond the end of obs.')
+    cdef numpy.ndarray[int, ndim=1, mode="c"] offs
+    offs = numpy.ascontiguousarray(offsets, dtype=ctypes.c_int)
+    logprobs = numpy.zeros( (K), dtype=numpy.double, order='C' )
+    # observations and output model parameters usually don't come in the kernel precision
+    A = numpy.ascontiguousarray(A, dtype=dtype)
+    obs = numpy.ascontiguousarray(obs, dtype=dtype)
+    means = numpy.ascontiguousarray(means, dtype=dtype)
+    sigmas = numpy.ascontiguousarray(sigmas, dtype=dtype)
+    pi = numpy.ascontiguousarray(pi, dtype=dtype)
+
+    plogprobs = <double*> numpy.PyArray_DATA(logprobs)
+    poffs     = <int*>    numpy.PyArray_DATA(offs)
+    if dtype == numpy.float64:
+        pA      = <double*> numpy.PyArray_DATA(A)
+        pobs    = <double*> numpy.PyArray_DATA(obs)
+        pmeans  = <double*> numpy.PyArray_DATA(means)
+        psigmas = <double*> numpy.PyArray_DATA(sigmas)
+        ppi     = <double*> numpy.PyArray_DATA(pi)
+        # call
+        with nogil:
+            _loglikelihood_batch_gaussian(plogprobs, pA, pobs, pmeans, psigmas, ppi, poffs, N, K)
+        return logprobs
+    elif dtype == numpy.float32:
+        pA32      = <float*> numpy.PyArray_DATA(A)
+        pobs32    = <float*> numpy.PyArray_DATA(obs)
+        pmeans32  = <float*> numpy.PyArray_DATA(means)
+        psigmas32 = <float*> numpy.PyArray_DATA(sigmas)
+        ppi32     = <float*> numpy.PyArray_DATA(pi)
+        # call
+        with nogil:
+            _loglikelihood_batch_gaussian32(plogprobs, pA32, pobs32, pmeans32, psigmas32, ppi32, poffs, N, K)
+        return logprobs
+    else:
+        raise TypeError
+
+def viterbi(A, pobs, pi, segment_length=None, dtype=numpy.float32, logspace=False):
+    cdef int n, t, s
     N = A.shape[0]
     T = pobs.shape[0]
     # prepare path array
     cdef numpy.ndarray[int, ndim=1, mode="c"] path
     path = numpy.zeros( (T), dtype=ctypes.c_int, order='C' )
+    n = N
+    t = T
+    s = 0 if segment_length is None else segment_length
 
-    #if dtype == numpy.float32:
-    #    return ext.forward32(A, pobs, pi)
+    ppath = <int*> numpy.PyArray_DATA(path)
     if dtype == numpy.float64:
-        ppath = <int*>    numpy.PyArray_DATA(path)
         pA    = <double*> numpy.PyArray_DATA(A)
         ppobs = <double*> numpy.PyArray_DATA(pobs)
         ppi   = <double*> numpy.PyArray_DATA(pi)
         # call
-        _compute_viterbi(ppath, pA, ppobs, ppi, N, T)
+        if logspace:
+            with nogil:
+                _viterbi_log(ppath, pA, ppobs, ppi, n, t, s)
+        else:
+            with nogil:
+                _viterbi(ppath, pA, ppobs, ppi, n, t, s)
+        return path
+    elif dtype == numpy.float32:
+        A = numpy.ascontiguousarray(A, dtype=numpy.float32)
+        pobs = numpy.ascontiguousarray(pobs, dtype=numpy.float32)
+        pi = numpy.ascontiguousarray(pi, dtype=numpy.float32)
+        pA32    = <float*> numpy.PyArray_DATA(A)
+        ppobs32 = <float*> numpy.PyArray_DATA(pobs)
+        ppi32   = <float*> numpy.PyArray_DATA(pi)
+        # call
+        if logspace:
+            with nogil:
+                _viterbi_log32(ppath, pA32, ppobs32, ppi32, n, t, s)
+        else:
+            with nogil:
+                _viterbi32(ppath, pA32, ppobs32, ppi32, n, t, s)
         return path
     else:
         raise TypeError
 
 
-def sample_path(alpha, A, pobs, T = None, dtype=numpy.float32):
+def viterbi_gaussian(A, obs, means, sigmas, pi, segment_length=None, dtype=numpy.float32):
+    cdef int n, t, s
+    N = A.shape[0]
+    T = obs.shape[0]
+    # prepare path array
+    cdef numpy.ndarray[int, ndim=1, mode="c"] path
+    path = numpy.zeros( (T), dtype=ctypes.c_int, order='C' )
+    n = N
+    t = T
+    s = 0 if segment_length is None else segment_length
+    # observations and output model parameters usually don't come in the kernel precision
+    A = numpy.ascontiguousarray(A, dtype=dtype)
+    obs = numpy.ascontiguousarray(obs, dtype=dtype)
+    means = numpy.ascontiguousarray(means, dtype=dtype)
+    sigmas = numpy.ascontiguousarray(sigmas, dtype=dtype)
+    pi = numpy.ascontiguousarray(pi, dtype=dtype)
+
+    ppath = <int*> numpy.PyArray_DATA(path)
+    if dtype == numpy.float64:
+        pA      = <double*> numpy.PyArray_DATA(A)
+        pobs    = <double*> numpy.PyArray_DATA(obs)
+        pmeans  = <double*> numpy.PyArray_DATA(means)
+        psigmas = <double*> numpy.PyArray_DATA(sigmas)
+        ppi     = <double*> numpy.PyArray_DATA(pi)
+        # call
+        with nogil:
+            _viterbi_gaussian(ppath, pA, pobs, pmeans, psigmas, ppi, n, t, s)
+        return path
+    elif dtype == numpy.float32:
+        pA32      = <float*> numpy.PyArray_DATA(A)
+        pobs32    = <float*> numpy.PyArray_DATA(obs)
+        pmeans32  = <float*> numpy.PyArray_DATA(means)
+        psigmas32 = <float*> numpy.PyArray_DATA(sigmas)
+        ppi32     = <float*> numpy.PyArray_DATA(pi)
+        # call
+        with nogil:
+            _viterbi_gaussian32(ppath, pA32, pobs32, pmeans32, psigmas32, ppi32, n, t, s)
+        return path
+    else:
+        raise TypeError
+
+
+def create_rng_state(seed, stream=0):
+    state = numpy.zeros( (4), dtype=numpy.uint64, order='C' )
+    pstate = <uint64_t*> numpy.PyArray_DATA(state)
+    _rng_seed(pstate, seed, stream)
+    return state
+
+
+def sample_path(alpha, A, pobs, T = None, rng_state = None, dtype=numpy.float32):
+    cdef int n, t
     N = pobs.shape[1]
     # set T
     if (T is None):
         T = pobs.shape[0] # if not set, use the length of pobs as trajectory length
     elif T > pobs.shape[0] or T > alpha.shape[0]:
         raise ValueError('T must be at most the length of pobs and alpha.')
+    # the random number generator state is advanced in place
+    if rng_state is None:
+        rng_state = create_rng_state(numpy.random.randint(2**31))
+    elif rng_state.dtype != numpy.uint64 or rng_state.shape != (4,) or not rng_state.flags['C_CONTIGUOUS']:
+        raise ValueError('rng_state must be a contiguous uint64 array of length 4, as created by create_rng_state.')
     # prepare path array
     cdef numpy.ndarray[int, ndim=1, mode="c"] path
     path = numpy.zeros( (T), dtype=ctypes.c_int, order='C' )
+    n = N
+    t = T
 
+    # the sampling kernel only exists in double precision
+    if dtype == numpy.float32:
+        alpha = numpy.ascontiguousarray(alpha, dtype=numpy.float64)
+        A = numpy.ascontiguousarray(A, dtype=numpy.float64)
+        pobs = numpy.ascontiguousarray(pobs, dtype=numpy.float64)
+        dtype = numpy.float64
     if dtype == numpy.float64:
         ppath  = <int*>    numpy.PyArray_DATA(path)
         palpha = <double*> numpy.PyArray_DATA(alpha)
         pA     = <double*> numpy.PyArray_DATA(A)
         ppobs  = <double*> numpy.PyArray_DATA(pobs)
+        pstate = <uint64_t*> numpy.PyArray_DATA(rng_state)
         # call
-        _sample_path(ppath, palpha, pA, ppobs, N, T)
+        with nogil:
+            _sample_path(ppath, palpha, pA, ppobs, n, t, pstate)
         return path
     else:
         raise TypeError
+
+
+def sample_paths(alpha, A, pobs, nsamples, T = None, rng_state = None, dtype=numpy.float32):
+    cdef int n, t, k
+    N = pobs.shape[1]
+    # set T
+    if (T is None):
+        T = pobs.shape[0] # if not set, use the length of pobs as trajectory length
+    elif T > pobs.shape[0] or T > alpha.shape[0]:
+        raise ValueError('T must be at most the length of pobs and alpha.')
+    # the random number generator state is advanced in place
+    if rng_state is None:
+        rng_state = create_rng_state(numpy.random.randint(2**31))
+    elif rng_state.dtype != numpy.uint64 or rng_state.shape != (4,) or not rng_state.flags['C_CONTIGUOUS']:
+        raise ValueError('rng_state must be a contiguous uint64 array of length 4, as created by create_rng_state.')
+    # prepare path array
+    cdef numpy.ndarray[int, ndim=2, mode="c"] paths
+    paths = numpy.zeros( (nsamples, T), dtype=ctypes.c_int, order='C' )
+    n = N
+    t = T
+    k = nsamples
+
+    # the sampling kernel only exists in double precision
+    if dtype == numpy.float32:
+        alpha = numpy.ascontiguousarray(alpha, dtype=numpy.float64)
+        A = numpy.ascontiguousarray(A, dtype=numpy.float64)
+        pobs = numpy.ascontiguousarray(pobs, dtype=numpy.float64)
+        dtype = numpy.float64
+    if dtype == numpy.float64:
+        ppaths = <int*>    numpy.PyArray_DATA(paths)
+        palpha = <double*> numpy.PyArray_DATA(alpha)
+        pA     = <double*> numpy.PyArray_DATA(A)
+        ppobs  = <double*> numpy.PyArray_DATA(pobs)
+        pstate = <uint64_t*> numpy.PyArray_DATA(rng_state)
+        # call
+        with nogil:
+            _sample_paths(ppaths, palpha, pA, ppobs, n, t, k, pstate)
+        return paths
+    else:
+        raise TypeError
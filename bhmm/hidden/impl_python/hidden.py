@@ -18,7 +18,38 @@ __maintainer__ = "Frank Noe"
 __email__="frank.noe AT fu-berlin DOT de"
 
 
-def forward(A, pobs, pi, T=None, alpha_out=None, dtype=np.float32):
+def rescaled_emissions(pobs, logspace=False):
+    """ Rescale each row of observation probabilities by its maximum.
+
+    The forward-backward recursions are invariant to a constant factor per time step, except for the likelihood
+    which is corrected by the returned log-factors. Rescaling keeps the products in the recursions away from
+    the underflow limit.
+
+    Parameters
+    ----------
+    pobs : ndarray((T,N), dtype = float)
+        pobs[t,i] is the observation probability for observation at time t given hidden state i
+    logspace : bool, optional, default = False
+        if True, pobs contains the logarithms of observation probabilities
+
+    Returns
+    -------
+    e : ndarray((T,N), dtype = float)
+        rescaled observation probabilities with a maximum of 1 in each row
+    logscale : ndarray((T), dtype = float)
+        logarithm of the factor each row has been divided by
+
+    """
+    m = np.max(pobs, axis=1)
+    if logspace:
+        return np.exp(pobs - m[:,None]), m
+    with np.errstate(divide='ignore', invalid='ignore'):
+        e = pobs / m[:,None]
+        e[m <= 0] = 0.0
+        return e, np.log(m)
+
+
+def forward(A, pobs, pi, T=None, alpha_out=None, dtype=np.float32, logspace=False):
     """Compute P( obs | A, B, pi ) and all forward coefficients.
 
     Parameters
@@ -35,6 +66,8 @@ def forward(A, pobs, pi, T=None, alpha_out=None, dtype=np.float32):
         containter for the alpha result variables. If None, a new container will be created.
     dtype : type, optional, default = np.float32
         data type of the result.
+    logspace : bool, optional, default = False
+        if True, pobs contains the logarithms of observation probabilities
 
     Returns
     -------
@@ -58,8 +91,13 @@ def forward(A, pobs, pi, T=None, alpha_out=None, dtype=np.float32):
         alpha_out = np.zeros((T,N), dtype=dtype)
     elif T > alpha_out.shape[0]:
         raise ValueError('alpha_out must at least have length T in order to fit trajectory.')
-    # log-likelihood
-    logprob = 0.0
+    # compute in the result type, as the products below are written into alpha_out
+    A = np.asarray(A, dtype=dtype)
+    pi = np.asarray(pi, dtype=dtype)
+    # rescaled observation probabilities, log-likelihood of the scaling
+    pobs, logscale = rescaled_emissions(pobs[:T], logspace=logspace)
+    pobs = np.asarray(pobs, dtype=dtype)
+    logprob = np.sum(logscale, dtype=np.float64)
 
     # initial values
     # alpha_i(0) = pi_i * B_i,ob[0]
@@ -84,7 +122,7 @@ def forward(A, pobs, pi, T=None, alpha_out=None, dtype=np.float32):
     return (logprob, alpha_out)
 
 
-def backward(A, pobs, T=None, beta_out=None, dtype=np.float32):
+def backward(A, pobs, T=None, beta_out=None, dtype=np.float32, logspace=False):
     """Compute all backward coefficients. With scaling!
 
     Parameters
@@ -97,6 +135,8 @@ def backward(A, pobs, T=None, beta_out=None, dtype=np.float32):
         containter for the beta result variables. If None, a new container will be created.
     dtype : type, optional, default = np.float32
         data type of the result.
+    logspace : bool, optional, default = False
+        if True, pobs contains the logarithms of observation probabilities
 
     Returns
     -------
@@ -117,6 +157,9 @@ def backward(A, pobs, T=None, beta_out=None, dtype=np.float32):
         beta_out = np.zeros((T,N), dtype=dtype)
     elif T > beta_out.shape[0]:
         raise ValueError('beta_out must at least have length T in order to fit trajectory.')
+    # rescaled observation probabilities. Compute in the result type, as np.dot requires an out of the same type.
+    A = np.asarray(A, dtype=dtype)
+    pobs = np.asarray(rescaled_emissions(pobs[:T], logspace=logspace)[0], dtype=dtype)
 
     # initialization
     beta_out[T-1,:] = 1.0
@@ -136,7 +179,7 @@ def backward(A, pobs, T=None, beta_out=None, dtype=np.float32):
     return beta_out
 
 
-def transition_counts(alpha, beta, A, pobs, T = None, out = None, dtype=np.float32):
+def transition_counts(alpha, beta, A, pobs, T = None, out = None, dtype=np.float32, block_size=100000, logspace=False):
     """ Sum for all t the probability to transition from state i to state j.
 
     Parameters
@@ -155,6 +198,10 @@ def transition_counts(alpha, beta, A, pobs, T = None, out = None, dtype=np.float
         containter for the resulting count matrix. If None, a new matrix will be created.
     dtype : type, optional, default = np.float32
         data type of the result.
+    block_size : int, optional, default = 100000
+        number of time steps that are processed at once. Temporary memory is of order block_size * N.
+    logspace : bool, optional, default = False
+        if True, pobs contains the logarithms of observation probabilities
 
     Returns
     -------
@@ -179,20 +226,328 @@ def transition_counts(alpha, beta, A, pobs, T = None, out = None, dtype=np.float
         out = np.zeros( (N,N), dtype=dtype, order='C' )
     else:
         out[:] = 0.0
-    # compute transition counts
-    xi = np.zeros( (N,N), dtype=dtype, order='C' )
-    for t in range(T-1):
-        # xi_i,j(t) = alpha_i(t) * A_i,j * B_j,ob(t+1) * beta_j(t+1)
-        np.dot(alpha[t,:][:,None] * A, np.diag(pobs[t+1,:] * beta[t+1,:]), out = xi)
-        # normalize to 1 for each time step
-        xi /= np.sum(xi)
-        # add to counts
-        np.add(out, xi, out)
+    A = np.asarray(A, dtype=dtype)
+    # compute transition counts block-wise over time
+    # xi_i,j(t) = alpha_i(t) * A_i,j * B_j,ob(t+1) * beta_j(t+1), normalized to 1 for each time step
+    for t0 in range(0, T-1, block_size):
+        t1 = min(t0 + block_size, T-1)
+        a = alpha[t0:t1,:]
+        b = np.asarray(rescaled_emissions(pobs[t0+1:t1+1,:], logspace=logspace)[0], dtype=dtype) * beta[t0+1:t1+1,:]
+        # normalization of each time step: sum_i,j xi_i,j(t)
+        norm = np.sum(np.dot(a, A) * b, axis=1)
+        # sum_t alpha_i(t) * b_j(t) / norm(t), then multiply with A_i,j
+        out += A * np.dot(a.T, b / norm[:,None])
     # return
     return out
 
 
-def viterbi(A, pobs, pi, dtype=np.float32):
+def transfer_matrix(A, pobs, T=None, out=None, dtype=np.float32, logspace=False):
+    """ Compute the product of A diag(pobs[t]) over all time steps, up to a constant factor.
+
+    Parameters
+    ----------
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    pobs : ndarray((T,N), dtype = float)
+        pobs[t,i] is the observation probability for observation at time t given hidden state i
+    T : int, optional, default = None
+        number of time steps. If not given, T = pobs.shape[0] will be used.
+    out : ndarray((N,N), dtype = float), optional, default = None
+        containter for the resulting matrix. If None, a new matrix will be created.
+    dtype : type, optional, default = np.float32
+        data type of the result.
+    logspace : bool, optional, default = False
+        if True, pobs contains the logarithms of observation probabilities
+
+    Returns
+    -------
+    P : ndarray((N,N), dtype = float)
+        transfer matrix, scaled such that its largest element is 1
+
+    """
+    # set T
+    if (T is None):
+        T = pobs.shape[0] # if not set, use the length of pobs as trajectory length
+    elif T > pobs.shape[0]:
+        raise ValueError('T must be at most the length of pobs.')
+    N = A.shape[0]
+    if out is None:
+        out = np.zeros((N,N), dtype=dtype)
+    e = rescaled_emissions(pobs[:T], logspace=logspace)[0]
+    P = np.eye(N)
+    for t in range(T):
+        # P = P A diag(e_t)
+        P = np.dot(P, A) * e[t][None,:]
+        # rescale
+        m = np.max(P)
+        if m > 0:
+            P /= m
+    out[:] = P
+    return out
+
+
+def forward_backward_batch(A, pobs, pi, offsets, gamma_out=None, C_out=None, dtype=np.float32, logspace=False):
+    """ Run forward-backward on a set of concatenated trajectories.
+
+    Parameters
+    ----------
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    pobs : ndarray((sum_k T_k,N), dtype = float)
+        observation probabilities of all K trajectories, concatenated along the time axis
+    pi : ndarray((N), dtype = float)
+        initial distribution of hidden states
+    offsets : ndarray((K+1), dtype = int)
+        trajectory k occupies the rows offsets[k]:offsets[k+1] of pobs
+    gamma_out : ndarray((sum_k T_k,N), dtype = float), optional, default = None
+        containter for the state probabilities. If None, a new container will be created.
+    C_out : ndarray((N,N), dtype = float), optional, default = None
+        containter for the summed transition count matrix. If None, a new matrix will be created.
+    dtype : type, optional, default = np.float32
+        data type of the result.
+    logspace : bool, optional, default = False
+        if True, pobs contains the logarithms of observation probabilities
+
+    Returns
+    -------
+    logprobs : ndarray((K), dtype = float)
+        log-likelihood of each trajectory
+    gamma : ndarray((sum_k T_k,N), dtype = float)
+        state probabilities of all trajectories, concatenated like pobs
+    C : ndarray((N,N), dtype = float)
+        transition counts summed over all trajectories
+
+    """
+    K = len(offsets) - 1
+    N = A.shape[0]
+    if offsets[K] > pobs.shape[0]:
+        raise ValueError('offsets point beyond the end of pobs.')
+    # output
+    logprobs = np.zeros((K), dtype=np.float64)
+    if gamma_out is None:
+        gamma_out = np.zeros((offsets[K],N), dtype=dtype)
+    elif offsets[K] > gamma_out.shape[0]:
+        raise ValueError('gamma_out must at least have the total length of all trajectories.')
+    if C_out is None:
+        C_out = np.zeros((N,N), dtype=dtype)
+    else:
+        C_out[:] = 0.0
+    # workspace for the longest trajectory
+    maxT = max([offsets[k+1] - offsets[k] for k in range(K)] + [0])
+    alpha = np.zeros((maxT,N), dtype=dtype)
+    beta = np.zeros((maxT,N), dtype=dtype)
+    C = np.zeros((N,N), dtype=dtype)
+    for k in range(K):
+        T = offsets[k+1] - offsets[k]
+        if T <= 0:
+            continue
+        pobs_k = pobs[offsets[k]:offsets[k+1]]
+        logprobs[k] = forward(A, pobs_k, pi, T=T, alpha_out=alpha, dtype=dtype, logspace=logspace)[0]
+        backward(A, pobs_k, T=T, beta_out=beta, dtype=dtype, logspace=logspace)
+        # gamma_i(t) = alpha_i(t) * beta_i(t), normalized for each t
+        gamma_k = gamma_out[offsets[k]:offsets[k+1]]
+        np.multiply(alpha[:T], beta[:T], out=gamma_k)
+        gamma_k /= np.sum(gamma_k, axis=1)[:,None]
+        # add to counts
+        transition_counts(alpha, beta, A, pobs_k, T=T, out=C, dtype=dtype, logspace=logspace)
+        np.add(C_out, C, C_out)
+    return logprobs, gamma_out, C_out
+
+
+def _gaussian_log_pobs(obs, means, sigmas):
+    """ Log observation probabilities of a one-dimensional Gaussian output model """
+    means = np.asarray(means, dtype=np.float64)
+    sigmas = np.asarray(sigmas, dtype=np.float64)
+    z = (np.asarray(obs, dtype=np.float64)[:,None] - means[None,:]) / sigmas[None,:]
+    return -0.5 * z**2 - np.log(sigmas)[None,:] - 0.5 * np.log(2.0 * np.pi)
+
+
+def forward_backward_batch_gaussian(A, obs, means, sigmas, pi, offsets, gamma_out=None, C_out=None, dtype=np.float32):
+    """ Run forward-backward with a one-dimensional Gaussian output model on a set of concatenated trajectories.
+
+    Equivalent to forward_backward_batch with the observation probabilities of the Gaussian output model, but the
+    observation probabilities are only evaluated for one trajectory at a time instead of for all of them.
+
+    Parameters
+    ----------
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    obs : ndarray((sum_k T_k), dtype = float)
+        observations of all K trajectories, concatenated along the time axis
+    means : ndarray((N), dtype = float)
+        means of the Gaussian output distributions of the hidden states
+    sigmas : ndarray((N), dtype = float)
+        standard deviations of the Gaussian output distributions of the hidden states
+    pi : ndarray((N), dtype = float)
+        initial distribution of hidden states
+    offsets : ndarray((K+1), dtype = int)
+        trajectory k occupies the elements offsets[k]:offsets[k+1] of obs
+    gamma_out : ndarray((sum_k T_k,N), dtype = float), optional, default = None
+        containter for the state probabilities. If None, a new container will be created.
+    C_out : ndarray((N,N), dtype = float), optional, default = None
+        containter for the summed transition count matrix. If None, a new matrix will be created.
+    dtype : type, optional, default = np.float32
+        data type of the result.
+
+    Returns
+    -------
+    logprobs : ndarray((K), dtype = float)
+        log-likelihood of each trajectory
+    gamma : ndarray((sum_k T_k,N), dtype = float)
+        state probabilities of all trajectories, concatenated like obs
+    C : ndarray((N,N), dtype = float)
+        transition counts summed over all trajectories
+
+    """
+    K = len(offsets) - 1
+    N = A.shape[0]
+    if offsets[K] > obs.shape[0]:
+        raise ValueError('offsets point beyond the end of obs.')
+    if gamma_out is None:
+        gamma_out = np.zeros((offsets[K],N), dtype=dtype)
+    if C_out is None:
+        C_out = np.zeros((N,N), dtype=dtype)
+    else:
+        C_out[:] = 0.0
+    C = np.zeros((N,N), dtype=dtype)
+    logprobs = np.zeros((K), dtype=np.float64)
+    for k in range(K):
+        if offsets[k+1] <= offsets[k]:
+            continue
+        # log observation probabilities of this trajectory only
+        logpobs = _gaussian_log_pobs(obs[offsets[k]:offsets[k+1]], means, sigmas)
+        logprobs[k:k+1] = forward_backward_batch(A, logpobs, pi, [0, len(logpobs)],
+                                                 gamma_out=gamma_out[offsets[k]:offsets[k+1]],
+                                                 C_out=C, dtype=dtype, logspace=True)[0]
+        np.add(C_out, C, C_out)
+    return logprobs, gamma_out, C_out
+
+def loglikelihood(A, pobs, pi, T=None, dtype=np.float32, block_size=100000, logspace=False):
+    """Compute log P( obs | A, B, pi ) without storing the forward coefficients.
+
+    Parameters
+    ----------
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    pobs : ndarray((T,N), dtype = float)
+        pobs[t,i] is the observation probability for observation at time t given hidden state i
+    pi : ndarray((N), dtype = float)
+        initial distribution of hidden states
+    T : int, optional, default = None
+        trajectory length. If not given, T = pobs.shape[0] will be used.
+    dtype : type, optional, default = np.float32
+        data type of the forward coefficients.
+    block_size : int, optional, default = 100000
+        number of time steps whose observation probabilities are rescaled at once
+    logspace : bool, optional, default = False
+        if True, pobs contains the logarithms of observation probabilities
+
+    Returns
+    -------
+    logprob : float
+        The probability to observe the sequence `ob` with the model given
+        by `A`, `B` and `pi`.
+
+    """
+    # set T
+    if (T is None):
+        T = pobs.shape[0] # if not set, use the length of pobs as trajectory length
+    elif T > pobs.shape[0]:
+        raise ValueError('T must be at most the length of pobs.')
+    logprob = 0.0
+    alpha = np.asarray(pi, dtype=dtype)
+    for t0 in range(0, T, block_size):
+        t1 = min(t0 + block_size, T)
+        e, logscale = rescaled_emissions(pobs[t0:t1], logspace=logspace)
+        logprob += np.sum(logscale)
+        for t in range(t1-t0):
+            if t0 + t > 0:
+                alpha = np.dot(alpha, A)
+            alpha = alpha * e[t]
+            scale = np.sum(alpha)
+            alpha /= scale
+            logprob += np.log(scale)
+    return logprob
+
+
+def loglikelihood_batch(A, pobs, pi, offsets, dtype=np.float32, logspace=False):
+    """Compute the log-likelihoods of a set of concatenated trajectories without storing forward coefficients.
+
+    Parameters
+    ----------
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    pobs : ndarray((sum_k T_k,N), dtype = float)
+        observation probabilities of all K trajectories, concatenated along the time axis
+    pi : ndarray((N), dtype = float)
+        initial distribution of hidden states
+    offsets : ndarray((K+1), dtype = int)
+        trajectory k occupies the rows offsets[k]:offsets[k+1] of pobs
+    dtype : type, optional, default = np.float32
+        data type of the forward coefficients.
+    logspace : bool, optional, default = False
+        if True, pobs contains the logarithms of observation probabilities
+
+    Returns
+    -------
+    logprobs : ndarray((K), dtype = float)
+        log-likelihood of each trajectory
+
+    """
+    K = len(offsets) - 1
+    if offsets[K] > pobs.shape[0]:
+        raise ValueError('offsets point beyond the end of pobs.')
+    logprobs = np.zeros((K), dtype=np.float64)
+    for k in range(K):
+        logprobs[k] = loglikelihood(A, pobs[offsets[k]:offsets[k+1]], pi, dtype=dtype, logspace=logspace)
+    return logprobs
+
+
+def loglikelihood_batch_gaussian(A, obs, means, sigmas, pi, offsets, dtype=np.float32):
+    """Compute the log-likelihoods of a set of concatenated trajectories with a one-dimensional Gaussian output model.
+
+    Parameters
+    ----------
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    obs : ndarray((sum_k T_k), dtype = float)
+        observations of all K trajectories, concatenated along the time axis
+    means : ndarray((N), dtype = float)
+        means of the Gaussian output distributions of the hidden states
+    sigmas : ndarray((N), dtype = float)
+        standard deviations of the Gaussian output distributions of the hidden states
+    pi : ndarray((N), dtype = float)
+        initial distribution of hidden states
+    offsets : ndarray((K+1), dtype = int)
+        trajectory k occupies the elements offsets[k]:offsets[k+1] of obs
+    dtype : type, optional, default = np.float32
+        data type of the forward coefficients.
+
+    Returns
+    -------
+    logprobs : ndarray((K), dtype = float)
+        log-likelihood of each trajectory
+
+    """
+    K = len(offsets) - 1
+    if offsets[K] > obs.shape[0]:
+        raise ValueError('offsets point beyond the end of obs.')
+    logprobs = np.zeros((K), dtype=np.float64)
+    for k in range(K):
+        logprobs[k] = loglikelihood(A, _gaussian_log_pobs(obs[offsets[k]:offsets[k+1]], means, sigmas), pi,
+                                    dtype=dtype, logspace=True)
+    return logprobs
+
+def traceback_dtype(N):
+    """ Smallest unsigned integer type that can hold the state indexes 0,...,N-1 """
+    if N <= 256:
+        return np.uint8
+    if N <= 65536:
+        return np.uint16
+    return np.int32
+
+
+def viterbi(A, pobs, pi, segment_length=None, dtype=np.float32, logspace=False):
     """ Estimate the hidden pathway of maximum likelihood using the Viterbi algorithm.
 
     Parameters
@@ -203,6 +558,13 @@ def viterbi(A, pobs, pi, dtype=np.float32):
         pobs[t,i] is the observation probability for observation at time t given hidden state i
     pi : ndarray((N), dtype = float)
         initial distribution of hidden states
+    segment_length : int, optional, default = None
+        if given, the traceback is only stored for one segment of this length at a time and recomputed from the
+        Viterbi scores at the segment start. Otherwise the traceback of the whole trajectory is stored.
+    dtype : type, optional, default = np.float32
+        data type of the observation probabilities (unused, the scores are computed in double precision)
+    logspace : bool, optional, default = False
+        if True, pobs contains the logarithms of observation probabilities
 
     Returns
     -------
@@ -211,41 +573,165 @@ def viterbi(A, pobs, pi, dtype=np.float32):
 
     """
     T,N = pobs.shape[0], pobs.shape[1]
-    # temporary viterbi state
-    v = np.zeros((N))
-    psi = np.zeros((T,N), dtype = int)
-    # initialize
-    v      = pi * pobs[0,:]
-    # rescale
-    v     /= v.sum()
-    psi[0] = 0.0
-    # iterate
-    for t in range(1,T):
-        vA = np.dot(np.diag(v), A)
-        # propagate v
-        v  = pobs[t,:] * np.max(vA, axis=0)
-        # rescale
-        v     /= v.sum()
-        psi[t] = np.argmax(vA, axis=0)
-    # iterate
-    q = np.zeros((T), dtype = int)
-    q[T-1] = np.argmax(v)
-    for t in range(T-2, -1, -1):
-        q[t] = psi[t+1,q[t+1]]
-    # done
+    if segment_length is None or segment_length <= 0 or segment_length > T:
+        segment_length = T
+    nseg = (T + segment_length - 1) // segment_length
+    with np.errstate(divide='ignore'):
+        logA = np.log(A)
+        logpi = np.log(pi)
+
+    def logpobs(t):
+        if logspace:
+            return pobs[t]
+        with np.errstate(divide='ignore'):
+            return np.log(pobs[t])
+
+    def step(v, t):
+        # scores of all predecessors i for each state j
+        s = v[:,None] + logA
+        psi = np.argmax(s, axis=0)
+        v = s[psi, np.arange(N)] + logpobs(t)
+        return shift_to_max(v), psi
+
+    def shift_to_max(v):
+        # the path is invariant to shifting all scores of a time step
+        vmax = np.max(v)
+        if np.isfinite(vmax):
+            v -= vmax
+        return v
+
+    # forward pass, keeping only the scores at the segment starts
+    v = shift_to_max(logpi + logpobs(0))
+    checkpoints = np.zeros((nseg,N))
+    for k in range(nseg):
+        checkpoints[k] = v
+        if k == nseg-1:
+            break
+        for t in range(k*segment_length, (k+1)*segment_length):
+            v = step(v, t+1)[0]
+    # backward over segments. Each segment is propagated one step into the next one, whose path is known.
+    q = np.zeros((T), dtype=int)
+    traceback = np.zeros((segment_length,N), dtype=traceback_dtype(N))
+    for k in range(nseg-1, -1, -1):
+        t0 = k*segment_length
+        t1 = T-1 if k == nseg-1 else (k+1)*segment_length
+        v = checkpoints[k]
+        for t in range(t0, t1):
+            v, traceback[t-t0] = step(v, t+1)
+        if k == nseg-1:
+            q[T-1] = np.argmax(v)
+        for t in range(t1, t0, -1):
+            q[t-1] = traceback[t-1-t0, q[t]]
     return q
 
 
-def sample_path(alpha, A, pobs, T = None, dtype=np.float32):
+def viterbi_gaussian(A, obs, means, sigmas, pi, segment_length=None, dtype=np.float32):
+    """ Estimate the hidden pathway of maximum likelihood for a one-dimensional Gaussian output model.
+
+    Parameters
+    ----------
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    obs : ndarray((T), dtype = float)
+        observation trajectory
+    means : ndarray((N), dtype = float)
+        means of the Gaussian output distributions of the hidden states
+    sigmas : ndarray((N), dtype = float)
+        standard deviations of the Gaussian output distributions of the hidden states
+    pi : ndarray((N), dtype = float)
+        initial distribution of hidden states
+    segment_length : int, optional, default = None
+        segment length of the traceback, see viterbi
+    dtype : type, optional, default = np.float32
+        data type of the observation probabilities (unused, the scores are computed in double precision)
+
+    Returns
+    -------
+    q : numpy.array shape (T)
+        maximum likelihood hidden path
+
+    """
+    return viterbi(A, _gaussian_log_pobs(obs, means, sigmas), pi, segment_length=segment_length, dtype=dtype,
+                   logspace=True)
+
+_MASK64 = (1 << 64) - 1
+
+
+def _splitmix64(x):
+    """ splitmix64 step. Returns the new state and the output """
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    z = x
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x, z ^ (z >> 31)
+
+
+def _rotl(x, k):
+    return ((x << k) | (x >> (64 - k))) & _MASK64
+
+
+def _rng_uniforms(state, n):
+    """ Draws n uniform random numbers in [0,1) with xoshiro256** and advances state in place """
+    s0, s1, s2, s3 = [int(x) for x in state]
+    u = np.zeros((n))
+    for k in range(n):
+        result = (_rotl((s1 * 5) & _MASK64, 7) * 9) & _MASK64
+        t = (s1 << 17) & _MASK64
+        s2 ^= s0
+        s3 ^= s1
+        s1 ^= s2
+        s0 ^= s3
+        s2 ^= t
+        s3 = _rotl(s3, 45)
+        u[k] = (result >> 11) * (1.0 / 9007199254740992.0)
+    state[:] = [s0, s1, s2, s3]
+    return u
+
+
+def create_rng_state(seed, stream=0):
+    """ Creates the state of random number stream `stream` for the sampling kernels
+
+    The random numbers are generated with xoshiro256**, whose state is initialized with splitmix64 from the seed and
+    the stream number. Different streams can be used independently, e.g. one per trajectory or thread.
+
+    Parameters
+    ----------
+    seed : int
+        random seed
+    stream : int, optional, default = 0
+        stream number
+
+    Returns
+    -------
+    state : ndarray((4), dtype = np.uint64)
+        generator state. Advanced in place by the sampling kernels.
+
     """
+    key = _splitmix64(int(seed) & _MASK64)[1]
+    # the first word of the splitmix64 sequence decorrelates neighboring stream numbers
+    x = _splitmix64(key ^ (int(stream) & _MASK64))[1]
+    state = np.zeros((4), dtype=np.uint64)
+    for i in range(4):
+        x, z = _splitmix64(x)
+        state[i] = z
+    return state
+
+
+def sample_path(alpha, A, pobs, T = None, rng_state = None, dtype=np.float32):
+    """ Sample the hidden pathway S from the conditional distribution P ( S | Parameters, Observations )
+
     alpha : ndarray((T,N), dtype = float), optional, default = None
         alpha[t,i] is the ith forward coefficient of time t.
-    beta : ndarray((T,N), dtype = float), optional, default = None
-        beta[t,i] is the ith forward coefficient of time t.
     A : ndarray((N,N), dtype = float)
         transition matrix of the hidden states
     pobs : ndarray((T,N), dtype = float)
         pobs[t,i] is the observation probability for observation at time t given hidden state i
+    T : int
+        number of time steps
+    rng_state : ndarray((4), dtype = np.uint64), optional, default = None
+        random number generator state as created by create_rng_state. Advanced in place. If None, a state is
+        seeded from numpy.random.
+
     """
     N = pobs.shape[1]
     # set T
@@ -253,22 +739,75 @@ def sample_path(alpha, A, pobs, T = None, dtype=np.float32):
         T = pobs.shape[0] # if not set, use the length of pobs as trajectory length
     elif T > pobs.shape[0] or T > alpha.shape[0]:
         raise ValueError('T must be at most the length of pobs and alpha.')
+    if rng_state is None:
+        rng_state = create_rng_state(np.random.randint(2**31))
+    u = _rng_uniforms(rng_state, T)
+    alpha = np.asarray(alpha, dtype=np.float64)
+    A = np.asarray(A, dtype=np.float64)
 
     # initialize path
     S = np.zeros((T), dtype=int)
 
-    # Sample final state.
-    psel = alpha[T-1,:]
-    psel /= psel.sum() # make sure it's normalized
-    # Draw from this distribution.
-    S[T-1] = np.random.choice(range(N), size=1, p=psel)
+    # Sample final state. Instead of normalizing, the uniform random number is scaled to the sum of weights.
+    cumulative = np.cumsum(alpha[T-1,:])
+    S[T-1] = min(np.searchsorted(cumulative, u[0] * cumulative[-1], side='right'), N-1)
+
+    # Work backwards from T-2 to 0.
+    for t in range(T-2, -1, -1):
+        # P(s_t = i | s_{t+1}..s_T) ~ alpha_i(t) A_ij with j = s_t+1
+        cumulative = np.cumsum(alpha[t,:] * A[:,S[t+1]])
+        S[t] = min(np.searchsorted(cumulative, u[T-1-t] * cumulative[-1], side='right'), N-1)
+
+    return S
+
+
+def sample_paths(alpha, A, pobs, nsamples, T = None, rng_state = None, dtype=np.float32):
+    """ Sample nsamples hidden pathways S from the conditional distribution P ( S | Parameters, Observations )
+
+    The backward sampling steps are vectorized across the paths. The random numbers are the same as for nsamples
+    calls of sample_path with the same rng_state, so that the paths are identical as well.
+
+    alpha : ndarray((T,N), dtype = float), optional, default = None
+        alpha[t,i] is the ith forward coefficient of time t.
+    A : ndarray((N,N), dtype = float)
+        transition matrix of the hidden states
+    pobs : ndarray((T,N), dtype = float)
+        pobs[t,i] is the observation probability for observation at time t given hidden state i
+    nsamples : int
+        number of paths
+    T : int
+        number of time steps
+    rng_state : ndarray((4), dtype = np.uint64), optional, default = None
+        random number generator state as created by create_rng_state. Advanced in place. If None, a state is
+        seeded from numpy.random.
+
+    """
+    N = pobs.shape[1]
+    # set T
+    if (T is None):
+        T = pobs.shape[0] # if not set, use the length of pobs as trajectory length
+    elif T > pobs.shape[0] or T > alpha.shape[0]:
+        raise ValueError('T must be at most the length of pobs and alpha.')
+    if rng_state is None:
+        rng_state = create_rng_state(np.random.randint(2**31))
+    # the random numbers of each path are consecutive, like for repeated calls of sample_path
+    u = _rng_uniforms(rng_state, nsamples * T).reshape((nsamples, T))
+    alpha = np.asarray(alpha, dtype=np.float64)
+    AT = np.ascontiguousarray(np.asarray(A, dtype=np.float64).T)
+
+    # initialize paths
+    S = np.zeros((nsamples, T), dtype=int)
+
+    # Sample final states. A state is the number of cumulative weights that are not larger than the scaled random
+    # number, as with searchsorted(side='right').
+    cumulative = np.cumsum(alpha[T-1,:])
+    S[:,T-1] = np.minimum(np.searchsorted(cumulative, u[:,0] * cumulative[-1], side='right'), N-1)
 
     # Work backwards from T-2 to 0.
     for t in range(T-2, -1, -1):
-        # Compute P(s_t = i | s_{t+1}..s_T).
-        psel = alpha[t,:] * A[:,S[t+1]]
-        psel /= psel.sum() # make sure it's normalized
-        # Draw from this distribution.
-        S[t] = np.random.choice(range(N), size=1, p=psel)
+        # P(s_t = i | s_{t+1}..s_T) ~ alpha_i(t) A_ij with j = s_t+1, for all paths at once
+        cumulative = np.cumsum(alpha[t,:][None,:] * AT[S[:,t+1]], axis=1)
+        x = u[:,T-1-t] * cumulative[:,-1]
+        S[:,t] = np.minimum(np.sum(cumulative <= x[:,None], axis=1), N-1)
 
-    return S
\ No newline at end of file
+    return S
@@ -5,7 +5,6 @@ import numpy as np
 from bhmm.hmm.generic_hmm import HMM
 from bhmm.hmm.generic_sampled_hmm import SampledHMM
 from bhmm.output_models.discrete import DiscreteOutputModel
-from bhmm.util import config
 from bhmm.util.statistics import confidence_interval_arr
 
 class DiscreteHMM(HMM, DiscreteOutputModel):
@@ -30,25 +29,24 @@ class SampledDiscreteHMM(DiscreteHMM, SampledHMM):
     ----------
     estimated_hmm : :class:`HMM <generic_hmm.HMM>`
         Representative HMM estimate, e.g. a maximum likelihood estimate or mean HMM.
-    sampled_hmms : list of :class:`HMM <generic_hmm.HMM>`
-        Sampled HMMs
+    sampled_hmms : :class:`HMMSampleStore <sample_store.HMMSampleStore>`, list of :class:`HMM <generic_hmm.HMM>` or str
+        Sampled HMMs or name of a sample file, see :class:`SampledHMM <generic_sampled_hmm.SampledHMM>`
     conf : float, optional, default = 0.95
         confidence interval, e.g. 0.68 for 1 sigma or 0.95 for 2 sigma.
+    nchains : int, optional, default = 1
+        number of independent chains the samples come from, see :class:`SampledHMM <generic_sampled_hmm.SampledHMM>`.
 
     """
-    def __init__(self, estimated_hmm, sampled_hmms, conf=0.95):
+    def __init__(self, estimated_hmm, sampled_hmms, conf=0.95, nchains=1):
         # call GaussianHMM superclass constructer with estimated_hmm
         DiscreteHMM.__init__(self, estimated_hmm)
         # call SampledHMM superclass constructor
-        SampledHMM.__init__(self, estimated_hmm, sampled_hmms, conf=conf)
+        SampledHMM.__init__(self, estimated_hmm, sampled_hmms, conf=conf, nchains=nchains)
 
     @property
     def output_probabilities_samples(self):
         r""" Samples of the output probability matrix """
-        res = np.empty((self.nsamples, self.nstates, self.dimension), dtype=config.dtype)
-        for i in range(self.nsamples):
-            res[i,:,:] = self._sampled_hmms[i].means
-        return res
+        return self._sampled_hmms.output_model_parameters.reshape((self.nsamples, self.nstates, self.nsymbols))
 
     @property
     def output_probabilities_mean(self):
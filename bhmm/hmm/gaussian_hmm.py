@@ -15,7 +15,6 @@ import numpy as np
 from bhmm.hmm.generic_hmm import HMM
 from bhmm.hmm.generic_sampled_hmm import SampledHMM
 from bhmm.output_models.gaussian import GaussianOutputModel
-from bhmm.util import config
 from bhmm.util.statistics import confidence_interval_arr
 
 class GaussianHMM(HMM, GaussianOutputModel):
@@ -40,30 +39,27 @@ class SampledGaussianHMM(GaussianHMM, SampledHMM):
     ----------
     estimated_hmm : :class:`HMM <generic_hmm.HMM>`
         Representative HMM estimate, e.g. a maximum likelihood estimate or mean HMM.
-    sampled_hmms : list of :class:`HMM <generic_hmm.HMM>`
-        Sampled HMMs
+    sampled_hmms : :class:`HMMSampleStore <sample_store.HMMSampleStore>`, list of :class:`HMM <generic_hmm.HMM>` or str
+        Sampled HMMs or name of a sample file, see :class:`SampledHMM <generic_sampled_hmm.SampledHMM>`
     conf : float, optional, default = 0.95
         confidence interval, e.g. 0.68 for 1 sigma or 0.95 for 2 sigma.
+    nchains : int, optional, default = 1
+        number of independent chains the samples come from, see :class:`SampledHMM <generic_sampled_hmm.SampledHMM>`.
 
     """
-    def __init__(self, estimated_hmm, sampled_hmms, conf=0.95):
+    def __init__(self, estimated_hmm, sampled_hmms, conf=0.95, nchains=1):
         # enforce right type
         estimated_hmm = GaussianHMM(estimated_hmm)
-        for i in range(len(sampled_hmms)):
-            sampled_hmms[i] = GaussianHMM(sampled_hmms[i])
         # call GaussianHMM superclass constructer with estimated_hmm
         GaussianHMM.__init__(self, estimated_hmm)
         # call SampledHMM superclass constructor
-        SampledHMM.__init__(self, estimated_hmm, sampled_hmms, conf=conf)
+        SampledHMM.__init__(self, estimated_hmm, sampled_hmms, conf=conf, nchains=nchains)
 
     @property
     def means_samples(self):
         r""" Samples of the Gaussian distribution means """
-        res = np.empty((self.nsamples, self.nstates, self.dimension), dtype=config.dtype)
-        for i in range(self.nsamples):
-            for j in range(self.nstates):
-                res[i,j,:] = self._sampled_hmms[i].means[j]
-        return res
+        # the output model parameters are the means followed by the standard deviations
+        return self._sampled_hmms.output_model_parameters[:, :self.nstates, None]
 
     @property
     def means_mean(self):
@@ -83,11 +79,7 @@ class SampledGaussianHMM(GaussianHMM, SampledHMM):
     @property
     def sigmas_samples(self):
         r""" Samples of the Gaussian distribution standard deviations """
-        res = np.empty((self.nsamples, self.nstates, self.dimension), dtype=config.dtype)
-        for i in range(self.nsamples):
-            for j in range(self.nstates):
-                res[i,j,:] = self._sampled_hmms[i].sigmas[j]
-        return res
+        return self._sampled_hmms.output_model_parameters[:, self.nstates:, None]
 
     @property
     def sigmas_mean(self):
@@ -298,11 +298,57 @@ class HMM(object):
         if self.hidden_state_trajectories is None:
             raise RuntimeError('HMM model does not have a hidden state trajectory.')
 
-        C = np.zeros((self._nstates,self._nstates), dtype=dtype)
+        N = self._nstates
+        C = np.zeros((N*N), dtype=dtype)
         for S in self.hidden_state_trajectories:
-            for t in range(len(S)-1):
-                C[S[t],S[t+1]] += 1
-        return C
+            # histogram of the transitions, indexed by S[t]*N + S[t+1]
+            S = np.asarray(S, dtype=np.int64)
+            C += np.bincount(S[:-1]*N + S[1:], minlength=N*N)
+        return C.reshape((N, N))
+
+    def log_likelihood(self, observations):
+        """Compute the log-likelihood of observation trajectories given this model.
+
+        Only the likelihood is computed, without forward coefficients, so the memory requirement does not grow
+        with the trajectory length beyond the observation probabilities. For Gaussian output models, the
+        observation probabilities are evaluated on the fly as well.
+
+        Parameters
+        ----------
+        observations : list of numpy.array
+            List of observed trajectories.
+
+        Returns
+        -------
+        logL : float
+            The log-likelihood of all observed trajectories
+
+        Examples
+        --------
+
+        >>> from bhmm import testsystems
+        >>> model, observations, states = testsystems.generate_synthetic_observations(ntrajectories=2, length=100)
+        >>> logL = model.log_likelihood(observations)
+
+        """
+        from bhmm import hidden
+        from bhmm.util import config
+        hidden.set_implementation(config.kernel, logspace=config.logspace)
+        A = self.transition_matrix
+        pi = self.initial_distribution
+        if self.output_model.model_type == 'gaussian':
+            offsets = hidden.trajectory_offsets([len(obs) for obs in observations])
+            logprobs = hidden.loglikelihood_batch_gaussian(A, np.concatenate(observations), self.output_model.means,
+                                                           self.output_model.sigmas, pi, offsets)
+            return float(np.sum(logprobs))
+        logL = 0.0
+        for obs in observations:
+            if config.logspace:
+                pobs = self.output_model.log_p_obs(obs)
+            else:
+                pobs = self.output_model.p_obs(obs)
+            logL += hidden.loglikelihood(A, pobs, pi)
+        return logL
 
     # def emission_probability(self, state, observation):
     #     """Compute the emission probability of an observation from a given state.
@@ -393,13 +439,9 @@ class HMM(object):
         if not self.hidden_state_trajectories:
             raise RuntimeError('HMM model does not have a hidden state trajectory.')
 
-        dtype = observations[0].dtype
-        collected_observations = np.array([], dtype=dtype)
-        for (s_t, o_t) in zip(self.hidden_state_trajectories, observations):
-            indices = np.where(s_t == state_index)[0]
-            collected_observations = np.append(collected_observations, o_t[indices])
-
-        return collected_observations
+        collected_observations = [o_t[s_t == state_index]
+                                  for (s_t, o_t) in zip(self.hidden_state_trajectories, observations)]
+        return np.concatenate(collected_observations)
 
     def generate_synthetic_state_trajectory(self, nsteps, initial_Pi=None, start=None, stop=None, dtype=np.int32):
         """Generate a synthetic state trajectory.
@@ -13,8 +13,10 @@ __email__="jchodera AT gmail DOT com"
 import numpy as np
 
 from bhmm.hmm.generic_hmm import HMM
+from bhmm.hmm.sample_store import HMMSampleStore, HMMSampleFile
 from bhmm.util import config
-from bhmm.util.statistics import confidence_interval_arr
+from bhmm.util import types
+from bhmm.util.statistics import confidence_interval_arr, potential_scale_reduction, effective_sample_size
 
 class SampledHMM(HMM):
     """ Sampled HMM with a representative single point estimate and error estimates
@@ -23,20 +25,32 @@ class SampledHMM(HMM):
     ----------
     estimated_hmm : :class:`HMM <generic_hmm.HMM>`
         Representative HMM estimate, e.g. a maximum likelihood estimate or mean HMM.
-    sampled_hmms : list of :class:`HMM <generic_hmm.HMM>`
-        Sampled HMMs
+    sampled_hmms : :class:`HMMSampleStore <sample_store.HMMSampleStore>`, list of :class:`HMM <generic_hmm.HMM>` or str
+        Sampled HMMs. A list is converted into a sample store. A string is the name of a sample file written by
+        :class:`HMMSampleFile <sample_store.HMMSampleFile>`, which is memory-mapped when the samples are accessed.
     conf : float, optional, default = 0.95
         confidence interval, e.g. 0.68 for 1 sigma or 0.95 for 2 sigma.
+    nchains : int, optional, default = 1
+        number of independent chains the samples come from. The samples must be ordered by chain, with the same
+        number of samples in each chain. Used for the convergence diagnostics.
 
     """
-    def __init__(self, estimated_hmm, sampled_hmms, conf=0.95):
+    def __init__(self, estimated_hmm, sampled_hmms, conf=0.95, nchains=1):
         # call superclass constructer with estimated_hmm
         HMM.__init__(self, estimated_hmm.transition_matrix, estimated_hmm.output_model,
                      lag=estimated_hmm.lag, Pi=estimated_hmm.initial_distribution,
                      stationary=estimated_hmm.is_stationary, reversible=estimated_hmm.is_reversible)
         # save sampled HMMs to calculate statistical moments.
+        if types.is_string(sampled_hmms):
+            sampled_hmms = HMMSampleFile(sampled_hmms)
+        elif not isinstance(sampled_hmms, HMMSampleStore):
+            sampled_hmms = HMMSampleStore.from_models(sampled_hmms)
         self._sampled_hmms = sampled_hmms
         self._nsamples = len(sampled_hmms)
+        if self._nsamples % nchains != 0:
+            raise ValueError('Number of samples '+str(self._nsamples)+' is not a multiple of the number of chains '
+                             +str(nchains))
+        self._nchains = nchains
         # save confindence interval
         self._conf = conf
 
@@ -49,9 +63,14 @@ class SampledHMM(HMM):
         r""" Number of samples """
         return self._nsamples
 
+    @property
+    def nchains(self):
+        r""" Number of independent chains the samples come from """
+        return self._nchains
+
     @property
     def sampled_hmms(self):
-        r""" List of sampled HMMs """
+        r""" Sampled HMMs, as a :class:`HMMSampleStore <sample_store.HMMSampleStore>` that creates each HMM on access """
         return self._sampled_hmms
 
     @property
@@ -62,10 +81,7 @@ class SampledHMM(HMM):
     @property
     def initial_distribution_samples(self):
         r""" Samples of the initial distribution """
-        res = np.empty((self.nsamples, self.nstates), dtype=config.dtype)
-        for i in range(self.nsamples):
-            res[i,:] = self._sampled_hmms[i].stationary_distribution
-        return res
+        return self._sampled_hmms.initial_distributions
 
     @property
     def initial_distribution_mean(self):
@@ -108,10 +124,7 @@ class SampledHMM(HMM):
     @property
     def transition_matrix_samples(self):
         r""" Samples of the transition matrix """
-        res = np.empty((self.nsamples, self.nstates, self.nstates), dtype=config.dtype)
-        for i in range(self.nsamples):
-            res[i,:,:] = self._sampled_hmms[i].transition_matrix
-        return res
+        return self._sampled_hmms.transition_matrices
 
     @property
     def transition_matrix_mean(self):
@@ -222,11 +235,8 @@ class SampledHMM(HMM):
 
     @property
     def lifetimes_samples(self):
-        r""" Samples of the timescales """
-        res = np.empty((self.nsamples, self.nstates), dtype=config.dtype)
-        for i in range(self.nsamples):
-            res[i,:] = self._sampled_hmms[i].lifetimes
-        return res
+        r""" Samples of the lifetimes """
+        return -self._sampled_hmms.lag / np.log(np.diagonal(self.transition_matrix_samples, axis1=1, axis2=2))
 
     @property
     def lifetimes_mean(self):
@@ -242,3 +252,38 @@ class SampledHMM(HMM):
     def lifetimes_conf(self):
         r""" The standard deviation of the lifetimes of the hidden states """
         return confidence_interval_arr(self.lifetimes_samples, conf=self._conf)
+
+    def _chain_samples(self):
+        r""" Samples of the parameters that are monitored for convergence, as arrays of shape (nchains, n, ...) """
+        samples = {'transition_matrix': self.transition_matrix_samples,
+                   'stationary_distribution': self.initial_distribution_samples}
+        if self.nstates > 1:
+            samples['timescales'] = self.timescales_samples
+        samples['output_model'] = self._sampled_hmms.output_model_parameters
+        for name in samples:
+            samples[name] = samples[name].reshape((self._nchains, -1) + samples[name].shape[1:])
+        return samples
+
+    @property
+    def potential_scale_reduction(self):
+        r""" Split-chain potential scale reduction factor R-hat of each parameter
+
+        Returns a dictionary of arrays of the element-wise R-hat of the 'transition_matrix', the
+        'stationary_distribution', the 'timescales' and the parameters of the 'output_model' (e.g. means followed by
+        standard deviations for Gaussian outputs). Values close to 1, e.g. below 1.01, indicate that the chains have
+        converged to the same distribution. See :func:`bhmm.util.statistics.potential_scale_reduction`.
+
+        """
+        samples = self._chain_samples()
+        return dict([(name, potential_scale_reduction(samples[name])) for name in samples])
+
+    @property
+    def effective_sample_size(self):
+        r""" Effective number of independent samples of each parameter
+
+        Returns a dictionary of arrays with the same keys as :attr:`potential_scale_reduction`. See
+        :func:`bhmm.util.statistics.effective_sample_size`.
+
+        """
+        samples = self._chain_samples()
+        return dict([(name, effective_sample_size(samples[name])) for name in samples])
@@ -0,0 +1,328 @@
+"""
+Compact storage of sampled hidden Markov models.
+
+"""
+
+__author__ = 'noe'
+
+import os
+import copy
+import struct
+import numpy as np
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from bhmm.hmm.generic_hmm import HMM
+
+
+class HMMSampleStore(object):
+    """ Structure-of-arrays store of sampled HMMs
+
+    Instead of one HMM object per sample, the transition matrices, initial distributions and output model parameter
+    vectors (see :meth:`OutputModel._get_parameters <bhmm.output_models.outputmodel.OutputModel._get_parameters>`)
+    of all samples are kept in preallocated arrays of shape (nsamples, nstates, nstates), (nsamples, nstates) and
+    (nsamples, nparameters), so that a sample costs a few hundred bytes and statistics are computed on array views.
+    Indexing or iterating the store creates the corresponding :class:`HMM <bhmm.hmm.generic_hmm.HMM>` objects on the
+    fly, which are :class:`GaussianHMM <bhmm.hmm.gaussian_hmm.GaussianHMM>` objects for Gaussian output models.
+
+    Parameters
+    ----------
+    model : :class:`HMM <bhmm.hmm.generic_hmm.HMM>`
+        Model whose number of states, lag time, stationarity, reversibility and type of output model are shared by
+        all samples.
+    nsamples : int
+        Capacity of the store
+    save_hidden_state_trajectories : bool, optional, default=False
+        If True, the hidden state trajectories of the samples are kept as well.
+
+    """
+    def __init__(self, model, nsamples, save_hidden_state_trajectories=False):
+        self._nstates = model.nstates
+        self._lag = model.lag
+        self._stationary = model.is_stationary
+        self._reversible = model.is_reversible
+        # the output model is only used as a template, the parameters of each sample are set when it is created
+        self._output_model = copy.deepcopy(model.output_model)
+        nparameters = len(self._output_model._get_parameters())
+        self._transition_matrices = np.empty((nsamples, self._nstates, self._nstates), dtype=np.float64)
+        self._initial_distributions = np.empty((nsamples, self._nstates), dtype=np.float64)
+        self._output_model_parameters = np.empty((nsamples, nparameters), dtype=np.float64)
+        if save_hidden_state_trajectories:
+            self._hidden_state_trajectories = []
+        else:
+            self._hidden_state_trajectories = None
+        self._nsamples = 0
+
+    @classmethod
+    def from_models(cls, models):
+        """ Creates a store from a list of HMMs with the same number of states and type of output model """
+        if len(models) == 0:
+            raise ValueError('Cannot create a sample store without samples.')
+        save_hidden = all(model.hidden_state_trajectories is not None for model in models)
+        store = cls(models[0], len(models), save_hidden_state_trajectories=save_hidden)
+        for model in models:
+            store.append(model)
+        return store
+
+    @classmethod
+    def concatenate(cls, stores):
+        """ Concatenates the samples of several stores, e.g. of independent chains, into a new store """
+        if len(stores) == 0:
+            raise ValueError('Cannot concatenate an empty list of sample stores.')
+        store = HMMSampleStore.__new__(HMMSampleStore)
+        for name in ['_nstates', '_lag', '_stationary', '_reversible', '_output_model']:
+            setattr(store, name, getattr(stores[0], name))
+        store._transition_matrices = np.concatenate([s.transition_matrices for s in stores])
+        store._initial_distributions = np.concatenate([s.initial_distributions for s in stores])
+        store._output_model_parameters = np.concatenate([s.output_model_parameters for s in stores])
+        if all(s.hidden_state_trajectories is not None for s in stores):
+            store._hidden_state_trajectories = [S for s in stores for S in s.hidden_state_trajectories]
+        else:
+            store._hidden_state_trajectories = None
+        store._nsamples = store._transition_matrices.shape[0]
+        return store
+
+    def append(self, model):
+        """ Copies the parameters of the given HMM into the next free sample """
+        i = self._nsamples
+        if i == self._transition_matrices.shape[0]:
+            raise IndexError('Sample store is full ('+str(i)+' samples).')
+        if model.nstates != self._nstates:
+            raise ValueError('Sample has '+str(model.nstates)+' states, but the store has '+str(self._nstates))
+        self._transition_matrices[i] = model.transition_matrix
+        self._initial_distributions[i] = model.initial_distribution
+        self._output_model_parameters[i] = model.output_model._get_parameters()
+        if self._hidden_state_trajectories is not None:
+            # the sampler creates new trajectories in every update, so they are not copied
+            self._hidden_state_trajectories.append(model.hidden_state_trajectories)
+        self._nsamples += 1
+
+    def __len__(self):
+        return self._nsamples
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._nsamples
+        if i < 0 or i >= self._nsamples:
+            raise IndexError('Sample index out of range')
+        output_model = copy.deepcopy(self._output_model)
+        output_model._set_parameters(np.array(self.output_model_parameters[i]))
+        hmm = HMM(np.array(self.transition_matrices[i]), output_model, lag=self._lag,
+                  Pi=np.array(self.initial_distributions[i]), stationary=self._stationary, reversible=self._reversible)
+        # Gaussian samples give direct access to means and sigmas, as the sampled HMMs of SampledGaussianHMM did
+        from bhmm.output_models.gaussian import GaussianOutputModel
+        if isinstance(output_model, GaussianOutputModel):
+            from bhmm.hmm.gaussian_hmm import GaussianHMM
+            hmm = GaussianHMM(hmm)
+        hmm.hidden_state_trajectories = self._sample_hidden_state_trajectories(i)
+        return hmm
+
+    def _sample_hidden_state_trajectories(self, i):
+        if self._hidden_state_trajectories is None:
+            return None
+        return self._hidden_state_trajectories[i]
+
+    def __iter__(self):
+        for i in range(self._nsamples):
+            yield self[i]
+
+    @property
+    def nstates(self):
+        r""" Number of hidden states """
+        return self._nstates
+
+    @property
+    def lag(self):
+        r""" Lag time of the sampled models """
+        return self._lag
+
+    @property
+    def is_stationary(self):
+        r""" Whether the sampled models are stationary """
+        return self._stationary
+
+    @property
+    def is_reversible(self):
+        r""" Whether the sampled models are reversible """
+        return self._reversible
+
+    @property
+    def transition_matrices(self):
+        r""" Transition matrices of the samples, as a view of shape (nsamples, nstates, nstates) """
+        return self._transition_matrices[:self._nsamples]
+
+    @property
+    def initial_distributions(self):
+        r""" Initial distributions of the samples, as a view of shape (nsamples, nstates) """
+        return self._initial_distributions[:self._nsamples]
+
+    @property
+    def output_model_parameters(self):
+        r""" Output model parameter vectors of the samples, as a view of shape (nsamples, nparameters) """
+        return self._output_model_parameters[:self._nsamples]
+
+    @property
+    def hidden_state_trajectories(self):
+        r""" Hidden state trajectories of each sample, or None if they are not saved """
+        return self._hidden_state_trajectories
+
+
+class HMMSampleFile(HMMSampleStore):
+    """ Sample store in a memory-mapped file
+
+    Every sample that is appended is written to the end of the file as a fixed-size record with the transition
+    matrix, the initial distribution, the output model parameters and, optionally, the concatenated hidden state
+    trajectories, so that long sampling runs do not accumulate samples in memory. The arrays of the store are
+    read-only views of a memory map of the file, which is only created when they are accessed, so that statistics
+    are computed without loading all samples at once.
+
+    Use :meth:`create` to start a new file, and the constructor to open an existing one.
+
+    Parameters
+    ----------
+    filename : str
+        name of a file written by a sample file
+
+    """
+    _magic = b'BHMMSMPL'
+
+    def __init__(self, filename):
+        self._filename = filename
+        with open(filename, 'rb') as f:
+            magic, length = struct.unpack('<8sQ', f.read(16))
+            if magic != self._magic:
+                raise ValueError('File '+str(filename)+' is not a BHMM sample file.')
+            header = pickle.loads(f.read(length))
+        self._nstates = header['nstates']
+        self._lag = header['lag']
+        self._stationary = header['stationary']
+        self._reversible = header['reversible']
+        self._output_model = header['output_model']
+        self._observation_lengths = header['observation_lengths']
+        self._offset = self._data_offset(length)
+        self._dtype = self._record_dtype(self._nstates, header['nparameters'], self._observation_lengths)
+        self._nsamples = (os.path.getsize(filename) - self._offset) // self._dtype.itemsize
+        self._records = None
+
+    @classmethod
+    def create(cls, filename, model, save_hidden_state_trajectories=False, observation_lengths=None):
+        """ Creates an empty sample file, replacing an existing file
+
+        Parameters
+        ----------
+        filename : str
+            name of the file
+        model : :class:`HMM <bhmm.hmm.generic_hmm.HMM>`
+            Model whose number of states, lag time, stationarity, reversibility and type of output model are shared
+            by all samples.
+        save_hidden_state_trajectories : bool, optional, default=False
+            If True, the hidden state trajectories of the samples are written as well.
+        observation_lengths : list of int, optional, default=None
+            lengths of the hidden state trajectories. Required if save_hidden_state_trajectories is True.
+
+        """
+        if save_hidden_state_trajectories:
+            if observation_lengths is None:
+                raise ValueError('The observation lengths are required to store hidden state trajectories.')
+            observation_lengths = [int(T) for T in observation_lengths]
+        else:
+            observation_lengths = None
+        header = {'nstates': model.nstates, 'lag': model.lag, 'stationary': model.is_stationary,
+                  'reversible': model.is_reversible, 'output_model': copy.deepcopy(model.output_model),
+                  'nparameters': len(model.output_model._get_parameters()),
+                  'observation_lengths': observation_lengths}
+        data = pickle.dumps(header, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(filename, 'wb') as f:
+            f.write(struct.pack('<8sQ', cls._magic, len(data)))
+            f.write(data)
+            f.write(b'\0' * (cls._data_offset(len(data)) - 16 - len(data)))
+        return cls(filename)
+
+    @staticmethod
+    def _data_offset(header_length):
+        # records start at the first multiple of 64 bytes after the header
+        return 64 * ((16 + header_length + 63) // 64)
+
+    @staticmethod
+    def _record_dtype(nstates, nparameters, observation_lengths):
+        fields = [('transition_matrix', np.float64, (nstates, nstates)),
+                  ('initial_distribution', np.float64, (nstates,)),
+                  ('output_model_parameters', np.float64, (nparameters,))]
+        if observation_lengths is not None:
+            fields.append(('hidden_state_trajectories', np.int32, (sum(observation_lengths),)))
+        return np.dtype(fields)
+
+    def __getstate__(self):
+        # only the file name and the number of samples are pickled, e.g. into a checkpoint
+        return {'filename': self._filename, 'nsamples': self._nsamples}
+
+    def __setstate__(self, state):
+        self.__init__(state['filename'])
+        if self._nsamples < state['nsamples']:
+            raise ValueError('Sample file '+str(self._filename)+' has fewer samples than expected.')
+        # drop samples that have been appended after the state was saved
+        with open(self._filename, 'r+b') as f:
+            f.truncate(self._offset + state['nsamples'] * self._dtype.itemsize)
+        self._nsamples = state['nsamples']
+
+    @property
+    def filename(self):
+        r""" Name of the sample file """
+        return self._filename
+
+    def append(self, model):
+        """ Writes the parameters of the given HMM to the end of the file """
+        if model.nstates != self._nstates:
+            raise ValueError('Sample has '+str(model.nstates)+' states, but the store has '+str(self._nstates))
+        record = np.zeros(1, dtype=self._dtype)
+        record['transition_matrix'] = model.transition_matrix
+        record['initial_distribution'] = model.initial_distribution
+        record['output_model_parameters'] = model.output_model._get_parameters()
+        if self._observation_lengths is not None:
+            record['hidden_state_trajectories'] = np.concatenate(model.hidden_state_trajectories)
+        with open(self._filename, 'ab') as f:
+            record.tofile(f)
+        self._nsamples += 1
+        self._records = None
+
+    def _map(self):
+        """ Memory map of the records, created on first access after the number of samples has changed """
+        if self._records is None:
+            if self._nsamples == 0:
+                self._records = np.zeros(0, dtype=self._dtype)
+            else:
+                # plain array view of the map, so that statistics of it are plain arrays as well
+                self._records = np.asarray(np.memmap(self._filename, dtype=self._dtype, mode='r',
+                                                     offset=self._offset, shape=(self._nsamples,)))
+        return self._records
+
+    @property
+    def transition_matrices(self):
+        r""" Transition matrices of the samples, as a read-only view of shape (nsamples, nstates, nstates) """
+        return self._map()['transition_matrix']
+
+    @property
+    def initial_distributions(self):
+        r""" Initial distributions of the samples, as a read-only view of shape (nsamples, nstates) """
+        return self._map()['initial_distribution']
+
+    @property
+    def output_model_parameters(self):
+        r""" Output model parameter vectors of the samples, as a read-only view of shape (nsamples, nparameters) """
+        return self._map()['output_model_parameters']
+
+    @property
+    def hidden_state_trajectories(self):
+        r""" Hidden state trajectories of each sample as views of the file, or None if they are not saved """
+        if self._observation_lengths is None:
+            return None
+        return [self._sample_hidden_state_trajectories(i) for i in range(self._nsamples)]
+
+    def _sample_hidden_state_trajectories(self, i):
+        if self._observation_lengths is None:
+            return None
+        S = self._map()['hidden_state_trajectories'][i]
+        ends = np.cumsum(self._observation_lengths)
+        return [S[end-T:end] for (T, end) in zip(self._observation_lengths, ends)]
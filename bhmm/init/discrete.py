@@ -87,3 +87,36 @@ def initial_model_discrete(observations, nstates, lag=1, reversible=True):
     return model
 
 
+def random_model_discrete(observations, nstates, reversible=True, seed=None):
+    """Generate a random initial model with discrete output densities
+
+    The output probabilities of each state are drawn from a uniform Dirichlet distribution over all observed
+    symbols, and the transition matrix is metastable with random off-diagonal elements. Use this to generate
+    different starting points for the maximum-likelihood estimation.
+
+    Parameters
+    ----------
+    observations : list of ndarray((T_i), dtype=int)
+        list of arrays of length T_i with observation data
+    nstates : int
+        The number of states.
+    reversible : bool, optional, default=True
+        If True, the transition matrix is reversible.
+    seed : int, optional, default=None
+        seed of the random number generator
+
+    Examples
+    --------
+
+    >>> from bhmm import testsystems
+    >>> [model, observations, states] = testsystems.generate_synthetic_observations(output_model_type='discrete')
+    >>> initial_model = random_model_discrete(observations, model.nstates, seed=0)
+
+    """
+    from bhmm.init.gaussian import _random_metastable_transition_matrix
+    random_state = np.random.RandomState(seed)
+    nsymbols = max([np.max(o_t) for o_t in observations]) + 1
+    B = random_state.dirichlet(np.ones((nsymbols)), size=nstates)
+    output_model = DiscreteOutputModel(B)
+    Tij = _random_metastable_transition_matrix(nstates, random_state, reversible=reversible)
+    return HMM(Tij, output_model, reversible=reversible)
@@ -71,3 +71,54 @@ def initial_model_gaussian1d(observations, nstates, reversible=True):
     model = HMM(Tij, output_model, reversible=reversible)
 
     return model
+
+
+def random_model_gaussian1d(observations, nstates, reversible=True, seed=None):
+    """Generate a random initial model with 1D-Gaussian output densities
+
+    The means are drawn from the observations, all standard deviations are set to the standard deviation of the
+    observations divided by the number of states, and the transition matrix is metastable with random
+    off-diagonal elements. Use this to generate different starting points for the maximum-likelihood estimation.
+
+    Parameters
+    ----------
+    observations : list of ndarray((T_i), dtype=float)
+        list of arrays of length T_i with observation data
+    nstates : int
+        The number of states.
+    reversible : bool, optional, default=True
+        If True, the transition matrix is reversible.
+    seed : int, optional, default=None
+        seed of the random number generator
+
+    Examples
+    --------
+
+    >>> from bhmm import testsystems
+    >>> [model, observations, states] = testsystems.generate_synthetic_observations(output_model_type='gaussian')
+    >>> initial_model = random_model_gaussian1d(observations, model.nstates, seed=0)
+
+    """
+    random_state = np.random.RandomState(seed)
+    collected_observations = np.concatenate([np.asarray(o_t, dtype=np.float64) for o_t in observations])
+    means = np.sort(random_state.choice(collected_observations, size=nstates, replace=False))
+    sigmas = np.ones((nstates)) * max(np.std(collected_observations) / nstates, 1e-8)
+    from bhmm import GaussianOutputModel
+    output_model = GaussianOutputModel(nstates, means=means, sigmas=sigmas)
+    Tij = _random_metastable_transition_matrix(nstates, random_state, reversible=reversible)
+    return HMM(Tij, output_model, reversible=reversible)
+
+
+def _random_metastable_transition_matrix(nstates, random_state, reversible=True):
+    """ Transition matrix with random off-diagonal elements that sum up to at most 0.1 in each row
+
+    The reversible matrix is symmetric, i.e. reversible with respect to the uniform distribution.
+
+    """
+    X = random_state.rand(nstates, nstates)
+    if reversible:
+        X = 0.5 * (X + X.T)
+    np.fill_diagonal(X, 0.0)
+    Tij = 0.1 * X / max(np.max(X.sum(axis=1)), 1e-8)
+    np.fill_diagonal(Tij, 1.0 - Tij.sum(axis=1))
+    return Tij
@@ -0,0 +1,190 @@
+#include "_tmatrix_sampling.h"
+#include "_hidden.h"
+#include <math.h>
+#include <float.h>
+
+#ifndef __DIMS__
+#define __DIMS__
+#define DIM2(arr, i, j)     arr[(i)*N + j]
+#endif
+
+
+/*
+ Tests if x is numerically positive, i.e. positive and finite. NaN fails both comparisons.
+*/
+static int _is_positive(const double x)
+{
+    return x > 0.0 && x <= DBL_MAX;
+}
+
+static double _min0(const double x)
+{
+    return x < 0.0 ? x : 0.0;
+}
+
+/*
+ Standard normal deviate with the polar method. The second deviate is discarded, so that the generator state is the
+ complete state of the sampler.
+*/
+static double _rng_normal(uint64_t *rng_state)
+{
+    double u, v, s;
+    do
+    {
+        u = 2.0 * _rng_uniform(rng_state) - 1.0;
+        v = 2.0 * _rng_uniform(rng_state) - 1.0;
+        s = u*u + v*v;
+    }
+    while (s >= 1.0 || s == 0.0);
+    return u * sqrt(-2.0 * log(s) / s);
+}
+
+/*
+ Gamma deviate with shape k and scale 1 (Marsaglia and Tsang). Shapes below 1 are boosted by U^(1/k).
+*/
+static double _rng_gamma(uint64_t *rng_state, const double k)
+{
+    double d, c, x, v, u;
+    if (k < 1.0)
+    {
+        u = _rng_uniform(rng_state);
+        return _rng_gamma(rng_state, k + 1.0) * pow(u, 1.0 / k);
+    }
+    d = k - 1.0 / 3.0;
+    c = 1.0 / sqrt(9.0 * d);
+    for (;;)
+    {
+        do
+        {
+            x = _rng_normal(rng_state);
+            v = 1.0 + c * x;
+        }
+        while (v <= 0.0);
+        v = v * v * v;
+        u = _rng_uniform(rng_state);
+        if (u < 1.0 - 0.0331 * x * x * x * x)
+            return d * v;
+        if (log(u) < 0.5 * x * x + d * (1.0 - v + log(v)))
+            return d * v;
+    }
+}
+
+static double _rng_beta(uint64_t *rng_state, const double a, const double b)
+{
+    double x = _rng_gamma(rng_state, a);
+    double y = _rng_gamma(rng_state, b);
+    return x / (x + y);
+}
+
+/*
+ Updates the off-diagonal element v0 according to the distribution v0^(c0-1)*(v0+v1)^(-c1)*(v0+v2)^(-c2), first with
+ a Metropolis step using a gamma proposal, then with a log-normal random walk step.
+*/
+static double _update_step(double v0, const double v1, const double v2,
+                           const double c0, const double c1, const double c2, uint64_t *rng_state)
+{
+    double a = c1 + c2 - c0;
+    double b = (c1 - c0) * v2 + (c2 - c0) * v1;
+    double c = -c0 * v1 * v2;
+    double v_bar = 0.5 * (-b + sqrt(b*b - 4*a*c)) / a;
+    double h = c1 / ((v_bar + v1) * (v_bar + v1)) + c2 / ((v_bar + v2) * (v_bar + v2)) - c0 / (v_bar * v_bar);
+    double k = -h * v_bar * v_bar;
+    double theta = -1.0 / (h * v_bar);
+    double v0_new, log_prob_new, log_prob_old;
+
+    if (_is_positive(k) && _is_positive(theta))
+    {
+        v0_new = theta * _rng_gamma(rng_state, k);
+        if (_is_positive(v0_new))
+        {
+            if (v0 == 0)
+                v0 = v0_new;
+            else
+            {
+                log_prob_new = (c0-1)*log(v0_new) - c1*log(v0_new+v1) - c2*log(v0_new+v2);
+                log_prob_new -= (k-1)*log(v0_new) - v0_new/theta;
+                log_prob_old = (c0-1)*log(v0) - c1*log(v0+v1) - c2*log(v0+v2);
+                log_prob_old -= (k-1)*log(v0) - v0/theta;
+                if (_rng_uniform(rng_state) < exp(_min0(log_prob_new - log_prob_old)))
+                    v0 = v0_new;
+            }
+        }
+    }
+    v0_new = v0 * exp(_rng_normal(rng_state));
+    if (_is_positive(v0_new))
+    {
+        if (v0 == 0)
+            v0 = v0_new;
+        else
+        {
+            log_prob_new = c0*log(v0_new) - c1*log(v0_new+v1) - c2*log(v0_new+v2);
+            log_prob_old = c0*log(v0) - c1*log(v0+v1) - c2*log(v0+v2);
+            if (_rng_uniform(rng_state) < exp(_min0(log_prob_new - log_prob_old)))
+                v0 = v0_new;
+        }
+    }
+    return v0;
+}
+
+/*
+ Gibbs sampling of the symmetric flux matrix X of a reversible transition matrix T_ij = X_ij / sum_k X_ik, given
+ the count matrix C with the intrinsic -1 prior. In each of the nsteps sweeps, every element with C_ij + C_ji > 0 is
+ updated once, and X is normalized to a sum of 1. X is updated in place. rowsums is a workspace of length n.
+*/
+void _update_reversible(double *X, const double *C, const double *sumC, double *rowsums, const int n,
+                        const int nsteps, uint64_t *rng_state)
+{
+    int N = n;
+    int step, i, j;
+    double t, x, total;
+
+    for (step = 0; step < nsteps; step++)
+    {
+        for (i = 0; i < N; i++)
+        {
+            rowsums[i] = 0.0;
+            for (j = 0; j < N; j++)
+                rowsums[i] += DIM2(X, i, j);
+        }
+        for (i = 0; i < N; i++)
+        {
+            for (j = 0; j <= i; j++)
+            {
+                if (DIM2(C, i, j) + DIM2(C, j, i) <= 0)
+                    continue;
+                if (i == j)
+                {
+                    if (_is_positive(DIM2(C, i, i)) && _is_positive(sumC[i] - DIM2(C, i, i)))
+                    {
+                        t = _rng_beta(rng_state, DIM2(C, i, i), sumC[i] - DIM2(C, i, i));
+                        if (t < 1.0)
+                        {
+                            x = t / (1.0 - t) * (rowsums[i] - DIM2(X, i, i));
+                            if (_is_positive(x))
+                            {
+                                rowsums[i] += x - DIM2(X, i, i);
+                                DIM2(X, i, i) = x;
+                            }
+                        }
+                    }
+                }
+                else
+                {
+                    x = _update_step(DIM2(X, i, j), rowsums[i] - DIM2(X, i, j), rowsums[j] - DIM2(X, j, i),
+                                     DIM2(C, i, j) + DIM2(C, j, i), sumC[i], sumC[j], rng_state);
+                    rowsums[i] += x - DIM2(X, i, j);
+                    rowsums[j] += x - DIM2(X, j, i);
+                    DIM2(X, i, j) = x;
+                    DIM2(X, j, i) = x;
+                }
+            }
+        }
+        total = 0.0;
+        for (i = 0; i < N; i++)
+            for (j = 0; j < N; j++)
+                total += DIM2(X, i, j);
+        for (i = 0; i < N; i++)
+            for (j = 0; j < N; j++)
+                DIM2(X, i, j) /= total;
+    }
+}
@@ -0,0 +1,15 @@
+#ifndef _TMATRIX_SAMPLING_
+#define _TMATRIX_SAMPLING_
+
+#include <stdint.h>
+
+void _update_reversible(
+        double *X,
+        const double *C,
+        const double *sumC,
+        double *rowsums,
+        const int n,
+        const int nsteps,
+        uint64_t *rng_state);
+
+#endif
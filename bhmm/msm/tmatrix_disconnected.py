@@ -23,30 +23,96 @@ def estimate_P(C, reversible = True, fixed_statdist=None):
     # done
     return P
 
-def sample_P(C, nsteps, reversible = True):
+def sample_P(C, nsteps, reversible = True, X = None, rng_state = None):
+    """ Samples a transition matrix from the posterior of the count matrix C
+
+    Each connected set of C is sampled separately. States that are not connected to other states stay with
+    diagonal 1. Both the reversible and the non-reversible sampler use a -1 prior, i.e. the posterior mean is the
+    maximum likelihood estimate. Non-reversible transition matrices are sampled exactly, with one Dirichlet draw
+    per row, so that nsteps, X and rng_state are not used and the random numbers are drawn from numpy.random.
+
+    Parameters
+    ----------
+    C : ndarray(n,n)
+        count matrix
+    nsteps : int
+        number of sweeps of the reversible transition matrix sampler
+    reversible : bool, optional, default=True
+        sample reversible transition matrices, otherwise non-reversible ones
+    X : ndarray(n,n), optional, default=None
+        flux matrix of the previous call, which is updated in place. If given, the sampler continues from X on
+        every connected set on which X is positive wherever C + C.T is positive, so that a Gibbs sampler that
+        passes the same X in every cycle can use a few sweeps per cycle instead of starting over. An array of
+        zeros starts from C + C.T.
+    rng_state : ndarray((4), dtype=numpy.uint64), optional, default=None
+        random number stream of the compiled sampler, see :func:`bhmm.hidden.create_rng_state`. If None, one is
+        seeded from numpy.random.
+
+    Returns
+    -------
+    P : ndarray(n,n)
+        sampled transition matrix
+
+    """
     if not reversible:
-        raise Exception('Non-reversible transition matrix sampling not yet implemented.')
+        return _sample_P_nonreversible(C)
     # import emma
     import pyemma.msm.estimation as msmest
     from bhmm.msm.transition_matrix_sampling_rev import TransitionMatrixSamplerRev
     # output matrix. Initially eye
     n = np.shape(C)[0]
     P = np.eye((n), dtype=np.float64)
+    X_new = np.zeros((n, n))
     # treat each connected set separately
     S = msmest.connected_sets(C)
     for s in S:
         if len(s) > 1: # if there's only one state, there's nothing to sample and we leave it with diagonal 1
+            block = np.ix_(s, s)
             # compute transition sub-matrix on s
-            Cs = C[s,:][:,s]
-            sampler = TransitionMatrixSamplerRev(Cs)
-            Ps = sampler.sample(nsteps)
-            # write back to matrix
-            for i,I in enumerate(s):
-                for j,J in enumerate(s):
-                    P[I,J] = Ps[i,j]
+            Cs = C[block]
+            # continue from the previous flux matrix if it covers the sparsity pattern of the counts
+            Xs = None
+            if X is not None:
+                Xs = X[block]
+                support = (Cs + Cs.T) > 0
+                Xs[~support] = 0.0
+                if np.all(Xs[support] > 0):
+                    Xs /= Xs.sum()
+                else:
+                    Xs = None
+            sampler = TransitionMatrixSamplerRev(Cs, X=Xs, rng_state=rng_state)
+            P[block] = sampler.sample(nsteps)
+            X_new[block] = sampler.X
+    if X is not None:
+        X[:, :] = X_new
     # done
     return P
 
+def _sample_P_nonreversible(C):
+    """ Samples all rows of a non-reversible transition matrix at once
+
+    Row i is drawn from the Dirichlet distribution with parameters C[i,s] on the connected set s of state i. The
+    Dirichlet draws of all rows and connected sets are done with a single vectorized gamma draw.
+
+    """
+    import pyemma.msm.estimation as msmest
+    n = np.shape(C)[0]
+    # label of the connected set of each state. States not in any set form their own set.
+    labels = -1 - np.arange(n)
+    for k, s in enumerate(msmest.connected_sets(C)):
+        labels[s] = k
+    alpha = np.where(labels[:, None] == labels[None, :], C, 0.0)
+    positive = alpha > 0
+    G = np.zeros((n, n))
+    G[positive] = np.random.gamma(alpha[positive])
+    # rows without counts stay with diagonal 1
+    rowsums = G.sum(axis=1)
+    empty = np.where(rowsums <= 0)[0]
+    G[empty, empty] = 1.0
+    rowsums[empty] = 1.0
+    return G / rowsums[:, None]
+
+
 def stationary_distribution(C, P):
     # import emma
     import pyemma.msm.estimation as msmest
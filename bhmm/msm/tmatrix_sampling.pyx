@@ -1,107 +1,50 @@
-import math
+"""
+Compiled kernel of the reversible transition matrix sampler
+
+"""
 
 import numpy as np
 cimport numpy as np
-import linalg
-
-exp=math.exp
-log=math.log
-eps=np.spacing(0)
-
-
-def is_positive(x):
-    """
-    Helper function, tests if x is numeically positive
-
-    :param x:
-    :return:
-    """
-    return x>=eps and (not math.isinf(x)) and (not math.isnan(x))
+from libc.stdint cimport uint64_t
 
+cdef extern from "_tmatrix_sampling.h":
+    void _update_reversible(double *X, const double *C, const double *sumC, double *rowsums, const int n,
+                            const int nsteps, uint64_t *rng_state) nogil
 
-def update_step(double v0, double v1, double v2, double c0, double c1, double c2, int random_walk_stepsize=1):
-    """
-    update the sample v0 according to
-    the distribution v0^(c0-1)*(v0+v1)^(-c1)*(v0+v2)^(-c2)
 
-    :param v0:
-    :param v1:
-    :param v2:
-    :param c0:
-    :param c1:
-    :param c2:
-    :param random_walk_stepsize:
-    :return:
+def update(C, sumC, X, int n_step, rng_state):
     """
-    cdef double a = c1+c2-c0
-    cdef double b = (c1-c0)*v2+(c2-c0)*v1
-    cdef double c = -c0*v1*v2
-    cdef double v_bar = 0.5*(-b+(b*b-4*a*c)**.5)/a
-    cdef double h = c1/(v_bar + v1)**2 + c2/(v_bar + v2)**2 - c0/v_bar**2
-    cdef double k = -h*v_bar*v_bar
-    cdef double theta=-1/(h*v_bar)
-    cdef double log_prob_new = 0.0
-    cdef double log_prob_old = 0.0
-
-    if is_positive(k) and is_positive(theta):
-        v0_new = np.random.gamma(k,theta)
-        if is_positive(v0_new):
-            if v0 == 0:
-                v0 = v0_new
-            else:
-                log_prob_new = (c0-1)*log(v0_new)-c1*log(v0_new+v1)-c2*log(v0_new+v2)
-                log_prob_new -= (k-1)*log(v0_new)-v0_new/theta
-                log_prob_old = (c0-1)*log(v0)-c1*log(v0+v1)-c2*log(v0+v2)
-                log_prob_old -= (k-1)*log(v0)-v0/theta
-                if np.random.rand()<exp(min(log_prob_new-log_prob_old,0)):
-                    v0=v0_new
-    v0_new = v0*exp(random_walk_stepsize*np.random.randn())
-    if is_positive(v0_new):
-        if v0 == 0:
-            v0 = v0_new
-        else:
-            log_prob_new = c0*log(v0_new)-c1*log(v0_new+v1)-c2*log(v0_new+v2)
-            log_prob_old = c0*log(v0)-c1*log(v0+v1)-c2*log(v0+v2)
-            if np.random.rand() < exp(min(log_prob_new-log_prob_old,0)):
-                v0 = v0_new
+    Gibbs sampler for the flux matrix of a reversible transition matrix
 
-    return v0
-
-
-def update(np.ndarray[np.float64_t, ndim=2] C, np.ndarray[np.float64_t, ndim=1] sumC, int n,
-           np.ndarray[np.float64_t, ndim=2] X, int n_step):
-    """
-    Gibbs sampler for reversible transiton matrix
-    Output: sample_mem, sample_mem[i]=eval_fun(i-th sample of transition matrix)
+    Runs n_step sweeps, in each of which every element X_ij with C_ij + C_ji > 0 is updated once, and normalizes X to
+    a sum of 1 after each sweep. The transition matrix is T_ij = X_ij / sum_k X_ik.
 
     Parameters:
     -----------
-    T_init : ndarray(n,n)
-        An initial transition matrix to seed the sampling. When omitted, the initial transition matrix will
-        be constructed from C + C.T, row-normalized. Attention: it is not checked whether T_init is reversible,
-        the user needs to ensure this.
+    C : ndarray(n,n)
+        count matrix. The sampler intrinsically assumes a -1 prior.
+    sumC : ndarray(n)
+        row sums of C
+    X : ndarray(n,n), dtype=float64, C-contiguous
+        symmetric flux matrix to start from. Updated in place.
     n_step : int
-        the number of sampling steps made before returning a new transition matrix. In each sampling step, all
-        transition matrix elements are updated.
+        the number of sweeps
+    rng_state : ndarray((4), dtype=numpy.uint64)
+        random number generator state as created by :func:`bhmm.hidden.create_rng_state`. Advanced in place.
 
     """
-
-    cdef int iter,i,j
-    cdef double tmp_t,tmp_x,tmpi,tmpj
-    for iter in range(n_step):
-        for i in range(n):
-            for j in range(i+1):
-                if C[i,j]+C[j,i]>0:
-                    if i == j:
-                        if is_positive(C[i,i]) and is_positive(sumC[i]-C[i,i]):
-                            tmp_t = np.random.beta(C[i,i], sumC[i]-C[i,i])
-                            tmp_x = tmp_t/(1-tmp_t)*(X[i].sum()-X[i,i])
-                            if is_positive(tmp_x):
-                                X[i,i] = tmp_x
-                    else:
-                        tmpi = X[i].sum()-X[i,j]
-                        tmpj = X[j].sum()-X[j,i]
-                        X[i,j] = update_step(X[i,j], tmpi, tmpj, C[i,j]+C[j,i], sumC[i], sumC[j])
-                        X[j,i] = X[i,j]
-        X /= X.sum()
-
+    cdef int n = X.shape[0]
+    if X.dtype != np.float64 or X.shape != (n, n) or not X.flags['C_CONTIGUOUS']:
+        raise ValueError('X must be a contiguous float64 square matrix, because it is updated in place.')
+    if rng_state.dtype != np.uint64 or rng_state.shape != (4,) or not rng_state.flags['C_CONTIGUOUS']:
+        raise ValueError('rng_state must be a contiguous uint64 array of length 4, as created by create_rng_state.')
+    C = np.require(C, dtype=np.float64, requirements='C')
+    sumC = np.require(sumC, dtype=np.float64, requirements='C')
+    rowsums = np.zeros((n), dtype=np.float64)
+    cdef double *pX = <double*> np.PyArray_DATA(X)
+    cdef double *pC = <double*> np.PyArray_DATA(C)
+    cdef double *psumC = <double*> np.PyArray_DATA(sumC)
+    cdef double *prowsums = <double*> np.PyArray_DATA(rowsums)
+    cdef uint64_t *pstate = <uint64_t*> np.PyArray_DATA(rng_state)
+    with nogil:
+        _update_reversible(pX, pC, psumC, prowsums, n, n_step, pstate)
@@ -2,8 +2,19 @@ __author__ = 'noe'
 
 import numpy as np
 import math
+import warnings
 
 from bhmm.msm import linalg
+from bhmm.util import config
+from bhmm.hidden import create_rng_state
+
+try:
+    from bhmm.msm import tmatrix_sampling as _tmatrix_sampling
+except ImportError as _import_error:
+    _tmatrix_sampling = None
+    warnings.warn('The compiled transition matrix sampler bhmm.msm.tmatrix_sampling could not be imported ('
+                  + str(_import_error) + '). Falling back to the much slower python implementation. '
+                  'Rebuild bhmm with "python setup.py build_ext" to fix this.')
 
 __author__ = "Hao Wu, Frank Noe"
 __copyright__ = "Copyright 2015, John D. Chodera and Frank Noe"
@@ -18,6 +29,23 @@ eps=np.spacing(0)
 log=math.log
 exp=math.exp
 
+
+def backend():
+    """
+    Returns the implementation that is used for reversible transition matrix sampling
+
+    Returns
+    -------
+    backend : str
+        'c' if the compiled sampler is available and the 'c' kernel is selected in :mod:`bhmm.config`, otherwise
+        'python'.
+
+    """
+    if config.kernel == 'c' and _tmatrix_sampling is not None:
+        return 'c'
+    return 'python'
+
+
 class TransitionMatrixSamplerRev:
     """
     Reversible transition matrix sampling using Hao Wu's new reversible sampling method.
@@ -26,7 +54,7 @@ class TransitionMatrixSamplerRev:
 
     """
 
-    def __init__(self, _C):
+    def __init__(self, _C, X=None, rng_state=None):
         """
         Initializes the transition matrix sampler with the observed count matrix
 
@@ -35,12 +63,25 @@ class TransitionMatrixSamplerRev:
         C : ndarray(n,n)
             count matrix containing observed counts. Do not add a prior, because this sampler intrinsically
             assumes a -1 prior!
+        X : ndarray(n,n), optional, default=None
+            symmetric flux matrix to start from, e.g. the state of the sampler in the previous cycle of a Gibbs
+            sampler for which C has changed. X must be positive where C + C.T is positive. If None, the sampling
+            starts from C + C.T.
+        rng_state : ndarray((4), dtype=numpy.uint64), optional, default=None
+            random number stream of the compiled sampler, see :func:`bhmm.hidden.create_rng_state`. Advanced in
+            place. If None, one is seeded from numpy.random. The python implementation always uses numpy.random.
 
         """
         self.C = np.array(_C, dtype=np.float64)
         self.n = self.C.shape[0]
         self.sumC = self.C.sum(1)+0.0
         self.X = None
+        if X is not None:
+            self.X = np.array(X, dtype=np.float64, order='C')
+        self.backend = backend()
+        if rng_state is None and self.backend == 'c':
+            rng_state = create_rng_state(np.random.randint(2**31))
+        self.rng_state = rng_state
         # check input
         if np.min(self.sumC <= 0):
             raise ValueError('Count matrix has row sums of zero or less. Make sure that every state is visited!')
@@ -161,7 +202,7 @@ class TransitionMatrixSamplerRev:
 
         """
         # T_init given?
-        if T_init != None:
+        if T_init is not None:
             mu = linalg.stationary_distribution(T_init)
             self.X = np.dot(np.diag(mu), T_init)
             # reversible?
@@ -173,10 +214,9 @@ class TransitionMatrixSamplerRev:
             self.X /= np.sum(self.X)
 
         # call X-matrix update
-        try:
-            import tmatrix_sampling as ts
-            ts.update(self.C, self.sumC, self.n, self.X, n_step)
-        except:
+        if self.backend == 'c':
+            _tmatrix_sampling.update(self.C, self.sumC, self.X, n_step, self.rng_state)
+        else:
             self._update(n_step)
 
         T = self.X/self.X.sum(axis=1)[:,None]
@@ -260,16 +260,98 @@ class DiscreteOutputModel(OutputModel):
         # normalize
         self._output_probabilities /= np.sum(self._output_probabilities, axis=1)[:,None]
 
-    def _sample_output_mode(self, observations):
+    def _get_parameters(self):
         """
-        Sample a new set of distribution parameters given a sample of observations from the given state.
+        Returns the output probability matrix as a flat vector
+
+        """
+        return np.array(self._output_probabilities, dtype=np.float64).flatten()
+
+    def _set_parameters(self, parameters):
+        """
+        Sets the output probabilities from a vector as returned by _get_parameters
+
+        Returns False and leaves the model unchanged if a probability is negative.
+
+        """
+        if np.any(parameters < 0):
+            return False
+        B = np.reshape(parameters, (self.nstates, self._nsymbols))
+        self._output_probabilities = B / np.sum(B, axis=1)[:,None]
+        return True
+
+    def _init_sufficient_statistics(self):
+        """
+        Returns empty sufficient statistics for the maximum-likelihood fit, i.e. a zero (N,M) histogram
+
+        """
+        return np.zeros(self._output_probabilities.shape)
+
+    def _add_sufficient_statistics(self, statistics, obs, weights):
+        """
+        Adds weighted observations to the sufficient statistics
+
+        Parameters
+        ----------
+        statistics : ndarray((N,M))
+            weighted histogram of observed symbols per state. Updated in place.
+        obs : ndarray((T), dtype=int)
+            a piece of discrete trajectory of length T
+        weights : ndarray((T,N))
+            weights[t,n] is the weight assignment from obs[t] to state index n
+
+        """
+        M = statistics.shape[1]
+        for i in range(statistics.shape[0]):
+            statistics[i] += np.bincount(obs, weights=weights[:,i], minlength=M)[:M]
+
+    def _add_state_statistics(self, statistics, obs, s):
+        """
+        Adds observations with known hidden states to the histogram of observed symbols per state
+
+        Parameters
+        ----------
+        statistics : ndarray((N,M))
+            histogram of observed symbols per state. Updated in place.
+        obs : ndarray((T), dtype=int)
+            a piece of discrete trajectory of length T
+        s : ndarray((T), dtype=int)
+            hidden state trajectory of obs
+
+        """
+        N, M = statistics.shape
+        statistics += np.bincount(np.asarray(s, dtype=np.int64) * M + obs, minlength=N*M).reshape((N, M))
+
+    def _merge_sufficient_statistics(self, statistics, other, weight=1.0):
+        """
+        Adds a weighted histogram that has been accumulated separately, e.g. by another worker process
+
+        """
+        statistics += weight * other
+
+    def _estimate_output_model_from_statistics(self, statistics):
+        """
+        Fits the output model given the weighted histogram of observed symbols per state
+
+        Parameters
+        ----------
+        statistics : ndarray((N,M))
+            sufficient statistics as created by _init_sufficient_statistics and _add_sufficient_statistics
+
+        """
+        self._output_probabilities = statistics / np.sum(statistics, axis=1)[:,None]
+
+    def _sample_output_mode(self, statistics):
+        """
+        Sample a new set of distribution parameters given the observations in each state.
 
         Both the internal parameters and the attached HMM model are updated.
 
         Parameters
         ----------
-        observations :  [ numpy.array with shape (N_k,) ] with nstates elements
-            observations[k] is a set of observations sampled from state k
+        statistics : ndarray((N,M))
+            statistics[k,m] is the number of observations of symbol m in state k, as accumulated by
+            _init_sufficient_statistics and _add_state_statistics
 
         Examples
         --------
@@ -281,21 +363,15 @@ class DiscreteOutputModel(OutputModel):
 
         sample given observation
 
-        >>> obs = [[0,0,0,1,1,1],[1,1,1,1,1,1]]
-        >>> output_model._sample_output_mode(obs)
+        >>> statistics = output_model._init_sufficient_statistics()
+        >>> output_model._add_state_statistics(statistics, np.array([0,0,0,1,1,1,1,1,1,1,1,1]), np.array([0,0,0,0,0,0,1,1,1,1,1,1]))
+        >>> output_model._sample_output_mode(statistics)
 
         """
         from numpy.random import dirichlet
-        # total number of observation symbols
-        M = self._output_probabilities.shape[1]
-        count_full = np.zeros((M), dtype = int)
-        for i in range(len(observations)):
-            # count symbols found in data
-            count = np.bincount(observations[i])
-            # blow up to full symbol space (if symbols are missing in this observation)
-            count_full[:count.shape[0]] = count[:]
+        for i in range(self._output_probabilities.shape[0]):
             # sample dirichlet distribution
-            self._output_probabilities[i,:] = dirichlet(count_full + 1)
+            self._output_probabilities[i,:] = dirichlet(statistics[i] + 1)
 
     def generate_observation_from_state(self, state_index):
         """
@@ -308,6 +308,46 @@ class GaussianOutputModel(OutputModel):
         else:
             raise RuntimeError('Implementation '+str(self.__impl__)+' not available')
 
+    def log_p_obs(self, obs, out=None, dtype=np.float32):
+        """
+        Returns the logarithm of the output probabilities for an entire trajectory and all hidden states
+
+        The log-densities are computed directly, so they remain finite for observations far away from all means,
+        where p_obs would underflow to zero.
+
+        Parameters
+        ----------
+        obs : ndarray((T), dtype=float)
+            a trajectory of length T
+
+        Return
+        ------
+        log_p_o : ndarray (T,N)
+            the log probability of generating the observation at time point t from any of the N hidden states
+
+        Examples
+        --------
+
+        >>> output_model = GaussianOutputModel(nstates=2, means=[0, 1], sigmas=[0.01, 0.01])
+        >>> log_p_o = output_model.log_p_obs(np.array([100.0]))
+        >>> bool(np.all(np.isfinite(log_p_o)))
+        True
+
+        """
+        T = len(obs)
+        if out is None:
+            out = np.zeros((T, self.nstates), dtype=config.dtype)
+        elif T > out.shape[0]:
+            raise ValueError('output array out is too small: '+str(out.shape[0])+' < '+str(T))
+        res = out[:T]
+        # log N(o | mu, sigma) = -0.5 ((o-mu)/sigma)^2 - log(sqrt(2 pi) sigma)
+        np.subtract(np.asarray(obs)[:,None], self.means[None,:], out=res)
+        res /= self.sigmas[None,:]
+        np.square(res, out=res)
+        res *= -0.5
+        res -= np.log(np.sqrt(2.0 * np.pi) * self.sigmas)[None,:]
+        return out
+
 
     def _estimate_output_model(self, observations, weights):
         """
@@ -367,17 +407,133 @@ class GaussianOutputModel(OutputModel):
         self._sigmas /= w_sum
         self._sigmas = np.sqrt(self.sigmas)
 
+    def _get_parameters(self):
+        """
+        Returns the means followed by the standard deviations
+
+        """
+        return np.concatenate([self.means, self.sigmas]).astype(np.float64)
+
+    def _set_parameters(self, parameters):
+        """
+        Sets means and standard deviations from a vector as returned by _get_parameters
+
+        Returns False and leaves the model unchanged if a standard deviation is not positive.
+
+        """
+        N = self.nstates
+        if np.any(parameters[N:] <= 0):
+            return False
+        self._means = np.array(parameters[:N], dtype=self._means.dtype)
+        self._sigmas = np.array(parameters[N:], dtype=self._sigmas.dtype)
+        return True
+
+    def _init_sufficient_statistics(self):
+        """
+        Returns empty sufficient statistics for the Gaussian fit
+
+        The statistics are the weighted zeroth, first and second moments of the observations per state. Moments
+        are taken about the current means in order to avoid cancellation when the variances are computed.
+
+        """
+        N = self.nstates
+        return {'shift': np.array(self.means, dtype=np.float64),
+                'w': np.zeros((N)), 'wo': np.zeros((N)), 'woo': np.zeros((N))}
+
+    def _add_sufficient_statistics(self, statistics, obs, weights):
+        """
+        Adds weighted observations to the sufficient statistics
+
+        Parameters
+        ----------
+        statistics : dict
+            sufficient statistics as created by _init_sufficient_statistics. Updated in place.
+        obs : ndarray((T))
+            a piece of observation trajectory of length T
+        weights : ndarray((T,N))
+            weights[t,n] is the weight assignment from obs[t] to state index n
+
+        """
+        d = np.asarray(obs, dtype=np.float64)[:,None] - statistics['shift'][None,:]
+        statistics['w'] += np.sum(weights, axis=0)
+        statistics['wo'] += np.sum(weights * d, axis=0)
+        statistics['woo'] += np.sum(weights * d * d, axis=0)
+
+    def _add_state_statistics(self, statistics, obs, s):
+        """
+        Adds observations with known hidden states to the counts, sums and sums of squares per state
+
+        Parameters
+        ----------
+        statistics : dict
+            sufficient statistics as created by _init_sufficient_statistics. Updated in place.
+        obs : ndarray((T))
+            a piece of observation trajectory of length T
+        s : ndarray((T), dtype=int)
+            hidden state trajectory of obs
+
+        """
+        N = self.nstates
+        d = np.asarray(obs, dtype=np.float64) - statistics['shift'][s]
+        statistics['w'] += np.bincount(s, minlength=N)
+        statistics['wo'] += np.bincount(s, weights=d, minlength=N)
+        statistics['woo'] += np.bincount(s, weights=d * d, minlength=N)
+
+    def _merge_sufficient_statistics(self, statistics, other, weight=1.0):
+        """
+        Adds sufficient statistics that have been accumulated separately, e.g. by another worker process
+
+        If the statistics have been taken about different means, the moments of other are shifted to the means of
+        statistics before they are added with the given weight.
+
+        """
+        delta = other['shift'] - statistics['shift']
+        statistics['w'] += weight * other['w']
+        statistics['wo'] += weight * (other['wo'] + delta * other['w'])
+        statistics['woo'] += weight * (other['woo'] + 2.0 * delta * other['wo'] + delta**2 * other['w'])
+
+    def _estimate_output_model_from_statistics(self, statistics):
+        """
+        Fits the output model given the sufficient statistics of weighted observations
+
+        Gives the same means and standard deviations as _estimate_output_model with the same observations and
+        weights.
+
+        Parameters
+        ----------
+        statistics : dict
+            sufficient statistics as created by _init_sufficient_statistics and _add_sufficient_statistics
+
+        Examples
+        --------
+
+        >>> output_model = GaussianOutputModel(nstates=2, means=[0, 1], sigmas=[1, 1])
+        >>> obs = np.array([-1.0, 1.0, 2.0, 4.0])
+        >>> weights = np.array([[1.0, 0.0], [1.0, 0.0], [0.0, 1.0], [0.0, 1.0]])
+        >>> statistics = output_model._init_sufficient_statistics()
+        >>> output_model._add_sufficient_statistics(statistics, obs, weights)
+        >>> output_model._estimate_output_model_from_statistics(statistics)
+        >>> bool(np.allclose(output_model.means, [0.0, 3.0]))
+        True
+
+        """
+        w = statistics['w']
+        mean_shift = statistics['wo'] / w
+        self._means = statistics['shift'] + mean_shift
+        self._sigmas = np.sqrt(np.maximum(statistics['woo'] / w - mean_shift**2, 0.0))
+
 
-    def _sample_output_mode(self, observations):
+    def _sample_output_mode(self, statistics):
         """
-        Sample a new set of distribution parameters given a sample of observations from the given state.
+        Sample a new set of distribution parameters given the observations in each state.
 
         Both the internal parameters and the attached HMM model are updated.
 
         Parameters
         ----------
-        observations :  [ numpy.array with shape (N_k,) ] with `nstates` elements
-            observations[k] is a set of observations sampled from state `k`
+        statistics : dict
+            counts, sums and sums of squares of the observations in each state, as accumulated by
+            _init_sufficient_statistics and _add_state_statistics
 
         Examples
         --------
@@ -387,34 +543,39 @@ class GaussianOutputModel(OutputModel):
         >>> nstates = 3
         >>> nobs = 1000
         >>> output_model = GaussianOutputModel(nstates=nstates, means=[-1, 0, 1], sigmas=[0.5, 1, 2])
-        >>> observations = [ output_model.generate_observations_from_state(state_index, nobs) for state_index in range(nstates) ]
-        >>> weights = [ np.zeros([nobs,nstates], np.float32).T for state_index in range(nstates) ]
+        >>> s = np.repeat(np.arange(nstates), nobs)
+        >>> observations = output_model.generate_observation_trajectory(s)
 
         Update output parameters by sampling.
 
-        >>> output_model._sample_output_mode(observations)
+        >>> statistics = output_model._init_sufficient_statistics()
+        >>> output_model._add_state_statistics(statistics, observations, s)
+        >>> output_model._sample_output_mode(statistics)
 
         """
         for state_index in range(self.nstates):
             # Update state emission distribution parameters.
 
-            observations_in_state = observations[state_index]
             # Determine number of samples in this state.
-            nsamples_in_state = len(observations_in_state)
+            nsamples_in_state = statistics['w'][state_index]
 
             # Skip update if no observations.
             if nsamples_in_state == 0:
                 logger().warn('Warning: State %d has no obsevations.' % state_index)
                 continue
 
-            # Sample new mu.
-            self.means[state_index] = np.random.randn()*self.sigmas[state_index]/np.sqrt(nsamples_in_state) + np.mean(observations_in_state)
+            # Sample new mu. The sums are taken about shift.
+            shift = statistics['shift'][state_index]
+            mean_shift = statistics['wo'][state_index] / nsamples_in_state
+            self.means[state_index] = (np.random.randn()*self.sigmas[state_index]/np.sqrt(nsamples_in_state)
+                                       + shift + mean_shift)
 
             # Sample new sigma.
             # This scheme uses the improper Jeffreys prior on sigma^2, P(mu, sigma^2) \propto 1/sigma
             chisquared = np.random.chisquare(nsamples_in_state-1)
-            sigmahat2 = np.mean((observations_in_state - self.means[state_index])**2)
-            self.sigmas[state_index] = np.sqrt(sigmahat2) / np.sqrt(chisquared / nsamples_in_state)
+            d = self.means[state_index] - shift
+            sigmahat2 = statistics['woo'][state_index] / nsamples_in_state - 2.0 * d * mean_shift + d * d
+            self.sigmas[state_index] = np.sqrt(max(sigmahat2, 0.0)) / np.sqrt(chisquared / nsamples_in_state)
 
         return
 
@@ -67,3 +67,30 @@ void _p_obs(double* o, double* mus, double* sigmas, int N, int T, double* p)
             p[t*N + i] = gaussian(o[t], mus[i], sigmas[i]);
         }
 }
+
+void _p_obs32(float* o, float* mus, float* sigmas, int N, int T, float* p)
+/* Single precision version of _p_obs. Densities are evaluated in double precision.
+
+    Parameters
+    ----------
+    o : ptr to float array, size T
+        observation sequence
+    mus : ptr to float array, size N
+        mean values
+    sigmas : ptr to float array, size N
+        standard deviations
+    N : int
+        number of states
+    T : int
+        number of trajectory steps
+    p : ptr to float array, size N
+        output will be written here
+*/
+{
+    int i, t;
+    for (t=0; t<T; t++)
+        for (i=0; i<N; i++)
+        {
+            p[t*N + i] = (float) gaussian(o[t], mus[i], sigmas[i]);
+        }
+}
@@ -3,10 +3,13 @@ import ctypes
 cimport numpy
 
 cdef extern from "_gaussian.h":
-    void _p_o(const double o, const double* mus, const double* sigmas, const int N, double* p)
+    void _p_o(const double o, const double* mus, const double* sigmas, const int N, double* p) nogil
 
 cdef extern from "_gaussian.h":
-    void _p_obs(const double* o, const double* mus, const double* sigmas, const int N, const int T, double* p)
+    void _p_obs(const double* o, const double* mus, const double* sigmas, const int N, const int T, double* p) nogil
+
+cdef extern from "_gaussian.h":
+    void _p_obs32(const float* o, const float* mus, const float* sigmas, const int N, const int T, float* p) nogil
 
 def cdef_double_vector(n):
     cdef numpy.ndarray[double, ndim=1, mode="c"] out = numpy.zeros( (n), dtype=ctypes.c_double, order='C' )
@@ -37,8 +40,11 @@ def cdef_single_matrix(n1,n2):
 
 
 def p_o_64(o, mus, sigmas, out=None):
+    cdef int N
+    cdef double x
     # number of states
     N = mus.shape[0]
+    x = o
 
     pmus    = <double*> numpy.PyArray_DATA(mus)
     psigmas = <double*> numpy.PyArray_DATA(sigmas)
@@ -48,7 +54,8 @@ def p_o_64(o, mus, sigmas, out=None):
         p = out
     pp = <double*> numpy.PyArray_DATA(p)
 
-    _p_o(o, pmus, psigmas, N, pp)
+    with nogil:
+        _p_o(x, pmus, psigmas, N, pp)
 
     return p
 
@@ -68,6 +75,7 @@ def p_o(o, mus, sigmas, out=None, dtype=numpy.float32):
 
 
 def p_obs_64(obs, mus, sigmas, out=None):
+    cdef int N, T
     N = mus.shape[0]
     T = obs.shape[0]
     pobs    = <double*> numpy.PyArray_DATA(obs)
@@ -79,18 +87,37 @@ def p_obs_64(obs, mus, sigmas, out=None):
         p = out
     pp      = <double*> numpy.PyArray_DATA(p)
 
-    _p_obs(pobs, pmus, psigmas, N, T, pp)
+    # no GIL, so that output probabilities can be computed in several threads
+    with nogil:
+        _p_obs(pobs, pmus, psigmas, N, T, pp)
+
+    return p
+
+
+def p_obs_32(obs, mus, sigmas, out=None):
+    cdef int N, T
+    N = mus.shape[0]
+    T = obs.shape[0]
+    pobs    = <float*> numpy.PyArray_DATA(obs)
+    pmus    = <float*> numpy.PyArray_DATA(mus)
+    psigmas = <float*> numpy.PyArray_DATA(sigmas)
+    if out is None:
+        p = cdef_single_matrix(T,N)
+    else:
+        p = out
+    pp      = <float*> numpy.PyArray_DATA(p)
+
+    with nogil:
+        _p_obs32(pobs, pmus, psigmas, N, T, pp)
 
     return p
 
 
 def p_obs(obs, mus, sigmas, out=None, dtype=numpy.float32):
-    if (obs.dtype != dtype):
-        obs = obs.astype(dtype)
-    if (mus.dtype != dtype):
-        mus = mus.astype(dtype)
-    if (sigmas.dtype != dtype):
-        sigmas = sigmas.astype(dtype)
+    # the kernels read the raw data, so strided views, e.g. of lagged observations, are copied
+    obs = numpy.ascontiguousarray(obs, dtype=dtype)
+    mus = numpy.ascontiguousarray(mus, dtype=dtype)
+    sigmas = numpy.ascontiguousarray(sigmas, dtype=dtype)
     # check types
     assert(obs.dtype == dtype)
     assert(mus.dtype == dtype)
@@ -98,7 +125,7 @@ def p_obs(obs, mus, sigmas, out=None, dtype=numpy.float32):
 
     # pointers to arrays
     if dtype == numpy.float32:
-        raise ValueError
+        return p_obs_32(obs, mus, sigmas, out=out)
     elif dtype == numpy.float64:
         return p_obs_64(obs, mus, sigmas, out=out)
     else:
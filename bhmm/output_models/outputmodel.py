@@ -94,10 +94,106 @@ class OutputModel(object):
         if (out is None):
             return np.log(self.p_obs(obs))
         else:
-            self.p_obs(obs, out=out, dtype=dtype)
-            np.log(out, out=out)
+            self.p_obs(obs, out=out)
+            T = len(obs)
+            np.log(out[:T], out=out[:T])
             return out
 
+    def _get_parameters(self):
+        """
+        Returns the parameters of the output model as a flat vector
+
+        Together with _set_parameters, this allows to extrapolate parameters, e.g. for accelerated EM iterations.
+
+        """
+        raise NotImplementedError('Output model '+self.__class__.__name__+' does not support parameter vectors')
+
+    def _set_parameters(self, parameters):
+        """
+        Sets the parameters of the output model from a flat vector as returned by _get_parameters
+
+        Returns
+        -------
+        valid : bool
+            False if the parameters are not valid, e.g. negative probabilities. The model is then left unchanged.
+
+        """
+        raise NotImplementedError('Output model '+self.__class__.__name__+' does not support parameter vectors')
+
+    def _init_sufficient_statistics(self):
+        """
+        Returns empty sufficient statistics for the maximum-likelihood fit of this output model
+
+        Together with _add_sufficient_statistics and _estimate_output_model_from_statistics, this allows to fit
+        the output model from weighted observations that are processed piece by piece, without holding all
+        weights in memory.
+
+        """
+        raise NotImplementedError('Output model '+self.__class__.__name__+' does not support sufficient statistics')
+
+    def _add_sufficient_statistics(self, statistics, obs, weights):
+        """
+        Adds weighted observations to the sufficient statistics
+
+        Parameters
+        ----------
+        statistics : object
+            sufficient statistics as created by _init_sufficient_statistics. Updated in place.
+        obs : ndarray((T))
+            a piece of observation trajectory of length T
+        weights : ndarray((T,N))
+            weights[t,n] is the weight assignment from obs[t] to state index n
+
+        """
+        raise NotImplementedError('Output model '+self.__class__.__name__+' does not support sufficient statistics')
+
+    def _add_state_statistics(self, statistics, obs, s):
+        """
+        Adds observations with known hidden states to the sufficient statistics
+
+        Equivalent to _add_sufficient_statistics with weights that are 1 for the hidden state of each observation
+        and 0 otherwise, but computed with one histogram per statistic instead of one per state.
+
+        Parameters
+        ----------
+        statistics : object
+            sufficient statistics as created by _init_sufficient_statistics. Updated in place.
+        obs : ndarray((T))
+            a piece of observation trajectory of length T
+        s : ndarray((T), dtype=int)
+            hidden state trajectory of obs
+
+        """
+        raise NotImplementedError('Output model '+self.__class__.__name__+' does not support sufficient statistics')
+
+    def _merge_sufficient_statistics(self, statistics, other, weight=1.0):
+        """
+        Adds sufficient statistics that have been accumulated separately, e.g. by another worker process
+
+        Parameters
+        ----------
+        statistics : object
+            sufficient statistics as created by _init_sufficient_statistics. Updated in place.
+        other : object
+            sufficient statistics of the same output model, to be added to statistics
+        weight : float, optional, default=1.0
+            other is added with this weight, as if all its observation weights were multiplied by it
+
+        """
+        raise NotImplementedError('Output model '+self.__class__.__name__+' does not support sufficient statistics')
+
+    def _estimate_output_model_from_statistics(self, statistics):
+        """
+        Fits the output model given the sufficient statistics of weighted observations
+
+        Parameters
+        ----------
+        statistics : object
+            sufficient statistics as created by _init_sufficient_statistics and _add_sufficient_statistics
+
+        """
+        raise NotImplementedError('Output model '+self.__class__.__name__+' does not support sufficient statistics')
+
     @abstractmethod
     def generate_observation_trajectory(self, s_t, dtype=None):
         """
@@ -27,6 +27,7 @@ class TestBHMM(unittest.TestCase):
         testfile = join(testfile, 'data')
         testfile = join(testfile, '2well_traj_100K.dat')
         obs = np.loadtxt(testfile, dtype=int)
+        cls.obs = obs
 
         # don't print
         bhmm.config.verbose = False
@@ -261,5 +262,184 @@ class TestBHMM(unittest.TestCase):
     # TODO: these tests can be made compact because they are almost the same. can define general functions for testing
     # TODO: samples and stats, only need to implement consistency check individually.
 
+    def test_seed(self):
+        from bhmm.estimators.bayesian_sampling import BayesianHMMSampler
+        observations = [self.obs[i*1000:(i+1)*1000] for i in range(4)]
+        trajectories = []
+        for nthreads in [1, 2, 3]:
+            sampler = BayesianHMMSampler(observations, self.nstates, initial_model=self.hmm_lag10, seed=42,
+                                         nthreads=nthreads)
+            sampler._updateHiddenStateTrajectories()
+            sampler._updateHiddenStateTrajectories()
+            trajectories.append(sampler.model.hidden_state_trajectories)
+        for result in trajectories[1:]:
+            for S, Sref in zip(result, trajectories[0]):
+                assert np.array_equal(S, Sref)
+
+    def test_nonstationary_initial_model(self):
+        from bhmm import HMM
+        from bhmm.estimators.bayesian_sampling import BayesianHMMSampler
+        hmm = HMM(self.hmm_lag10.transition_matrix, self.hmm_lag10.output_model, lag=10, Pi=np.array([0.9, 0.1]),
+                  stationary=False)
+        sampler = BayesianHMMSampler([self.obs[::10]], self.nstates, initial_model=hmm, seed=1)
+        assert np.allclose(sampler._X, sampler._X.T)
+        samples = sampler.sample(3)
+        assert len(samples) == 3
+        # dispersed starting points of further chains
+        chains = sampler.sample_chains(2, 3, nprocesses=1)
+        assert [len(chain) for chain in chains] == [3, 3]
+
+    def test_nonreversible(self):
+        import pyemma.msm.analysis as msmana
+        sampled_hmm = bhmm.bayesian_hmm([self.obs[::10]], self.hmm_lag10, nsample=10, reversible=False)
+        assert not sampled_hmm.sampled_hmms[0].is_reversible
+        for P in sampled_hmm.transition_matrix_samples:
+            assert msmana.is_transition_matrix(P)
+        # similar to the reversible posterior, because the data is reversible
+        assert np.allclose(sampled_hmm.transition_matrix_mean, self.sampled_hmm_lag10.transition_matrix_mean,
+                           atol=0.01)
+
+    def test_chains(self):
+        observations = [self.obs[::10]]
+        results = [bhmm.bayesian_hmm(observations, self.hmm_lag10, nsample=10, nchains=3, nburn=5, seed=7,
+                                     nprocesses=nprocesses) for nprocesses in [1, 2]]
+        sampled_hmm = results[0]
+        assert sampled_hmm.nchains == 3
+        assert sampled_hmm.nsamples == 30
+        # independent of the number of processes
+        assert np.allclose(results[1].transition_matrix_samples, sampled_hmm.transition_matrix_samples)
+        # chains differ
+        P = sampled_hmm.transition_matrix_samples
+        assert not np.allclose(P[:10], P[10:20])
+        rhat = sampled_hmm.potential_scale_reduction
+        ess = sampled_hmm.effective_sample_size
+        assert set(rhat.keys()) == set(['transition_matrix', 'stationary_distribution', 'timescales', 'output_model'])
+        assert rhat['transition_matrix'].shape == (self.nstates, self.nstates)
+        assert ess['output_model'].shape == self.hmm_lag10.output_model._get_parameters().shape
+        for name in rhat:
+            assert np.all(rhat[name] > 0.5)
+            assert np.all(ess[name] > 0)
+
+    def test_sample_hidden_state_trajectories(self):
+        from bhmm.estimators.bayesian_sampling import BayesianHMMSampler
+        from bhmm import HMM, DiscreteOutputModel
+        observations = [self.obs[i*1000:(i+1)*1000] for i in range(2)]
+        # overlapping output distributions, so that the hidden state of each time step is uncertain
+        B = self.hmm_lag10.output_model.output_probabilities
+        B = 0.5 * B + 0.5 * B.mean(axis=0)[None, :]
+        model = HMM(self.hmm_lag10.transition_matrix, DiscreteOutputModel(B), lag=10)
+        sampler = BayesianHMMSampler(observations, self.nstates, initial_model=model, seed=42)
+        sampler._updateHiddenStateTrajectories()
+        T = sampler.model.transition_matrix.copy()
+        paths = sampler.sample_hidden_state_trajectories(20)
+        assert len(paths) == 2
+        assert paths[0].shape == (20, 1000)
+        assert np.array_equal(sampler.model.transition_matrix, T)
+        # the paths differ, but agree with the metastable hidden states most of the time
+        assert not np.array_equal(paths[0][0], paths[0][1])
+        assert np.mean(paths[0] == paths[0][0]) > 0.5
+
+    def test_sampled_gaussian_hmms(self):
+        from bhmm import SampledGaussianHMM, GaussianHMM
+        model = bhmm.testsystems.dalton_model(3)
+        observations = model.generate_synthetic_observation_trajectories(ntrajectories=1, length=1000)[0]
+        samples = bhmm.BHMM(observations, 3, initial_model=model, seed=1).sample(3)
+        sampled_hmm = SampledGaussianHMM(model, samples)
+        for i in range(3):
+            hmm = sampled_hmm.sampled_hmms[i]
+            assert isinstance(hmm, GaussianHMM)
+            assert np.allclose(hmm.means, sampled_hmm.means_samples[i, :, 0])
+            assert np.allclose(hmm.sigmas, sampled_hmm.sigmas_samples[i, :, 0])
+
+    def test_sample_store(self):
+        from bhmm import SampledDiscreteHMM
+        samples = self.sampled_hmm_lag10.sampled_hmms
+        assert len(samples) == self.nsamples
+        # the sampled HMMs are created from the arrays of the store
+        for i in [0, -1]:
+            hmm = samples[i]
+            assert np.allclose(hmm.transition_matrix, self.sampled_hmm_lag10.transition_matrix_samples[i])
+            assert np.allclose(hmm.stationary_distribution, self.sampled_hmm_lag10.stationary_distribution_samples[i])
+            assert np.allclose(hmm.eigenvalues, self.sampled_hmm_lag10.eigenvalues_samples[i])
+            assert np.allclose(hmm.lifetimes, self.sampled_hmm_lag10.lifetimes_samples[i])
+            assert hmm.lag == 10
+        # a list of HMMs gives the same statistics
+        sampled_hmm = SampledDiscreteHMM(self.hmm_lag10, list(samples))
+        assert np.allclose(sampled_hmm.transition_matrix_samples, self.sampled_hmm_lag10.transition_matrix_samples)
+        P = sampled_hmm.output_probabilities_samples
+        assert P.shape == (self.nsamples, self.nstates, self.hmm_lag10.output_model.nsymbols)
+        assert np.allclose(P[3], samples[3].output_model.output_probabilities)
+
+    def test_sample_file(self):
+        import os
+        import pickle
+        import shutil
+        import tempfile
+        from bhmm import SampledDiscreteHMM
+        observations = [self.obs[i*1000:(i+1)*1000] for i in range(2)]
+        tmpdir = tempfile.mkdtemp()
+        sample_file = os.path.join(tmpdir, 'samples')
+        try:
+            np.random.seed(0)
+            sampled_hmm = bhmm.bayesian_hmm(observations, self.hmm_lag10, nsample=5, store_hidden=True, seed=42)
+            np.random.seed(0)
+            sampled_hmm_file = bhmm.bayesian_hmm(observations, self.hmm_lag10, nsample=5, store_hidden=True, seed=42,
+                                                 sample_file=sample_file)
+            # reopen the file
+            sampled_hmm_reopened = SampledDiscreteHMM(self.hmm_lag10, sample_file)
+            for result in [sampled_hmm_file, sampled_hmm_reopened]:
+                assert result.nsamples == 5
+                assert np.allclose(result.transition_matrix_samples, sampled_hmm.transition_matrix_samples)
+                assert np.allclose(result.sampled_hmms.output_model_parameters,
+                                   sampled_hmm.sampled_hmms.output_model_parameters)
+                for i in [0, 4]:
+                    for S, Sref in zip(result.sampled_hmms[i].hidden_state_trajectories,
+                                       sampled_hmm.sampled_hmms[i].hidden_state_trajectories):
+                        assert np.array_equal(S, Sref)
+            # restoring a pickled file store drops samples appended later, e.g. when resuming from a checkpoint
+            samples = sampled_hmm_file.sampled_hmms
+            state = pickle.dumps(samples)
+            samples.append(samples[0])
+            assert len(pickle.loads(state)) == 5
+            assert len(SampledDiscreteHMM(self.hmm_lag10, sample_file).sampled_hmms) == 5
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_checkpoint(self):
+        import os
+        import shutil
+        import tempfile
+        from bhmm.estimators.bayesian_sampling import BayesianHMMSampler
+        observations = [self.obs[i*1000:(i+1)*1000] for i in range(4)]
+        tmpdir = tempfile.mkdtemp()
+        checkpoint = os.path.join(tmpdir, 'bhmm')
+        try:
+            np.random.seed(0)
+            sampler = BayesianHMMSampler(observations, self.nstates, initial_model=self.hmm_lag10, seed=42)
+            samples = sampler.sample(5, nburn=2, nthin=2)
+            # interrupt the run after 7 of 12 updates
+            np.random.seed(0)
+            sampler = BayesianHMMSampler(observations, self.nstates, initial_model=self.hmm_lag10, seed=42)
+            update = sampler._update
+            def interrupted_update():
+                if sampler.nupdates == 7:
+                    raise KeyboardInterrupt()
+                sampler.nupdates += 1
+                update()
+            sampler.nupdates = 0
+            sampler._update = interrupted_update
+            with self.assertRaises(KeyboardInterrupt):
+                sampler.sample(5, nburn=2, nthin=2, checkpoint=checkpoint, checkpoint_interval=3)
+            # resumed run continues with the same random numbers
+            np.random.seed(1)
+            samples_resumed = BayesianHMMSampler.resume(observations, checkpoint)
+            assert len(samples_resumed) == 5
+            for model, model_resumed in zip(samples, samples_resumed):
+                assert np.allclose(model_resumed.transition_matrix, model.transition_matrix)
+                assert np.allclose(model_resumed.output_model.output_probabilities,
+                                   model.output_model.output_probabilities)
+        finally:
+            shutil.rmtree(tmpdir)
+
 if __name__=="__main__":
     unittest.main()
@@ -322,6 +322,300 @@ class TestHidden(unittest.TestCase):
     def test_viterbi_c_mem(self):
         self.run_comp(self.run_viterbi, 'c', None, [self.vpath], self.time_vpath)
 
+    def test_transition_counts_p_blocks(self):
+        from bhmm.hidden import impl_python
+        for i in range(self.nexamples):
+            for block_size in [1, 3, 1000]:
+                C = impl_python.transition_counts(self.alpha[i], self.beta[i], self.A[i], self.pobs[i],
+                                                  dtype=np.float64, block_size=block_size)
+                self.assertTrue(np.allclose(C, self.C[i]))
+
+    def run_batch(self, kernel):
+        # concatenate all examples that share the second example's transition matrix
+        A = self.A[1]
+        pi = self.pi[1]
+        lengths = [1, 100, 2000, self.T[1]]
+        pobs = np.vstack([self.pobs[1][:T] for T in lengths])
+        offsets = hidden.trajectory_offsets(lengths)
+        hidden.set_implementation(kernel)
+        logprobs, gamma, C = hidden.forward_backward_batch(A, pobs, pi, offsets)
+        # compare with single-trajectory reference
+        hidden.set_implementation('python')
+        Cref = np.zeros((A.shape[0],A.shape[0]))
+        for k, T in enumerate(lengths):
+            logprob, alpha = hidden.forward(A, pobs[offsets[k]:offsets[k+1]], pi)
+            beta = hidden.backward(A, pobs[offsets[k]:offsets[k+1]])
+            gammaref = hidden.state_probabilities(alpha, beta)
+            Cref += hidden.transition_counts(alpha, beta, A, pobs[offsets[k]:offsets[k+1]])
+            self.assertTrue(np.allclose(logprobs[k], logprob))
+            self.assertTrue(np.allclose(gamma[offsets[k]:offsets[k+1]], gammaref))
+        self.assertTrue(np.allclose(C, Cref))
+
+    def test_forward_backward_batch_p(self):
+        self.run_batch('python')
+
+    def test_forward_backward_batch_c(self):
+        self.run_batch('c')
+
+    def run_checkpointed(self, kernel):
+        hidden.set_implementation(kernel)
+        for i in range(self.nexamples):
+            T = self.T[i]
+            for segment_length in [None, 1, 7, T]:
+                gamma = np.zeros((T,self.N[i]))
+
+                def p_obs(t0, t1):
+                    return self.pobs[i][t0:t1]
+
+                def store_gamma(t0, t1, g):
+                    gamma[t0:t1] = g
+
+                logprob, state_counts, C = hidden.forward_backward_checkpointed(
+                    self.A[i], self.pi[i], T, p_obs, gamma_callback=store_gamma, segment_length=segment_length)
+                self.assertTrue(np.allclose(logprob, self.logprob[i]))
+                self.assertTrue(np.allclose(gamma, self.gamma[i]))
+                self.assertTrue(np.allclose(state_counts, np.sum(self.gamma[i], axis=0)))
+                self.assertTrue(np.allclose(C, self.C[i]))
+
+    def test_forward_backward_checkpointed_p(self):
+        self.run_checkpointed('python')
+
+    def test_forward_backward_checkpointed_c(self):
+        self.run_checkpointed('c')
+
+    def run_parallel(self, kernel):
+        hidden.set_implementation(kernel)
+        for i in range(self.nexamples):
+            for nsegments in [1, 3, 7, self.T[i]]:
+                logprob, gamma, C = hidden.forward_backward_parallel(self.A[i], self.pobs[i], self.pi[i],
+                                                                     nsegments=nsegments, nthreads=2)
+                self.assertTrue(np.allclose(logprob, self.logprob[i]))
+                self.assertTrue(np.allclose(gamma, self.gamma[i]))
+                self.assertTrue(np.allclose(C, self.C[i]))
+
+    def test_forward_backward_parallel_p(self):
+        self.run_parallel('python')
+
+    def test_forward_backward_parallel_c(self):
+        self.run_parallel('c')
+
+    def test_transfer_matrix(self):
+        from bhmm.hidden import impl_python, impl_c
+        for i in range(self.nexamples):
+            T = min(self.T[i], 100)
+            P = impl_python.transfer_matrix(self.A[i], self.pobs[i][1:T], dtype=np.float64)
+            # forward coefficients after the segment
+            alpha = np.dot(self.alpha[i][0], P)
+            self.assertTrue(np.allclose(alpha / alpha.sum(), self.alpha[i][T-1]))
+            self.assertTrue(np.allclose(impl_c.transfer_matrix(self.A[i], self.pobs[i][1:T], dtype=np.float64), P))
+
+    def run_logspace(self, kernel, shift):
+        # log observation probabilities, shifted by a constant that would underflow in the linear domain
+        hidden.set_implementation(kernel, logspace=True)
+        for i in range(self.nexamples):
+            logpobs = np.log(self.pobs[i]) + shift
+            logprob, alpha = hidden.forward(self.A[i], logpobs, self.pi[i])
+            beta = hidden.backward(self.A[i], logpobs)
+            C = hidden.transition_counts(alpha, beta, self.A[i], logpobs)
+            vpath = hidden.viterbi(self.A[i], logpobs, self.pi[i])
+            offsets = hidden.trajectory_offsets([self.T[i]])
+            logprobs, gamma, C_batch = hidden.forward_backward_batch(self.A[i], logpobs, self.pi[i], offsets)
+            self.assertTrue(np.isfinite(logprob))
+            self.assertTrue(np.allclose(logprob, self.logprob[i] + shift*self.T[i]))
+            self.assertTrue(np.allclose(alpha, self.alpha[i]))
+            self.assertTrue(np.allclose(beta, self.beta[i]))
+            self.assertTrue(np.allclose(C, self.C[i]))
+            self.assertTrue(np.array_equal(vpath, self.vpath[i]))
+            self.assertTrue(np.allclose(logprobs[0], logprob))
+            self.assertTrue(np.allclose(gamma, self.gamma[i]))
+            self.assertTrue(np.allclose(C_batch, self.C[i]))
+        hidden.set_implementation(kernel)
+
+    def test_logspace_p(self):
+        self.run_logspace('python', 0.0)
+        self.run_logspace('python', -1000.0)
+
+    def test_logspace_c(self):
+        self.run_logspace('c', 0.0)
+        self.run_logspace('c', -1000.0)
+
+    def run_gaussian(self, kernel):
+        A = self.A[1]
+        pi = self.pi[1]
+        gom = GaussianOutputModel(3, means=np.array([-1.0, 0.0, 1.0]), sigmas=np.array([0.5, 0.5, 0.5]))
+        # includes outliers whose output probabilities underflow in the linear domain
+        lengths = [1, 100, 2000]
+        obs = np.random.randn(sum(lengths))
+        obs[[10, 500]] = [-100.0, 100.0]
+        offsets = hidden.trajectory_offsets(lengths)
+        # reference with log output probabilities
+        hidden.set_implementation('python', logspace=True)
+        logprobs_ref, gamma_ref, C_ref = hidden.forward_backward_batch(A, gom.log_p_obs(obs), pi, offsets)
+        hidden.set_implementation(kernel)
+        logprobs, gamma, C = hidden.forward_backward_batch_gaussian(A, obs, gom.means, gom.sigmas, pi, offsets)
+        self.assertTrue(np.all(np.isfinite(logprobs)))
+        self.assertTrue(np.allclose(logprobs, logprobs_ref))
+        self.assertTrue(np.allclose(gamma, gamma_ref))
+        self.assertTrue(np.allclose(C, C_ref))
+
+    def test_forward_backward_batch_gaussian_p(self):
+        self.run_gaussian('python')
+
+    def test_forward_backward_batch_gaussian_c(self):
+        self.run_gaussian('c')
+
+    def run_loglikelihood(self, kernel):
+        hidden.set_implementation(kernel)
+        for i in range(self.nexamples):
+            self.assertTrue(np.allclose(hidden.loglikelihood(self.A[i], self.pobs[i], self.pi[i]), self.logprob[i]))
+            self.assertTrue(np.allclose(hidden.loglikelihood(self.A[i], self.pobs[i], self.pi[i], T=5),
+                                        hidden.forward(self.A[i], self.pobs[i], self.pi[i], T=5)[0]))
+        lengths = [1, 100, self.T[1]]
+        pobs = np.vstack([self.pobs[1][:T] for T in lengths])
+        offsets = hidden.trajectory_offsets(lengths)
+        logprobs = hidden.loglikelihood_batch(self.A[1], pobs, self.pi[1], offsets)
+        for k in range(len(lengths)):
+            self.assertTrue(np.allclose(logprobs[k], hidden.forward(self.A[1], pobs[offsets[k]:offsets[k+1]], self.pi[1])[0]))
+        # Gaussian output model
+        obs = np.random.randn(sum(lengths))
+        means, sigmas = np.array([-1.0, 0.0, 1.0]), np.array([0.5, 0.5, 0.5])
+        logprobs = hidden.loglikelihood_batch_gaussian(self.A[1], obs, means, sigmas, self.pi[1], offsets)
+        logprobs_ref = hidden.forward_backward_batch_gaussian(self.A[1], obs, means, sigmas, self.pi[1], offsets)[0]
+        self.assertTrue(np.allclose(logprobs, logprobs_ref))
+
+    def test_loglikelihood_p(self):
+        self.run_loglikelihood('python')
+
+    def test_loglikelihood_c(self):
+        self.run_loglikelihood('c')
+
+    def run_viterbi_segments(self, kernel):
+        hidden.set_implementation(kernel)
+        for i in range(self.nexamples):
+            for segment_length in [1, 3, int(np.sqrt(self.T[i])), self.T[i]]:
+                vpath = hidden.viterbi(self.A[i], self.pobs[i], self.pi[i], segment_length=segment_length)
+                self.assertTrue(np.array_equal(vpath, self.vpath[i]))
+        # Gaussian output model
+        gom = GaussianOutputModel(3, means=np.array([-1.0, 0.0, 1.0]), sigmas=np.array([0.5, 0.5, 0.5]))
+        obs = np.random.randn(1000)
+        obs[500] = 100.0
+        hidden.set_implementation(kernel, logspace=True)
+        vpath_ref = hidden.viterbi(self.A[1], gom.log_p_obs(obs, dtype=np.float64), self.pi[1])
+        hidden.set_implementation(kernel)
+        for segment_length in [None, 7]:
+            vpath = hidden.viterbi_gaussian(self.A[1], obs, gom.means, gom.sigmas, self.pi[1],
+                                            segment_length=segment_length)
+            self.assertTrue(np.array_equal(vpath, vpath_ref))
+
+    def test_viterbi_segments_p(self):
+        self.run_viterbi_segments('python')
+
+    def test_viterbi_segments_c(self):
+        self.run_viterbi_segments('c')
+
+    def test_traceback_dtype(self):
+        from bhmm.hidden import impl_python
+        self.assertEqual(impl_python.traceback_dtype(2), np.uint8)
+        self.assertEqual(impl_python.traceback_dtype(256), np.uint8)
+        self.assertEqual(impl_python.traceback_dtype(257), np.uint16)
+        self.assertEqual(impl_python.traceback_dtype(70000), np.int32)
+
+    def test_sample_path(self):
+        from bhmm.hidden import impl_python, impl_c
+        # both implementations create the same streams
+        self.assertTrue(np.array_equal(impl_python.create_rng_state(42, stream=3), impl_c.create_rng_state(42, stream=3)))
+        self.assertFalse(np.array_equal(impl_c.create_rng_state(42, stream=3), impl_c.create_rng_state(42, stream=4)))
+        for i in range(self.nexamples):
+            T = min(self.T[i], 2000)
+            state_p = impl_python.create_rng_state(7)
+            state_c = impl_c.create_rng_state(7)
+            path_p = impl_python.sample_path(self.alpha[i], self.A[i], self.pobs[i], T=T, rng_state=state_p)
+            path_c = impl_c.sample_path(self.alpha[i], self.A[i], self.pobs[i], T=T, rng_state=state_c, dtype=np.float64)
+            self.assertTrue(np.array_equal(path_p, path_c))
+            # the states have been advanced in the same way
+            self.assertTrue(np.array_equal(state_p, state_c))
+            self.assertFalse(np.array_equal(state_c, impl_c.create_rng_state(7)))
+            # only states with nonzero probability are sampled
+            self.assertTrue(np.all(self.gamma[i][np.arange(T), path_c] > 0))
+
+    def test_sample_paths(self):
+        from bhmm.hidden import impl_python, impl_c
+        for i in range(self.nexamples):
+            T = min(self.T[i], 500)
+            state = impl_c.create_rng_state(7)
+            paths_c = impl_c.sample_paths(self.alpha[i], self.A[i], self.pobs[i], 5, T=T, rng_state=state,
+                                          dtype=np.float64)
+            paths_p = impl_python.sample_paths(self.alpha[i], self.A[i], self.pobs[i], 5, T=T,
+                                               rng_state=impl_python.create_rng_state(7))
+            self.assertEqual(paths_c.shape, (5, T))
+            self.assertTrue(np.array_equal(paths_p, paths_c))
+            # same paths as repeated calls of sample_path
+            state_single = impl_c.create_rng_state(7)
+            for path in paths_c:
+                self.assertTrue(np.array_equal(path, impl_c.sample_path(self.alpha[i], self.A[i], self.pobs[i], T=T,
+                                                                        rng_state=state_single, dtype=np.float64)))
+            self.assertTrue(np.array_equal(state, state_single))
+
+    def test_float32_c(self):
+        from bhmm.hidden import impl_c
+        for i in range(self.nexamples):
+            pobs = self.pobs[i].astype(np.float32)
+            logprob, alpha = impl_c.forward(self.A[i], pobs, self.pi[i], dtype=np.float32)
+            beta = impl_c.backward(self.A[i], pobs, dtype=np.float32)
+            C = impl_c.transition_counts(alpha, beta, self.A[i], pobs, dtype=np.float32)
+            self.assertEqual(alpha.dtype, np.float32)
+            self.assertEqual(C.dtype, np.float32)
+            self.assertTrue(np.allclose(logprob, self.logprob[i], rtol=1e-5))
+            self.assertTrue(np.allclose(alpha, self.alpha[i], rtol=1e-3, atol=1e-6))
+            self.assertTrue(np.allclose(beta, self.beta[i], rtol=1e-3, atol=1e-6))
+            self.assertTrue(np.allclose(C, self.C[i], rtol=1e-4))
+            # single precision in log space
+            logprob_log = impl_c.forward(self.A[i], np.log(pobs), self.pi[i], dtype=np.float32, logspace=True)[0]
+            self.assertTrue(np.allclose(logprob_log, self.logprob[i], rtol=1e-5))
+        # fused Gaussian kernel in single precision
+        obs = np.random.randn(1000)
+        offsets = hidden.trajectory_offsets([len(obs)])
+        means, sigmas = np.array([-1.0, 0.0, 1.0]), np.array([0.5, 0.5, 0.5])
+        logprobs, gamma, C = impl_c.forward_backward_batch_gaussian(self.A[1], obs, means, sigmas, self.pi[1],
+                                                                    offsets, dtype=np.float32)
+        logprobs_ref, gamma_ref, C_ref = impl_c.forward_backward_batch_gaussian(self.A[1], obs, means, sigmas,
+                                                                                self.pi[1], offsets, dtype=np.float64)
+        self.assertEqual(gamma.dtype, np.float32)
+        self.assertTrue(np.allclose(logprobs, logprobs_ref, rtol=1e-5))
+        self.assertTrue(np.allclose(gamma, gamma_ref, rtol=1e-3, atol=1e-6))
+        self.assertTrue(np.allclose(C, C_ref, rtol=1e-4))
+
+    def test_float32_python(self):
+        from bhmm.hidden import impl_python
+        for i in range(self.nexamples):
+            pobs = self.pobs[i].astype(np.float32)
+            logprob, alpha = impl_python.forward(self.A[i], pobs, self.pi[i], dtype=np.float32)
+            beta = impl_python.backward(self.A[i], pobs, dtype=np.float32)
+            C = impl_python.transition_counts(alpha, beta, self.A[i], pobs, dtype=np.float32)
+            self.assertEqual(alpha.dtype, np.float32)
+            self.assertEqual(beta.dtype, np.float32)
+            self.assertEqual(C.dtype, np.float32)
+            self.assertTrue(np.allclose(logprob, self.logprob[i], rtol=1e-5))
+            self.assertTrue(np.allclose(alpha, self.alpha[i], rtol=1e-3, atol=1e-6))
+            self.assertTrue(np.allclose(beta, self.beta[i], rtol=1e-3, atol=1e-6))
+            self.assertTrue(np.allclose(C, self.C[i], rtol=1e-4))
+        # maximum-likelihood estimation with the python kernel in single precision
+        import bhmm
+        from bhmm.estimators.maximum_likelihood import MaximumLikelihoodEstimator
+        kernel, dtype = bhmm.config.kernel, bhmm.config.dtype
+        bhmm.config.kernel, bhmm.config.dtype = 'python', np.float32
+        try:
+            for output_model_type in ['gaussian', 'discrete']:
+                model, obs = bhmm.testsystems.generate_synthetic_observations(
+                    ntrajectories=1, length=1000, output_model_type=output_model_type)[:2]
+                for streaming in [False, True]:
+                    hmm = MaximumLikelihoodEstimator(obs, 3, initial_model=model, type=output_model_type,
+                                                     streaming=streaming).fit()
+                    self.assertTrue(np.all(np.isfinite(hmm.transition_matrix)))
+        finally:
+            bhmm.config.kernel, bhmm.config.dtype = kernel, dtype
+            hidden.set_implementation(kernel, logspace=bhmm.config.logspace)
+
     def test_fbtime_p_mem(self):
         for i in range(self.nexamples):
             ttot = 0.0
@@ -56,6 +56,24 @@ class TestHMM(unittest.TestCase):
         assert(np.allclose(model.output_model.means, np.array(means)))
         assert(np.allclose(model.output_model.sigmas, np.array(sigmas)))
 
+    def test_count_matrix(self):
+        model = testsystems.dalton_model(nstates=3)
+        model.hidden_state_trajectories = [model.generate_synthetic_state_trajectory(1000) for i in range(3)] \
+                                          + [np.array([1], dtype=np.int32)]
+        C = np.zeros((3, 3))
+        for S in model.hidden_state_trajectories:
+            for t in range(len(S)-1):
+                C[S[t], S[t+1]] += 1
+        assert np.array_equal(model.count_matrix(), C)
+        assert model.count_matrix(dtype=np.int32).dtype == np.int32
+
+    def test_collect_observations_in_state(self):
+        model = testsystems.dalton_model(nstates=3)
+        model.hidden_state_trajectories = [np.array([0, 1, 1, 2]), np.array([2, 1])]
+        observations = [np.array([0.0, 1.0, 2.0, 3.0]), np.array([4.0, 5.0])]
+        assert np.array_equal(model.collect_observations_in_state(observations, 1), [1.0, 2.0, 5.0])
+        assert np.array_equal(model.collect_observations_in_state(observations, 2), [3.0, 4.0])
+
 
 if __name__=="__main__":
     unittest.main()
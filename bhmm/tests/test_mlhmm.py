@@ -28,6 +28,7 @@ class TestMLHMM(unittest.TestCase):
         testfile = join(testfile, 'data')
         testfile = join(testfile, '2well_traj_100K.dat')
         obs = np.loadtxt(testfile, dtype=int)
+        cls.obs = obs
 
         # don't print
         bhmm.config.verbose = False
@@ -120,5 +121,176 @@ class TestMLHMM(unittest.TestCase):
         # this data: lifetimes about 680
         assert np.abs(self.hmm_lag10.timescales[0] - 340) < 20.0
 
+    def test_checkpointed(self):
+        hmm = bhmm.estimate_hmm([self.obs], 2, lag=10, type='discrete', checkpointed=True)
+        assert np.allclose(hmm.transition_matrix, self.hmm_lag10.transition_matrix)
+        assert np.allclose(hmm.output_model.output_probabilities, self.hmm_lag10.output_model.output_probabilities)
+        assert np.isclose(hmm.likelihood, self.hmm_lag10.likelihood)
+
+    def test_parallel(self):
+        hmm = bhmm.estimate_hmm([self.obs], 2, lag=10, type='discrete', nthreads=2)
+        assert np.allclose(hmm.transition_matrix, self.hmm_lag10.transition_matrix)
+        assert np.isclose(hmm.likelihood, self.hmm_lag10.likelihood)
+
+    def test_parallel_trajectories(self):
+        # lagged observations are many trajectories of similar length, processed in chunks by the threads
+        hmm = bhmm.estimate_hmm([self.obs, self.obs[:5000]], 2, lag=10, type='discrete')
+        hmm_parallel = bhmm.estimate_hmm([self.obs, self.obs[:5000]], 2, lag=10, type='discrete', nthreads=3)
+        assert np.allclose(hmm_parallel.transition_matrix, hmm.transition_matrix)
+        assert np.isclose(hmm_parallel.likelihood, hmm.likelihood)
+
+    def test_streaming(self):
+        for nthreads in [1, 3]:
+            hmm = bhmm.estimate_hmm([self.obs], 2, lag=10, type='discrete', streaming=True, nthreads=nthreads)
+            assert np.allclose(hmm.transition_matrix, self.hmm_lag10.transition_matrix)
+            assert np.allclose(hmm.output_model.output_probabilities,
+                               self.hmm_lag10.output_model.output_probabilities)
+            assert np.isclose(hmm.likelihood, self.hmm_lag10.likelihood)
+            assert np.array_equal(hmm.hidden_state_trajectories[0], self.hmm_lag10.hidden_state_trajectories[0])
+
+    def test_accelerated(self):
+        from bhmm.estimators.maximum_likelihood import MaximumLikelihoodEstimator
+        est = MaximumLikelihoodEstimator([self.obs], 2, initial_model=self.hmm_lag1, type='discrete', accuracy=1e-6)
+        est_accelerated = MaximumLikelihoodEstimator([self.obs], 2, initial_model=self.hmm_lag1, type='discrete',
+                                                     accuracy=1e-6, accelerated=True)
+        hmm = est.fit()
+        hmm_accelerated = est_accelerated.fit()
+        assert np.allclose(hmm_accelerated.transition_matrix, hmm.transition_matrix, atol=1e-5)
+        assert np.isclose(hmm_accelerated.likelihood, hmm.likelihood)
+        # likelihood never decreases
+        assert np.all(np.diff(est_accelerated.likelihoods) > -1e-6)
+        assert len(est_accelerated.likelihoods) <= len(est.likelihoods)
+
+    def test_checkpoint(self):
+        import os
+        import shutil
+        import tempfile
+        from bhmm.estimators.maximum_likelihood import MaximumLikelihoodEstimator
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for accelerated in [False, True]:
+                checkpoint = os.path.join(tmpdir, 'mlhmm_'+str(accelerated))
+                est = MaximumLikelihoodEstimator([self.obs], 2, initial_model=self.hmm_lag1, type='discrete',
+                                                 accuracy=1e-6, accelerated=accelerated)
+                hmm = est.fit()
+                # interrupted run, then resume with a new estimator
+                est_interrupted = MaximumLikelihoodEstimator([self.obs], 2, initial_model=self.hmm_lag1,
+                                                             type='discrete', accuracy=1e-6, maxit=5,
+                                                             accelerated=accelerated)
+                est_interrupted.fit(checkpoint=checkpoint, checkpoint_interval=2)
+                est_resumed = MaximumLikelihoodEstimator([self.obs], 2, initial_model=self.hmm_lag10,
+                                                         type='discrete', accuracy=1e-6, accelerated=accelerated)
+                hmm_resumed = est_resumed.fit(checkpoint=checkpoint, checkpoint_interval=2, resume=True)
+                assert np.allclose(est_resumed.likelihoods, est.likelihoods)
+                assert np.allclose(hmm_resumed.transition_matrix, hmm.transition_matrix)
+                assert np.isclose(hmm_resumed.likelihood, hmm.likelihood)
+                # other observations
+                with self.assertRaises(ValueError):
+                    MaximumLikelihoodEstimator([self.obs[:1000]], 2, initial_model=self.hmm_lag1,
+                                               type='discrete').fit(checkpoint=checkpoint, resume=True)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_multistart(self):
+        hmm, records = bhmm.estimate_hmm_multistart([self.obs], 2, nstarts=4, lag=10, type='discrete', nthreads=2,
+                                                    seed=0)
+        assert len(records) == 4
+        assert sum([record['best'] for record in records]) == 1
+        # the first start uses the same initial model as estimate_hmm
+        assert records[0]['converged']
+        assert np.isclose(records[0]['likelihoods'][-1], self.hmm_lag10.likelihood)
+        for record in records:
+            assert record['iterations'] == len(record['likelihoods'])
+            assert record['converged'] or record['pruned']
+            if not record['pruned']:
+                assert hmm.likelihood >= record['likelihoods'][-1]
+        assert hmm.lag == 10
+
+    def test_multistart_observations(self):
+        from bhmm.estimators.maximum_likelihood import MaximumLikelihoodEstimator
+        obs = [self.obs[:50000], self.obs[50000:]]
+        est = MaximumLikelihoodEstimator(obs, 2, initial_model=self.hmm_lag1, type='discrete', maxit=5)
+        # the observations are concatenated once for all starts and iterations
+        calls = []
+        chunk_observations = est._chunk_observations
+        def counted_chunk_observations(k0, k1):
+            calls.append((k0, k1))
+            return chunk_observations(k0, k1)
+        est._chunk_observations = counted_chunk_observations
+        est.fit_multistart([self.hmm_lag1, self.hmm_lag10], prune_margin=None)
+        assert calls == [(0, 2)]
+        assert est.hidden_state_probabilities is None
+
+    def test_sweep(self):
+        results = bhmm.estimate_hmm_sweep([self.obs], [2, 3], lag=10, type='discrete', nthreads=2)
+        assert [result['nstates'] for result in results] == [2, 3]
+        assert np.isclose(results[0]['loglikelihood'], self.hmm_lag10.likelihood)
+        nsymbols = self.hmm_lag10.output_model.nsymbols
+        assert results[0]['nparameters'] == 2 + 2 * (nsymbols - 1)
+        for result in results:
+            assert result['hmm'].nstates == result['nstates']
+            assert np.isclose(result['aic'], 2 * result['nparameters'] - 2 * result['loglikelihood'])
+            assert np.isclose(result['bic'], result['nparameters'] * np.log(len(self.obs)) - 2 * result['loglikelihood'])
+            assert result['time'] > 0
+
+    def test_lags(self):
+        hmms = bhmm.estimate_hmm_lags([self.obs], 2, [1, 10], type='discrete')
+        assert [hmm.lag for hmm in hmms] == [1, 10]
+        assert np.allclose(hmms[0].transition_matrix, self.hmm_lag1.transition_matrix)
+        assert np.isclose(hmms[0].likelihood, self.hmm_lag1.likelihood)
+        # warm start converges to a similar model as the heuristic initialization
+        assert np.allclose(hmms[1].transition_matrix, self.hmm_lag10.transition_matrix, atol=1e-3)
+        assert np.allclose(hmms[1].timescales, self.hmm_lag10.timescales, rtol=0.05)
+        assert np.isclose(hmms[1].likelihood, self.hmm_lag10.likelihood, rtol=1e-3)
+
+    def test_processes(self):
+        hmm = bhmm.estimate_hmm([self.obs], 2, lag=10, type='discrete', nprocesses=2)
+        assert np.allclose(hmm.transition_matrix, self.hmm_lag10.transition_matrix)
+        assert np.allclose(hmm.output_model.output_probabilities, self.hmm_lag10.output_model.output_probabilities)
+        assert np.isclose(hmm.likelihood, self.hmm_lag10.likelihood)
+
+    def test_processes_buffers(self):
+        from bhmm.estimators.maximum_likelihood import MaximumLikelihoodEstimator
+        est = MaximumLikelihoodEstimator([self.obs], 2, initial_model=self.hmm_lag1, type='discrete')
+        hmm = est.fit()
+        assert len(est.hidden_state_probabilities) == 1
+        # the parent process of fit_parallel holds no state probabilities
+        hmm_processes = est.fit_parallel(nprocesses=2)
+        assert est.hidden_state_probabilities is None
+        assert np.allclose(hmm_processes.transition_matrix, hmm.transition_matrix)
+        assert np.array_equal(hmm_processes.hidden_state_trajectories[0], hmm.hidden_state_trajectories[0])
+        # a later fit in this process allocates them again
+        est.fit()
+        assert np.allclose(est.hidden_state_probabilities[0].sum(axis=1), 1.0)
+
+    def test_lagged_views(self):
+        from bhmm.api import _lag_observations
+        from bhmm.estimators.maximum_likelihood import MaximumLikelihoodEstimator
+        model, obs = bhmm.testsystems.generate_synthetic_observations(ntrajectories=1, length=3000)[:2]
+        model.output_model.set_implementation('c')
+        lagged = _lag_observations(obs, 3)
+        # the checkpointed estimator works on the strided views, without copying them
+        est_views = MaximumLikelihoodEstimator(lagged, 3, initial_model=model, type='gaussian', checkpointed=True,
+                                               copy_observations=False, maxit=5)
+        est = MaximumLikelihoodEstimator(lagged, 3, initial_model=model, type='gaussian', checkpointed=True, maxit=5)
+        hmm_views = est_views.fit()
+        hmm = est.fit()
+        assert np.allclose(est_views.likelihoods, est.likelihoods)
+        assert np.allclose(hmm_views.output_model.means, hmm.output_model.means)
+
+    def test_log_likelihood(self):
+        from bhmm import hidden
+        hmm = self.hmm_lag1
+        # reference from the python kernel, restoring the configured implementation for the other tests
+        hidden.set_implementation('python')
+        try:
+            logprob = hidden.forward(hmm.transition_matrix, hmm.output_model.p_obs(self.obs),
+                                     hmm.initial_distribution)[0]
+        finally:
+            hidden.set_implementation(bhmm.config.kernel, logspace=bhmm.config.logspace)
+        assert np.isclose(hmm.log_likelihood([self.obs]), logprob)
+        assert np.isclose(hmm.log_likelihood([self.obs, self.obs[:100]]),
+                          hmm.log_likelihood([self.obs]) + hmm.log_likelihood([self.obs[:100]]))
+
 if __name__=="__main__":
     unittest.main()
@@ -0,0 +1,54 @@
+__author__ = 'noe'
+
+import unittest
+import numpy as np
+import bhmm
+from bhmm.estimators.online_maximum_likelihood import OnlineMaximumLikelihoodEstimator
+
+
+class TestOnlineMLHMM(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        bhmm.config.verbose = False
+        [cls.model, cls.obs, _] = bhmm.testsystems.generate_synthetic_observations(ntrajectories=20, length=5000,
+                                                                                    output_model_type='gaussian')
+        cls.batches = [cls.obs[i:i+2] for i in range(0, 20, 2)]
+
+    def test_partial_fit(self):
+        estimator = OnlineMaximumLikelihoodEstimator(self.model.nstates, initial_model=self.model)
+        for batch in self.batches:
+            hmm = estimator.partial_fit(batch)
+        assert estimator.nbatches == len(self.batches)
+        assert len(estimator.likelihoods) == len(self.batches)
+        assert np.isclose(estimator.stepsize, (len(self.batches) + 1.0) ** (-0.6))
+        assert np.allclose(hmm.transition_matrix, self.model.transition_matrix, atol=0.02)
+        assert np.allclose(hmm.output_model.means, self.model.output_model.means, atol=0.05)
+
+    def test_cumulative_average(self):
+        # with decay 1, the running statistics are the average over all batches, which gives nearly the full EM fit
+        hmm_full = bhmm.estimate_hmm(self.obs, self.model.nstates, initial_model=self.model, type='gaussian')
+        estimator = OnlineMaximumLikelihoodEstimator(self.model.nstates, initial_model=self.model, decay=1.0)
+        hmm = estimator.fit(iter(self.batches))
+        assert np.allclose(hmm.transition_matrix, hmm_full.transition_matrix, atol=1e-3)
+        assert np.allclose(hmm.output_model.means, hmm_full.output_model.means, atol=1e-3)
+        assert np.allclose(hmm.output_model.sigmas, hmm_full.output_model.sigmas, atol=1e-3)
+
+    def test_nonstationary(self):
+        # all trajectories start in the first state, which is recovered from the running initial state probabilities
+        import copy
+        from bhmm import HMM
+        model = HMM(self.model.transition_matrix, copy.deepcopy(self.model.output_model),
+                    Pi=np.ones(self.model.nstates) / self.model.nstates, stationary=False)
+        obs = model.generate_synthetic_observation_trajectories(20, 1000, initial_Pi=np.array([1.0, 0.0, 0.0]))[0]
+        estimator = OnlineMaximumLikelihoodEstimator(model.nstates, initial_model=model)
+        hmm = estimator.fit([obs[i:i+2] for i in range(0, 20, 2)])
+        assert not hmm.is_stationary
+        assert hmm.initial_distribution[0] > 0.9
+
+    def test_decay(self):
+        with self.assertRaises(ValueError):
+            OnlineMaximumLikelihoodEstimator(self.model.nstates, decay=0.5)
+
+if __name__=="__main__":
+    unittest.main()
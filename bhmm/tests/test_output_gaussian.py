@@ -45,6 +45,28 @@ class TestOutputGaussian(unittest.TestCase):
         if print_speedup:
             print('p_obs speedup c/python = '+str(t_p/t_c))
 
+    def test_p_obs_strided(self):
+        # strided views, e.g. lagged observations, are read element by element
+        self.G.set_implementation('c')
+        view = self.obs[1:][::3]
+        assert np.allclose(self.G.p_obs(view), self.G.p_obs(np.ascontiguousarray(view)))
+
+    def test_state_statistics(self):
+        s = np.random.randint(0, 3, size=len(self.obs))
+        # same statistics as with weights that assign each observation to its hidden state
+        statistics = self.G._init_sufficient_statistics()
+        self.G._add_state_statistics(statistics, self.obs, s)
+        reference = self.G._init_sufficient_statistics()
+        self.G._add_sufficient_statistics(reference, self.obs, np.eye(3)[s])
+        for key in ['w', 'wo', 'woo']:
+            assert np.allclose(statistics[key], reference[key])
+        # the sampled parameters are close to the maximum likelihood estimate
+        np.random.seed(0)
+        self.G._sample_output_mode(statistics)
+        for state in range(3):
+            assert abs(self.G.means[state] - self.obs[s == state].mean()) < 0.1
+            assert abs(self.G.sigmas[state] - self.obs[s == state].std()) < 0.1
+
 
 
 if __name__=="__main__":
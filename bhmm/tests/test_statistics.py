@@ -0,0 +1,45 @@
+__author__ = 'noe'
+
+import unittest
+import numpy as np
+from bhmm.util.statistics import potential_scale_reduction, effective_sample_size
+
+
+class TestConvergenceDiagnostics(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        np.random.seed(0)
+        # AR(1) chains with integrated autocorrelation time (1 + phi) / (1 - phi) = 19
+        cls.chains = np.zeros((4, 2000))
+        for t in range(1, 2000):
+            cls.chains[:, t] = 0.9 * cls.chains[:, t-1] + np.random.randn(4)
+
+    def test_independent(self):
+        np.random.seed(1)
+        chains = np.random.randn(4, 1000, 2, 3)
+        rhat = potential_scale_reduction(chains)
+        ess = effective_sample_size(chains)
+        assert rhat.shape == (2, 3) and ess.shape == (2, 3)
+        assert np.all(np.abs(rhat - 1.0) < 0.01)
+        assert np.allclose(ess, 4000, rtol=0.15)
+
+    def test_correlated(self):
+        assert potential_scale_reduction(self.chains) < 1.02
+        assert np.abs(effective_sample_size(self.chains) - 8000 / 19.0) < 100
+
+    def test_not_converged(self):
+        chains = self.chains.copy()
+        chains[0] += 5.0
+        assert potential_scale_reduction(chains) > 1.1
+        # trend within a single chain
+        trend = np.linspace(0, 10, 1000)[None, :] + np.random.randn(1, 1000)
+        assert potential_scale_reduction(trend) > 1.1
+
+    def test_constant(self):
+        chains = np.ones((2, 10, 3))
+        assert np.all(potential_scale_reduction(chains) == 1.0)
+        assert np.all(effective_sample_size(chains) == 20)
+
+if __name__=="__main__":
+    unittest.main()
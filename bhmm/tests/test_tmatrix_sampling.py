@@ -0,0 +1,83 @@
+__author__ = 'noe'
+
+import unittest
+import numpy as np
+import bhmm
+from bhmm import hidden
+from bhmm.msm.transition_matrix_sampling_rev import TransitionMatrixSamplerRev, backend
+from bhmm.msm.tmatrix_disconnected import sample_P
+
+
+class TestTransitionMatrixSampling(unittest.TestCase):
+
+    def setUp(self):
+        self.C = np.array([[787, 54, 27],
+                           [60, 2442, 34],
+                           [22, 39, 6534]], dtype=np.float64)
+        self.kernel = bhmm.config.kernel
+
+    def tearDown(self):
+        bhmm.config.kernel = self.kernel
+
+    def test_backend(self):
+        bhmm.config.kernel = 'c'
+        assert backend() == 'c'
+        bhmm.config.kernel = 'python'
+        assert backend() == 'python'
+
+    def test_mean(self):
+        # with the intrinsic -1 prior, the mean is close to the reversible maximum likelihood estimate
+        import pyemma.msm.estimation as msmest
+        T_mle = msmest.transition_matrix(self.C, reversible=True)
+        for kernel in ['c', 'python']:
+            bhmm.config.kernel = kernel
+            np.random.seed(0)
+            sampler = TransitionMatrixSamplerRev(self.C)
+            Ts = np.array([sampler.sample(1) for i in range(1000)])
+            assert np.allclose(Ts[100:].mean(axis=0), T_mle, atol=0.005)
+            # reversible
+            X = sampler.X
+            assert np.allclose(X, X.T)
+
+    def test_rng_state(self):
+        bhmm.config.kernel = 'c'
+        P1 = TransitionMatrixSamplerRev(self.C, rng_state=hidden.create_rng_state(42)).sample(10)
+        P2 = TransitionMatrixSamplerRev(self.C, rng_state=hidden.create_rng_state(42)).sample(10)
+        assert np.array_equal(P1, P2)
+
+    def test_persistent_state(self):
+        bhmm.config.kernel = 'c'
+        # two disconnected sets
+        C = np.zeros((5, 5))
+        C[:3, :3] = self.C
+        C[3:, 3:] = [[100, 5], [7, 200]]
+        X = np.zeros((5, 5))
+        rng_state = hidden.create_rng_state(0)
+        P = sample_P(C, 10, X=X, rng_state=rng_state)
+        assert np.allclose(P.sum(axis=1), 1.0)
+        assert np.all(P[:3, 3:] == 0) and np.all(P[3:, :3] == 0)
+        # the flux matrix of each set is stored and continued in the next call
+        assert np.isclose(X[:3, :3].sum(), 1.0) and np.isclose(X[3:, 3:].sum(), 1.0)
+        X_continued = X.copy()
+        P_continued = TransitionMatrixSamplerRev(C[:3, :3], X=X_continued[:3, :3],
+                                                 rng_state=rng_state.copy()).sample(10)
+        P = sample_P(C, 10, X=X, rng_state=rng_state)
+        assert np.allclose(P[:3, :3], P_continued)
+
+    def test_nonreversible(self):
+        np.random.seed(0)
+        Ts = np.array([sample_P(self.C, 1, reversible=False) for i in range(2000)])
+        # -1 prior: the mean is the maximum likelihood estimate
+        assert np.allclose(Ts.mean(axis=0), self.C / self.C.sum(axis=1)[:, None], atol=0.002)
+        # disconnected sets and a state without counts
+        C = np.zeros((6, 6))
+        C[:3, :3] = self.C
+        C[3:5, 3:5] = [[100, 5], [7, 200]]
+        C[2, 3] = 10
+        P = sample_P(C, 1, reversible=False)
+        assert np.allclose(P.sum(axis=1), 1.0)
+        assert np.all(P[:3, 3:] == 0) and np.all(P[3:, :3] == 0)
+        assert P[5, 5] == 1.0
+
+if __name__=="__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Checkpoint files of long-running estimations
+
+"""
+
+__author__ = 'noe'
+
+import os
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+def save_checkpoint(filename, state):
+    """
+    Writes the state of an estimation to a checkpoint file
+
+    The state is pickled with the highest protocol, so that numpy arrays are stored in binary form, into a temporary
+    file that then replaces the checkpoint file. If the job is interrupted while writing, the previous checkpoint
+    file is therefore still intact.
+
+    Parameters
+    ----------
+    filename : str
+        name of the checkpoint file
+    state : dict
+        the state of the estimation
+
+    """
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    if os.name == 'nt' and os.path.exists(filename):
+        # rename does not replace existing files on Windows
+        os.remove(filename)
+    os.rename(tmpname, filename)
+
+
+def load_checkpoint(filename, kind):
+    """
+    Reads the state of an estimation from a checkpoint file
+
+    Parameters
+    ----------
+    filename : str
+        name of the checkpoint file
+    kind : str
+        kind of estimation that the checkpoint must have been written by, e.g. 'mlhmm' or 'bhmm'
+
+    Returns
+    -------
+    state : dict
+        the state of the estimation
+
+    """
+    with open(filename, 'rb') as f:
+        state = pickle.load(f)
+    if not isinstance(state, dict) or state.get('kind') != kind:
+        raise ValueError('File '+str(filename)+' is not a checkpoint of a '+kind+' estimation.')
+    return state
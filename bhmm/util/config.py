@@ -14,6 +14,10 @@ kernel = 'c'
 # data type for floating-point operations. Use np.float32 or np.float64
 dtype = np.float64
 
+# use log observation probabilities in the hidden state kernels? This avoids underflow of very small observation
+# probabilities, e.g. for narrow output distributions or in single precision.
+logspace = False
+
 # print a lot of info?
 verbose = False
 
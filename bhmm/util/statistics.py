@@ -149,3 +149,107 @@ def confidence_interval_arr(data, conf=0.95):
         return (lower, upper)
     else:
         raise TypeError('data cannot be converted to an ndarray')
+
+def _split_chains(chains):
+    """
+    Splits each chain into its first and second half, so that the diagnostics also detect trends within chains
+
+    """
+    chains = np.asarray(chains, dtype=np.float64)
+    n = chains.shape[1] // 2
+    if n < 2:
+        raise ValueError('Need at least 4 samples per chain, but got '+str(chains.shape[1]))
+    return np.concatenate([chains[:, :n], chains[:, chains.shape[1]-n:]], axis=0)
+
+def _within_and_total_variance(chains):
+    """
+    Returns the within-chain variance W and the pooled estimate var+ of the posterior variance
+
+    """
+    n = chains.shape[1]
+    W = np.mean(np.var(chains, axis=1, ddof=1), axis=0)
+    B = n * np.var(np.mean(chains, axis=1), axis=0, ddof=1)
+    var_plus = (n - 1.0) / n * W + B / n
+    return W, var_plus
+
+def potential_scale_reduction(chains):
+    r""" Computes the element-wise split-chain potential scale reduction factor R-hat
+
+    R-hat compares the variance between chains to the variance within chains [1]. Each chain is split into halves,
+    so that also a single chain that has not yet stopped drifting is detected. Values close to 1, e.g. below 1.01,
+    indicate that the chains sample the same distribution.
+
+    Parameters
+    ----------
+    chains : ndarray (m, n, (shape))
+        n samples of arrays of the given shape from each of m chains
+
+    Return
+    ------
+    rhat : ndarray(shape)
+        element-wise potential scale reduction. 1 for elements that are constant in all chains.
+
+    References
+    ----------
+    [1] A. Gelman, J. B. Carlin, H. S. Stern, D. B. Dunson, A. Vehtari and D. B. Rubin, "Bayesian data analysis",
+        3rd ed., CRC Press, 2013.
+
+    """
+    W, var_plus = _within_and_total_variance(_split_chains(chains))
+    W = np.atleast_1d(W)
+    var_plus = np.atleast_1d(var_plus)
+    rhat = np.ones(W.shape)
+    positive = W > 0
+    rhat[positive] = np.sqrt(var_plus[positive] / W[positive])
+    rhat[np.logical_and(~positive, var_plus > 0)] = np.inf
+    return rhat.reshape(np.shape(chains)[2:])
+
+def effective_sample_size(chains):
+    r""" Computes the element-wise effective sample size of correlated samples from several chains
+
+    The autocorrelations are estimated from all split chains together [1] and summed up to the first negative sum
+    of two consecutive autocorrelations (Geyer's initial positive sequence).
+
+    Parameters
+    ----------
+    chains : ndarray (m, n, (shape))
+        n samples of arrays of the given shape from each of m chains
+
+    Return
+    ------
+    ess : ndarray(shape)
+        element-wise effective number of independent samples. m*n for elements that are constant in all chains.
+
+    References
+    ----------
+    [1] A. Gelman, J. B. Carlin, H. S. Stern, D. B. Dunson, A. Vehtari and D. B. Rubin, "Bayesian data analysis",
+        3rd ed., CRC Press, 2013.
+
+    """
+    shape = np.shape(chains)[2:]
+    split = _split_chains(chains)
+    m, n = split.shape[:2]
+    split = split.reshape((m, n, -1))
+    # autocovariances of each chain, computed with a zero-padded FFT
+    x = split - np.mean(split, axis=1)[:, None, :]
+    nfft = 2 ** int(np.ceil(np.log2(2 * n)))
+    f = np.fft.rfft(x, n=nfft, axis=1)
+    acov = np.fft.irfft(f * np.conjugate(f), n=nfft, axis=1)[:, :n] / n
+    W, var_plus = _within_and_total_variance(split)
+    rho = 1.0 - (W[None, :] - np.mean(acov, axis=0)) / np.where(var_plus > 0, var_plus, 1.0)[None, :]
+    rho[0] = 1.0
+    ess = np.empty(split.shape[2])
+    for k in range(split.shape[2]):
+        if var_plus[k] <= 0:
+            ess[k] = m * n
+            continue
+        # sums of consecutive pairs, truncated at the first negative one and made monotonic
+        npairs = n // 2
+        pairs = rho[0:2*npairs:2, k] + rho[1:2*npairs:2, k]
+        negative = np.where(pairs < 0)[0]
+        if len(negative) > 0:
+            pairs = pairs[:negative[0]]
+        pairs = np.minimum.accumulate(pairs)
+        tau = max(-1.0 + 2.0 * np.sum(pairs), 1.0 / np.log10(m * n))
+        ess[k] = m * n / tau
+    return ess.reshape(shape)
@@ -135,14 +135,20 @@ def find_package_data(data_root, package_root):
 extensions = [Extension('bhmm.hidden.impl_c.hidden',
                         sources = ['./bhmm/hidden/impl_c/hidden.pyx',
                                    './bhmm/hidden/impl_c/_hidden.c'],
+                        depends = ['./bhmm/hidden/impl_c/_hidden.h',
+                                   './bhmm/hidden/impl_c/_hidden_kernels.h'],
                         include_dirs = ['/bhmm/hidden/impl_c/',numpy.get_include()]),
               Extension('bhmm.output_models.impl_c.gaussian',
                         sources = ['./bhmm/output_models/impl_c/gaussian.pyx',
                                    './bhmm/output_models/impl_c/_gaussian.c'],
                         include_dirs = ['/bhmm/output_models/impl_c/',numpy.get_include()]),
               Extension('bhmm.msm.tmatrix_sampling',
-                        sources = ['./bhmm/msm/tmatrix_sampling.pyx'],
-                        include_dirs = [numpy.get_include()])]
+                        sources = ['./bhmm/msm/tmatrix_sampling.pyx',
+                                   './bhmm/msm/_tmatrix_sampling.c',
+                                   './bhmm/hidden/impl_c/_hidden.c'],
+                        depends = ['./bhmm/msm/_tmatrix_sampling.h',
+                                   './bhmm/hidden/impl_c/_hidden.h'],
+                        include_dirs = ['./bhmm/msm/', './bhmm/hidden/impl_c/', numpy.get_include()])]
 
 write_version_py()
 